@@ -0,0 +1,184 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_instances(value):
+    """Список URL экземпляров сервиса: строка через запятую или список"""
+    if isinstance(value, str):
+        value = value.split(',')
+    return [url.strip().rstrip('/') for url in value if url and url.strip()]
+
+
+class Instance:
+    """Экземпляр сервиса и его состояние для балансировки"""
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.ewma = None  # Сглаженная задержка ответа, мс
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0
+        self.healthy = True  # Результат последней активной проверки
+        self.requests = 0
+        self.failures = 0
+
+    def is_available(self, now):
+        return self.healthy and now >= self.ejected_until
+
+    def metrics(self, now):
+        return {
+            'url': self.url,
+            'available': self.is_available(now),
+            'healthy': self.healthy,
+            'ejected_for': round(max(0, self.ejected_until - now), 1),
+            'outstanding': self.outstanding,
+            'ewma_ms': round(self.ewma, 1) if self.ewma is not None else None,
+            'requests': self.requests,
+            'failures': self.failures,
+        }
+
+
+class ServiceBalancer:
+    """Балансировка запросов между экземплярами одного сервиса"""
+
+    def __init__(self, service_name, urls, strategy='least_outstanding'):
+        self.service_name = service_name
+        self.instances = [Instance(url) for url in urls]
+        self.strategy = strategy
+        self._lock = threading.Lock()
+
+    @property
+    def config(self):
+        return settings.UPSTREAM_BALANCER
+
+    def score(self, instance):
+        if self.strategy == 'ewma':
+            # Экземпляр без замеров пробуем первым, чтобы получить его задержку
+            latency = instance.ewma if instance.ewma is not None else 0
+            return latency * (instance.outstanding + 1)
+        return instance.outstanding
+
+    def choose(self, exclude=()):
+        """Выбор экземпляра: из двух случайных доступных берется лучший по стратегии"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [i for i in self.instances if i.is_available(now) and i not in exclude]
+            if not candidates:
+                # Все экземпляры исключены - лучше попробовать, чем отказать всем (panic mode)
+                candidates = [i for i in self.instances if i not in exclude] or self.instances
+            if len(candidates) > 2:
+                candidates = random.sample(candidates, 2)
+            instance = min(candidates, key=self.score)
+            instance.outstanding += 1
+            instance.requests += 1
+            return instance
+
+    def release(self, instance, elapsed, failed=False):
+        """Учет завершения запроса: задержка, пассивная проверка здоровья"""
+        alpha = self.config.get('EWMA_ALPHA', 0.3)
+        with self._lock:
+            instance.outstanding = max(0, instance.outstanding - 1)
+            elapsed_ms = elapsed * 1000
+            instance.ewma = elapsed_ms if instance.ewma is None else alpha * elapsed_ms + (1 - alpha) * instance.ewma
+
+            if not failed:
+                instance.consecutive_failures = 0
+                instance.ejections = 0
+                return
+
+            instance.failures += 1
+            instance.consecutive_failures += 1
+            if instance.consecutive_failures >= self.config.get('MAX_FAILURES', 3):
+                # Повторные исключения удлиняются, но не дольше MAX_EJECT_TIME
+                instance.ejections += 1
+                eject_time = min(self.config.get('EJECT_TIME', 10) * instance.ejections,
+                                 self.config.get('MAX_EJECT_TIME', 120))
+                instance.ejected_until = time.monotonic() + eject_time
+                instance.consecutive_failures = 0
+                logger.warning(f"Ejected {self.service_name} instance {instance.url} for {eject_time}s")
+
+    def set_health(self, instance, healthy):
+        with self._lock:
+            if instance.healthy != healthy:
+                state = 'healthy' if healthy else 'unhealthy'
+                logger.warning(f"{self.service_name} instance {instance.url} is {state}")
+            instance.healthy = healthy
+
+    def metrics(self):
+        now = time.monotonic()
+        with self._lock:
+            return [instance.metrics(now) for instance in self.instances]
+
+
+class LoadBalancer:
+    """Реестр балансировщиков по сервисам и активная проверка здоровья экземпляров"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._balancers = {}
+        self._checker = None
+
+    @property
+    def config(self):
+        return settings.UPSTREAM_BALANCER
+
+    def get(self, service_name):
+        """Балансировщик сервиса или None, если сервис не настроен"""
+        self.start_health_checks()
+        urls = parse_instances(settings.MICROSERVICES.get(service_name) or [])
+        if not urls:
+            return None
+
+        balancer = self._balancers.get(service_name)
+        if balancer is not None and [i.url for i in balancer.instances] == urls:
+            return balancer
+
+        with self._lock:
+            balancer = self._balancers.get(service_name)
+            if balancer is None or [i.url for i in balancer.instances] != urls:
+                balancer = ServiceBalancer(service_name, urls, self.config.get('STRATEGY', 'least_outstanding'))
+                self._balancers[service_name] = balancer
+            return balancer
+
+    def start_health_checks(self):
+        """Запуск активной проверки здоровья (один поток на процесс)"""
+        if self._checker is not None or not self.config.get('HEALTH_CHECK_INTERVAL'):
+            return
+        with self._lock:
+            if self._checker is None:
+                self._checker = threading.Thread(target=self._check_loop, name='gateway-health-checks', daemon=True)
+                self._checker.start()
+
+    def _check_loop(self):
+        while True:
+            time.sleep(self.config['HEALTH_CHECK_INTERVAL'])
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"Health check failed: {e}")
+
+    def check_health(self):
+        """Активная проверка: GET /health/ каждого экземпляра"""
+        for balancer in list(self._balancers.values()):
+            for instance in balancer.instances:
+                try:
+                    response = requests.get(f"{instance.url}{self.config.get('HEALTH_CHECK_PATH', '/health/')}",
+                                            timeout=self.config.get('HEALTH_CHECK_TIMEOUT', 2))
+                    healthy = response.status_code == 200
+                except requests.exceptions.RequestException:
+                    healthy = False
+                balancer.set_health(instance, healthy)
+
+    def metrics(self):
+        return {name: balancer.metrics() for name, balancer in list(self._balancers.items())}
+
+
+load_balancer = LoadBalancer()
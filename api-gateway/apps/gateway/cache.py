@@ -0,0 +1,401 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+import redis
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .routing import route_table
+
+logger = logging.getLogger(__name__)
+
+# Канал событий, общий для всех микросервисов
+EVENTS_CHANNEL = 'events'
+PURGE_EVENT = 'gateway.cache.purge'
+# Секунд, в течение которых повтор события сервиса не сбрасывает маршруты еще раз
+EVENT_CLAIM_TTL = 300
+
+# Заголовки ответа, сохраняемые в кэше
+CACHED_HEADERS = ['Content-Type', 'Cache-Control', 'ETag']
+# Некэшируемые ответы (например, 503 с Retry-After) раздаются объединенным запросам целиком
+SNAPSHOT_HEADERS = CACHED_HEADERS + ['Retry-After']
+
+
+class CacheEntry:
+    """Закэшированный ответ микросервиса"""
+
+    def __init__(self, status, content, headers, etag, expires_at):
+        self.status = status
+        self.content = content
+        self.headers = headers
+        self.etag = etag
+        self.expires_at = expires_at
+
+    def is_fresh(self, now=None):
+        return (now or time.time()) < self.expires_at
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'content': self.content,
+            'headers': self.headers,
+            'etag': self.etag,
+            'expires_at': self.expires_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['status'], data['content'], data['headers'], data['etag'], data['expires_at'])
+
+
+def parse_cache_control(value):
+    """Разбор заголовка Cache-Control в словарь директив"""
+    directives = {}
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition('=')
+        directives[name.strip().lower()] = arg.strip().strip('"') or True
+    return directives
+
+
+def etag_matches(if_none_match, etag):
+    """Сравнение ETag с If-None-Match (слабое сравнение, как требует RFC 9110)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    bare = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    Кэш GET ответов публичных маршрутов: локальный LRU процесса перед общим кэшем Redis.
+    Сброс по префиксу маршрута - через счетчик поколений, входящий в ключ.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+        self._generations = {}
+        self._listener = None
+        self._redis = None
+        self._stats = {
+            'hits_local': 0,
+            'hits_shared': 0,
+            'misses': 0,
+            'stores': 0,
+            'not_modified': 0,
+            'purges': 0,
+        }
+
+    @property
+    def config(self):
+        return settings.GATEWAY_CACHE
+
+    @property
+    def enabled(self):
+        return self.config.get('ENABLED', False)
+
+    @property
+    def shared(self):
+        return caches[self.config.get('ALIAS', 'default')]
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.config['EVENTS_REDIS_URL'], decode_responses=True)
+        return self._redis
+
+    def get_route(self, path):
+        """Префикс кэшируемого маршрута и TTL по умолчанию для пути"""
+        route = route_table.resolve(path)
+        if route is None or not route.cache:
+            return None
+        return route.prefix, route.cache
+
+    def is_cacheable_request(self, request):
+        if not self.enabled or request.method != 'GET':
+            return False
+        return self.get_route(request.path) is not None
+
+    def get_generation(self, prefix, shared=True):
+        """Текущее поколение маршрута; без shared возвращает только известное процессу"""
+        generation = self._generations.get(prefix)
+        if generation is not None or not shared:
+            return generation
+
+        key = f"gateway_cache:generation:{prefix}"
+        try:
+            self.shared.add(key, 0, None)
+            generation = self.shared.get(key, 0)
+        except Exception as e:
+            logger.warning(f"Response cache generation for {prefix} unavailable: {e}")
+            return None
+
+        self._generations[prefix] = generation
+        return generation
+
+    def make_key(self, request, prefix, generation):
+        """Ключ кэша: путь, отсортированные параметры запроса и Accept"""
+        query = urlencode(sorted(request.GET.lists()), doseq=True)
+        accept = request.headers.get('Accept', '')
+        digest = hashlib.sha256(f"{request.path}?{query}|{accept}".encode()).hexdigest()
+        return f"gateway_cache:{prefix}:{generation}:{digest}"
+
+    def lookup(self, request, shared=True):
+        """
+        Поиск ответа для запроса. Возвращает (ключ, запись); ключ None, если поколение
+        маршрута неизвестно (при shared=False) или общий кэш недоступен.
+        """
+        self.start_listener()
+
+        prefix, _ = self.get_route(request.path)
+        generation = self.get_generation(prefix, shared=shared)
+        if generation is None:
+            return None, None
+
+        key = self.make_key(request, prefix, generation)
+        entry = self._get_local(key)
+        if entry is not None:
+            self._stats['hits_local'] += 1
+            return key, entry
+        if not shared:
+            return key, None
+
+        entry = self._get_shared(key)
+        if entry is not None:
+            self._stats['hits_shared'] += 1
+            self._set_local(key, entry)
+            return key, entry
+
+        self._stats['misses'] += 1
+        return key, None
+
+    def get(self, key):
+        """Запись по готовому ключу: локальный уровень, затем общий"""
+        entry = self._get_local(key)
+        if entry is None:
+            entry = self._get_shared(key)
+            if entry is not None:
+                self._set_local(key, entry)
+        return entry
+
+    def _get_local(self, key):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            entry, local_expires_at = item
+            now = time.time()
+            if now >= local_expires_at or not entry.is_fresh(now):
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _set_local(self, key, entry):
+        # Локальная копия живет не дольше LOCAL_TTL: ограничивает расхождение, если событие сброса потеряно
+        local_expires_at = min(entry.expires_at, time.time() + self.config.get('LOCAL_TTL', 5))
+        with self._lock:
+            self._local[key] = (entry, local_expires_at)
+            self._local.move_to_end(key)
+            while len(self._local) > self.config.get('LOCAL_MAX_ENTRIES', 1000):
+                self._local.popitem(last=False)
+
+    def _get_shared(self, key):
+        try:
+            data = self.shared.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+        if data is None:
+            return None
+        entry = CacheEntry.from_dict(data)
+        return entry if entry.is_fresh() else None
+
+    def get_ttl(self, response, default_ttl):
+        """TTL ответа с учетом Cache-Control микросервиса; None - ответ не кэшируется"""
+        if response.status_code != 200 or response.streaming:
+            return None
+        if response.get('Vary', '').strip() == '*':
+            return None
+
+        directives = parse_cache_control(response.get('Cache-Control'))
+        if directives.keys() & {'no-store', 'private', 'no-cache'}:
+            return None
+
+        for name in ('s-maxage', 'max-age'):
+            if name in directives:
+                try:
+                    return int(directives[name]) or None
+                except (TypeError, ValueError):
+                    return None
+        return default_ttl
+
+    def store(self, key, request, response):
+        """Сохранение ответа в оба уровня кэша; возвращает запись или None"""
+        _, default_ttl = self.get_route(request.path)
+        ttl = self.get_ttl(response, default_ttl)
+        if not ttl or len(response.content) > self.config.get('MAX_BODY_SIZE', 1024 * 1024):
+            return None
+
+        etag = response.get('ETag') or f'"{hashlib.sha256(response.content).hexdigest()[:32]}"'
+        headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+        headers['ETag'] = etag
+        entry = CacheEntry(response.status_code, response.content, headers, etag, time.time() + ttl)
+
+        self._set_local(key, entry)
+        try:
+            self.shared.set(key, entry.to_dict(), ttl)
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
+        self._stats['stores'] += 1
+        return entry
+
+    def snapshot(self, response):
+        """Некэшируемый ответ в виде записи (expires_at=0), чтобы раздать его объединенным запросам"""
+        headers = {name: response[name] for name in SNAPSHOT_HEADERS if response.has_header(name)}
+        return CacheEntry(response.status_code, response.content, headers, response.get('ETag'), 0)
+
+    def build_response(self, request, entry, status):
+        """Ответ из записи кэша; при совпадении If-None-Match - 304 без тела"""
+        if etag_matches(request.headers.get('If-None-Match'), entry.etag):
+            self._stats['not_modified'] += 1
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(entry.content, status=entry.status)
+        for name, value in entry.headers.items():
+            response[name] = value
+        if response.status_code == 304:
+            del response['Content-Type']
+        response['X-Cache'] = status
+        return response
+
+    def purge(self, prefixes):
+        """
+        Сброс маршрутов: новое поколение в общем кэше. Увеличивает поколение только процесс,
+        от которого исходит изменение; остальные получают PURGE_EVENT и вызывают forget()
+        """
+        for prefix in prefixes:
+            route = route_table.get_route(prefix)
+            if route is None or not route.cache:
+                continue
+            key = f"gateway_cache:generation:{prefix}"
+            try:
+                self.shared.add(key, 0, None)
+                self._generations[prefix] = self.shared.incr(key)
+            except Exception as e:
+                logger.warning(f"Response cache purge of {prefix} failed: {e}")
+                self._generations.pop(prefix, None)
+            self.drop_local(prefix)
+            self._stats['purges'] += 1
+            logger.info(f"Response cache purged: {prefix}")
+
+    def forget(self, prefixes):
+        """Поколение увеличено другим процессом: сброс локального уровня, поколение перечитывается из общего кэша"""
+        for prefix in prefixes:
+            self._generations.pop(prefix, None)
+            self.drop_local(prefix)
+
+    def drop_local(self, prefix):
+        with self._lock:
+            for key in [key for key in self._local if key.startswith(f"gateway_cache:{prefix}:")]:
+                del self._local[key]
+
+    def purge_for_write(self, request, response):
+        """Сброс маршрута после успешного изменения через шлюз; остальные процессы узнают о нем из события"""
+        if not self.enabled or request.method in ('GET', 'HEAD', 'OPTIONS') or response.status_code >= 400:
+            return
+        route = self.get_route(request.path)
+        if route is None:
+            return
+        self.purge([route[0]])
+        self.publish_purge([route[0]])
+
+    def publish_purge(self, prefixes):
+        try:
+            self.redis.publish(EVENTS_CHANNEL, json.dumps({
+                'type': PURGE_EVENT,
+                'data': {'prefixes': list(prefixes)},
+                'timestamp': time.time(),
+            }))
+        except redis.RedisError as e:
+            logger.warning(f"Failed to publish {PURGE_EVENT}: {e}")
+
+    def claim_event(self, event_data):
+        """Событие сервиса получают все процессы шлюза; сбрасывает маршруты только первый из них"""
+        digest = hashlib.sha256(json.dumps(event_data, sort_keys=True, default=str).encode()).hexdigest()
+        try:
+            return self.shared.add(f"gateway_cache:event:{digest}", 1, EVENT_CLAIM_TTL)
+        except Exception as e:
+            # Без общего кэша поколения не согласовать - сбрасываем сами
+            logger.warning(f"Response cache event claim failed: {e}")
+            return True
+
+    def handle_event(self, event_data):
+        """Сброс маршрутов по событию микросервиса"""
+        event_type = event_data.get('type')
+        if event_type == PURGE_EVENT:
+            self.forget(event_data.get('data', {}).get('prefixes', []))
+            return
+        prefixes = self.config.get('PURGE_EVENTS', {}).get(event_type, [])
+        if prefixes and self.claim_event(event_data):
+            self.purge(prefixes)
+            self.publish_purge(prefixes)
+
+    def start_listener(self):
+        """Запуск слушателя событий (один поток на процесс)"""
+        if self._listener is not None or not self.config.get('LISTEN_EVENTS', True):
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='gateway-cache-events', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                pubsub.subscribe(EVENTS_CHANNEL)
+                logger.info("Gateway response cache event listener started")
+
+                for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        # События, пропущенные без подписки, неизвестны: локальный уровень сбрасываем целиком
+                        self.clear_local()
+                    elif message['type'] == 'message':
+                        try:
+                            self.handle_event(json.loads(message['data']))
+                        except Exception as e:
+                            logger.error(f"Error processing event: {e}")
+            except Exception as e:
+                logger.error(f"Redis connection error in cache event listener: {e}")
+            time.sleep(1)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+            self._generations.clear()
+
+    def metrics(self):
+        data = dict(self._stats)
+        data['local_entries'] = len(self._local)
+        return data
+
+
+response_cache = ResponseCache()
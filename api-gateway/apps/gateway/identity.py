@@ -0,0 +1,76 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+
+import jwt
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Заголовок с подписанными данными пользователя для сервисов за шлюзом
+IDENTITY_HEADER = 'X-Identity'
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def sign_identity(claims, key):
+    """Значение заголовка: base64(JSON данных пользователя).base64(HMAC-SHA256)"""
+    payload = b64encode(json.dumps({
+        'user_id': int(claims['user_id']),
+        'email': claims.get('email', ''),
+        'exp': int(claims['exp']),
+        'jti': claims.get('jti'),
+    }, separators=(',', ':')).encode())
+    signature = b64encode(hmac.new(key.encode(), payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{signature}"
+
+
+class GatewayAuthenticator:
+    """Проверка access токена на шлюзе: один раз на запрос вместо каждого сервиса"""
+
+    @property
+    def config(self):
+        return settings.GATEWAY_AUTH
+
+    def decode(self, token):
+        """Claims access токена user-service или None, если токен недействителен"""
+        for key in self.config['JWT_VERIFYING_KEYS']:
+            try:
+                claims = jwt.decode(
+                    token,
+                    key,
+                    algorithms=[self.config.get('JWT_ALGORITHM', 'HS256')],
+                    leeway=self.config.get('JWT_LEEWAY', 0),
+                    options={'require': ['exp', 'user_id']},
+                )
+            except jwt.InvalidSignatureError:
+                continue
+            except jwt.InvalidTokenError as e:
+                logger.info(f"Rejected token at gateway: {e}")
+                return None
+            return claims if claims.get('token_type') == 'access' else None
+        return None
+
+    def authenticate(self, request):
+        """Claims токена из Authorization (результат запоминается на запросе)"""
+        if not hasattr(request, '_gateway_claims'):
+            claims = None
+            auth_header = request.headers.get('Authorization', '')
+            if self.config.get('ENABLED', True) and auth_header.startswith('Bearer '):
+                claims = self.decode(auth_header[7:])
+            request._gateway_claims = claims
+        return request._gateway_claims
+
+    def get_identity_header(self, request):
+        """Подписанный заголовок идентичности или None для анонимного запроса"""
+        claims = self.authenticate(request)
+        if claims is None:
+            return None
+        return sign_identity(claims, self.config['IDENTITY_KEY'])
+
+
+gateway_authenticator = GatewayAuthenticator()
@@ -1,51 +1,66 @@
-import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import JsonResponse
-from django.core.cache import cache
-from django.conf import settings
+
+from .ratelimit import rate_limiter, get_client_ip
 
 class RateLimitMiddleware:
     """Middleware для ограничения частоты запросов"""
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        # В режиме ASGI middleware работает асинхронно, чтобы не занимать поток на запрос
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
         # Пропускаем статические файлы и админку
-        if request.path.startswith('/static/') or request.path.startswith('/admin/'):
+        if self.is_exempt(request):
             return self.get_response(request)
 
-        # Получаем IP адрес клиента
-        client_ip = self.get_client_ip(request)
+        result = rate_limiter.check(request)
+        if not result.allowed:
+            return self.add_limit_headers(self.limit_exceeded(result), result)
 
-        # Создаем ключ для кэша
-        cache_key = f"rate_limit:{client_ip}"
+        response = self.get_response(request)
+        return self.add_limit_headers(response, result)
 
-        # Получаем текущее количество запросов
-        current_requests = cache.get(cache_key, 0)
+    async def __acall__(self, request):
+        if self.is_exempt(request):
+            return await self.get_response(request)
 
-        # Проверяем лимит
-        if current_requests >= settings.RATE_LIMIT_REQUESTS_PER_MINUTE:
-            return JsonResponse({
-                'error': 'Rate limit exceeded',
-                'message': f'Maximum {settings.RATE_LIMIT_REQUESTS_PER_MINUTE} requests per minute'
-            }, status=429)
+        result = await sync_to_async(rate_limiter.check, thread_sensitive=False)(request)
+        if not result.allowed:
+            return self.add_limit_headers(self.limit_exceeded(result), result)
 
-        # Увеличиваем счетчик
-        cache.set(cache_key, current_requests + 1, 60)  # 60 секунд
+        response = await self.get_response(request)
+        return self.add_limit_headers(response, result)
 
-        response = self.get_response(request)
+    def is_exempt(self, request):
+        return request.path.startswith('/static/') or request.path.startswith('/admin/')
+
+    def limit_exceeded(self, result):
+        response = JsonResponse({
+            'error': 'Rate limit exceeded',
+            'message': f'Maximum {result.limit} requests per window'
+        }, status=429)
+        response['Retry-After'] = str(max(1, result.retry_after))
+        return response
 
-        # Добавляем заголовки с информацией о лимитах
-        response['X-RateLimit-Limit'] = str(settings.RATE_LIMIT_REQUESTS_PER_MINUTE)
-        response['X-RateLimit-Remaining'] = str(max(0, settings.RATE_LIMIT_REQUESTS_PER_MINUTE - (current_requests + 1)))
+    def add_limit_headers(self, response, result):
+        """Добавляем заголовки с информацией о лимитах"""
+        response['X-RateLimit-Limit'] = str(result.limit)
+        response['X-RateLimit-Remaining'] = str(result.remaining)
+        response['X-RateLimit-Reset'] = str(result.reset)
 
         return response
 
     def get_client_ip(self, request):
         """Получение IP адреса клиента"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0].strip()
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return get_client_ip(request)
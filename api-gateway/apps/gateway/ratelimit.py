@@ -0,0 +1,413 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Скользящее окно с журналом запросов (sorted set: score = время запроса в мс).
+# KEYS[1] - ключ журнала; ARGV: лимит, окно (мс), уникальный id запроса,
+# стоимость, 1 - разрешить частичную выдачу (аренда пачки разрешений).
+# Возвращает {выдано разрешений, остаток, мс до освобождения слота, мс до повторной попытки}.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local member = ARGV[3]
+local cost = tonumber(ARGV[4])
+local partial = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+
+local granted = 0
+if count + cost <= limit then
+    granted = cost
+elseif partial == 1 and count < limit then
+    granted = limit - count
+end
+for i = 1, granted do
+    redis.call('ZADD', key, now, member .. ':' .. i)
+end
+count = count + granted
+redis.call('PEXPIRE', key, window)
+
+local reset = 0
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+if oldest[2] then
+    reset = tonumber(oldest[2]) + window - now
+end
+
+local retry = 0
+if granted == 0 then
+    retry = reset
+end
+
+return {granted, limit - count, reset, retry}
+"""
+
+# Token bucket: емкость = лимит, полное пополнение за окно.
+# KEYS[1] - ключ ведра; ARGV: емкость, окно (мс), стоимость запроса,
+# 1 - разрешить частичную выдачу (аренда пачки разрешений).
+# Возвращает {выдано разрешений, остаток, мс до полного пополнения, мс до повторной попытки}.
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local partial = tonumber(ARGV[4])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local rate = capacity / window
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local granted = 0
+if tokens >= cost then
+    granted = cost
+elseif partial == 1 and tokens >= 1 then
+    granted = math.floor(tokens)
+end
+tokens = tokens - granted
+
+local retry = 0
+if granted == 0 then
+    retry = math.ceil((1 - tokens) / rate)
+end
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', key, window)
+
+local reset = math.ceil((capacity - tokens) / rate)
+return {granted, math.floor(tokens), reset, retry}
+"""
+
+
+class RateLimitPolicy:
+    """Политика ограничения для группы маршрутов"""
+
+    def __init__(self, name, algorithm, limit, window, key='ip', prefix='/', methods=()):
+        self.name = name
+        self.algorithm = algorithm
+        self.limit = limit
+        self.window = window
+        self.key = key
+        self.prefix = prefix
+        self.methods = tuple(methods)
+
+    def matches(self, request):
+        if not request.path.startswith(self.prefix):
+            return False
+        return not self.methods or request.method in self.methods
+
+
+class RateLimitResult:
+    """Результат проверки лимита"""
+
+    def __init__(self, allowed, limit, remaining, reset, retry_after=0):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset  # секунд до сброса окна
+        self.retry_after = retry_after  # секунд до следующей разрешенной попытки
+
+
+class RateLimiter:
+    """Атомарный ограничитель частоты запросов на Redis (один Lua-скрипт на запрос)"""
+
+    SCRIPTS = {
+        'sliding_window': SLIDING_WINDOW_SCRIPT,
+        'token_bucket': TOKEN_BUCKET_SCRIPT,
+    }
+
+    def __init__(self, redis_client=None):
+        self._redis = redis_client
+        self._scripts = {}
+        self._policies = None
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(settings.RATE_LIMIT_REDIS_URL)
+        return self._redis
+
+    def get_script(self, algorithm):
+        script = self._scripts.get(algorithm)
+        if script is None:
+            script = self.redis.register_script(self.SCRIPTS[algorithm])
+            self._scripts[algorithm] = script
+        return script
+
+    @property
+    def policies(self):
+        if self._policies is None:
+            self._policies = self.load_policies()
+        return self._policies
+
+    def load_policies(self):
+        """Политики из настроек; первая подходящая по префиксу пути применяется к запросу"""
+        policies = []
+        for index, config in enumerate(settings.RATE_LIMIT_POLICIES):
+            policies.append(RateLimitPolicy(
+                name=config.get('name', f"policy{index}"),
+                algorithm=config.get('algorithm', 'sliding_window'),
+                limit=config['limit'],
+                window=config.get('window', 60),
+                key=config.get('key', 'ip'),
+                prefix=config.get('prefix', '/'),
+                methods=config.get('methods', ()),
+            ))
+
+        default = settings.RATE_LIMIT_DEFAULT_POLICY
+        policies.append(RateLimitPolicy(
+            name='default',
+            algorithm=default.get('algorithm', 'sliding_window'),
+            limit=default.get('limit', settings.RATE_LIMIT_REQUESTS_PER_MINUTE),
+            window=default.get('window', 60),
+            key=default.get('key', 'ip'),
+        ))
+
+        for policy in policies:
+            if policy.algorithm not in self.SCRIPTS:
+                raise ValueError(f"Unknown rate limit algorithm: {policy.algorithm}")
+        return policies
+
+    def get_policy(self, request):
+        for policy in self.policies:
+            if policy.matches(request):
+                return policy
+        return self.policies[-1]
+
+    def get_identity(self, request, policy):
+        """Идентификатор клиента: пользователь (по токену) или IP"""
+        if policy.key == 'user':
+            auth_header = request.headers.get('Authorization', '')
+            if auth_header.startswith('Bearer '):
+                token_hash = hashlib.sha256(auth_header[7:].encode()).hexdigest()[:32]
+                return f"user:{token_hash}"
+        return f"ip:{get_client_ip(request)}"
+
+    def get_key(self, request, policy):
+        return f"rate_limit:{policy.name}:{self.get_identity(request, policy)}"
+
+    def acquire(self, key, policy, cost=1, partial=False):
+        """Атомарное получение разрешений в Redis; возвращает (выдано, результат)"""
+        window_ms = policy.window * 1000
+
+        if policy.algorithm == 'sliding_window':
+            args = [policy.limit, window_ms, uuid.uuid4().hex, cost, int(partial)]
+        else:
+            args = [policy.limit, window_ms, cost, int(partial)]
+
+        granted, remaining, reset_ms, retry_ms = self.get_script(policy.algorithm)(keys=[key], args=args)
+        result = RateLimitResult(
+            allowed=int(granted) > 0,
+            limit=policy.limit,
+            remaining=max(0, int(remaining)),
+            reset=math.ceil(int(reset_ms) / 1000),
+            retry_after=math.ceil(int(retry_ms) / 1000),
+        )
+        return int(granted), result
+
+    def check(self, request):
+        """Проверка и учет запроса"""
+        policy = self.get_policy(request)
+        try:
+            granted, result = self.acquire(self.get_key(request, policy), policy)
+        except redis.RedisError as e:
+            # Redis недоступен - пропускаем запрос, чтобы не блокировать шлюз
+            logger.error(f"Rate limiter unavailable, allowing request: {e}")
+            return RateLimitResult(True, policy.limit, policy.limit, policy.window)
+        return result
+
+
+class LocalLease:
+    """Разрешения, арендованные у Redis и расходуемые локально"""
+
+    def __init__(self):
+        self.tokens = 0
+        self.size = 0
+        self.expires_at = 0.0
+        self.denied_until = 0.0
+        self.pending = None  # threading.Event идущего обращения к Redis за новой пачкой
+        self.result = None  # последний ответ Redis
+
+
+class LeasedRateLimiter(RateLimiter):
+    """Двухуровневый ограничитель: локальное ведро арендует пачки разрешений в Redis.
+
+    Большая часть запросов обслуживается без сетевого обращения. Разрешения
+    списываются из общего лимита в Redis атомарно, поэтому реплики вместе не
+    превышают лимит. Неизрасходованные к истечению аренды разрешения сгорают:
+    каждая реплика может недодать клиенту до размера аренды за TTL. Поэтому
+    аренда не больше доли лимита на TTL (limit / window * TTL), а для политик,
+    где эта доля меньше MIN_SIZE разрешений, каждый запрос идет в Redis.
+    За новой пачкой для ключа одновременно обращается только один поток.
+    """
+
+    def __init__(self, redis_client=None):
+        super().__init__(redis_client)
+        self._lock = threading.Lock()
+        self._leases = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='rate-limit-lease')
+
+    @property
+    def lease_settings(self):
+        return settings.RATE_LIMIT_LEASE
+
+    def check(self, request):
+        config = self.lease_settings
+        if not config.get('ENABLED'):
+            return super().check(request)
+
+        policy = self.get_policy(request)
+        if self._max_size(policy) < config.get('MIN_SIZE', 2):
+            # Аренда по 1 разрешению не экономит обращений, а только придерживает лимит
+            return super().check(request)
+        key = self.get_key(request, policy)
+
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                lease = self._get_lease(key)
+                if lease.tokens > 0 and now < lease.expires_at:
+                    lease.tokens -= 1
+                    # Подгружаем следующую пачку заранее, не блокируя запрос
+                    if lease.tokens <= lease.size * config.get('REFILL_THRESHOLD', 0.25) and lease.pending is None:
+                        lease.pending = threading.Event()
+                        self._executor.submit(self._refill, key, policy, lease)
+                    return self._local_result(lease, allowed=True)
+
+                if now < lease.denied_until:
+                    return self._local_result(lease, allowed=False)
+
+                pending = lease.pending
+                if pending is None:
+                    lease.pending = threading.Event()
+                    break
+
+            # Пачку уже запрашивает другой поток - ждем его ответа вместо своего обращения к Redis
+            if not pending.wait(config.get('WAIT_TIMEOUT', 1.0)):
+                return super().check(request)
+
+        # Локальных разрешений нет - синхронно арендуем новую пачку
+        return self._lease(key, policy, lease, now)
+
+    def _get_lease(self, key):
+        lease = self._leases.get(key)
+        if lease is None:
+            lease = LocalLease()
+            self._leases[key] = lease
+            if len(self._leases) > self.lease_settings.get('MAX_ENTRIES', 10000):
+                self._leases.popitem(last=False)
+        else:
+            self._leases.move_to_end(key)
+        return lease
+
+    def _max_size(self, policy):
+        """Аренда не больше доли лимита, приходящейся на время ее жизни"""
+        share = int(policy.limit / policy.window * self.lease_settings.get('TTL', 1.0))
+        return max(1, min(self.lease_settings.get('MAX_SIZE', 20), share))
+
+    def _next_size(self, lease, policy, now):
+        """Размер аренды растет, пока клиент успевает расходовать пачки"""
+        max_size = self._max_size(policy)
+        if lease.size and now < lease.expires_at:
+            return min(max_size, lease.size * 2)
+        return max(1, min(max_size, lease.size // 2 if lease.size else 1))
+
+    def _lease(self, key, policy, lease, now):
+        """Синхронная аренда пачки; вызывается только потоком, выставившим lease.pending"""
+        try:
+            with self._lock:
+                size = self._next_size(lease, policy, now)
+            try:
+                granted, result = self.acquire(key, policy, cost=size, partial=True)
+            except redis.RedisError as e:
+                logger.error(f"Rate limiter unavailable, allowing request: {e}")
+                return RateLimitResult(True, policy.limit, policy.limit, policy.window)
+
+            with self._lock:
+                self._apply_lease(lease, granted, result)
+                lease.size = size
+                if lease.tokens <= 0:
+                    lease.denied_until = time.monotonic() + max(result.retry_after, 1)
+                    return self._local_result(lease, allowed=False)
+                lease.tokens -= 1
+                return self._local_result(lease, allowed=True)
+        finally:
+            self._finish_pending(lease)
+
+    def _refill(self, key, policy, lease):
+        """Фоновая подгрузка следующей пачки разрешений"""
+        try:
+            size = min(lease.size or 1, self._max_size(policy))
+            granted, result = self.acquire(key, policy, cost=size, partial=True)
+            with self._lock:
+                self._apply_lease(lease, granted, result)
+        except redis.RedisError as e:
+            logger.error(f"Failed to refill rate limit lease: {e}")
+        finally:
+            self._finish_pending(lease)
+
+    def _finish_pending(self, lease):
+        """Будим потоки, ждавшие пачку"""
+        with self._lock:
+            pending, lease.pending = lease.pending, None
+        if pending is not None:
+            pending.set()
+
+    def _apply_lease(self, lease, granted, result):
+        """Добавление арендованных разрешений; просроченный остаток сгорает"""
+        now = time.monotonic()
+        if now >= lease.expires_at:
+            lease.tokens = 0
+        if granted:
+            lease.tokens += granted
+            lease.expires_at = now + self.lease_settings.get('TTL', 1.0)
+        lease.result = result
+
+    def _local_result(self, lease, allowed):
+        """Заголовки по последнему ответу Redis с поправкой на локальный расход"""
+        result = lease.result
+        remaining = max(0, result.remaining + lease.tokens) if allowed else 0
+        return RateLimitResult(
+            allowed=allowed,
+            limit=result.limit,
+            remaining=remaining,
+            reset=result.reset,
+            retry_after=0 if allowed else max(1, math.ceil(lease.denied_until - time.monotonic())),
+        )
+
+
+def get_client_ip(request):
+    """Получение IP адреса клиента"""
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = x_forwarded_for.split(',')[0].strip()
+    else:
+        ip = request.META.get('REMOTE_ADDR')
+    return ip
+
+
+rate_limiter = LeasedRateLimiter()
@@ -0,0 +1,234 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен: circuit breaker сервиса разомкнут"""
+
+    def __init__(self, service_name, retry_after):
+        super().__init__(f"Circuit breaker for {service_name} is open")
+        self.service_name = service_name
+        self.retry_after = retry_after
+
+
+class BulkheadFullError(Exception):
+    """Запрос отклонен: достигнут лимит одновременных запросов к сервису"""
+
+    def __init__(self, service_name):
+        super().__init__(f"Too many concurrent requests to {service_name}")
+        self.service_name = service_name
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker сервиса: размыкается по доле ошибок или медленных ответов
+    в скользящем окне, после паузы пропускает пробные запросы (half-open).
+    """
+
+    def __init__(self, service_name, window=10, min_requests=20, failure_rate=0.5, slow_call_rate=0.5,
+                 slow_call_threshold=5.0, open_time=15, half_open_requests=3):
+        self.service_name = service_name
+        self.window = window
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_threshold = slow_call_threshold
+        self.open_time = open_time
+        self.half_open_requests = half_open_requests
+
+        self._lock = threading.Lock()
+        self._buckets = deque()  # [секунда, всего, ошибок, медленных]
+        self.state = CLOSED
+        self._opened_at = 0
+        self._probes = 0
+        self._probe_successes = 0
+        self._stats = {'opened': 0, 'rejected': 0, 'failures': 0, 'slow_calls': 0}
+
+    def before_call(self):
+        """Проверка перед запросом; при разомкнутой цепи - CircuitOpenError"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self._opened_at < self.open_time:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(self.service_name, math.ceil(self.open_time - (now - self._opened_at)))
+                self.state = HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+                logger.info(f"Circuit breaker for {self.service_name} half-open, probing")
+
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_requests:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(self.service_name, 1)
+                self._probes += 1
+
+    def record(self, success, elapsed):
+        """Учет результата запроса"""
+        slow = elapsed >= self.slow_call_threshold
+        with self._lock:
+            if not success:
+                self._stats['failures'] += 1
+            if slow:
+                self._stats['slow_calls'] += 1
+
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if not success or slow:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_requests:
+                    self.state = CLOSED
+                    self._buckets.clear()
+                    logger.info(f"Circuit breaker for {self.service_name} closed")
+                return
+
+            if self.state != CLOSED:
+                return
+
+            bucket = self._current_bucket()
+            bucket[1] += 1
+            bucket[2] += 0 if success else 1
+            bucket[3] += 1 if slow else 0
+
+            total, failures, slow_calls = self._totals()
+            if total >= self.min_requests and (failures / total >= self.failure_rate
+                                               or slow_calls / total >= self.slow_call_rate):
+                self._open()
+
+    def cancel(self):
+        """Запрос прерван не по вине сервиса (например, клиент отключился)"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._buckets.clear()
+        self._stats['opened'] += 1
+        logger.warning(f"Circuit breaker for {self.service_name} opened for {self.open_time}s")
+
+    def _current_bucket(self):
+        second = int(time.monotonic())
+        while self._buckets and self._buckets[0][0] <= second - self.window:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0, 0])
+        return self._buckets[-1]
+
+    def _totals(self):
+        total = failures = slow_calls = 0
+        for _, bucket_total, bucket_failures, bucket_slow in self._buckets:
+            total += bucket_total
+            failures += bucket_failures
+            slow_calls += bucket_slow
+        return total, failures, slow_calls
+
+    def metrics(self):
+        with self._lock:
+            total, failures, slow_calls = self._totals()
+            data = dict(self._stats)
+            data.update({
+                'state': self.state,
+                'window_requests': total,
+                'window_failures': failures,
+                'window_slow_calls': slow_calls,
+            })
+            return data
+
+
+class Bulkhead:
+    """Ограничение одновременных запросов к сервису; при превышении запрос сразу отклоняется"""
+
+    def __init__(self, service_name, max_concurrent):
+        self.service_name = service_name
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def acquire(self):
+        """Занять слот; возвращает функцию его освобождения (повторные вызовы ничего не делают)"""
+        with self._lock:
+            if self.active >= self.max_concurrent:
+                self.rejected += 1
+                raise BulkheadFullError(self.service_name)
+            self.active += 1
+        released = []
+
+        def release():
+            with self._lock:
+                if not released:
+                    released.append(True)
+                    self.active -= 1
+        return release
+
+    @contextmanager
+    def slot(self):
+        release = self.acquire()
+        try:
+            yield
+        finally:
+            release()
+
+    def metrics(self):
+        return {'active': self.active, 'max_concurrent': self.max_concurrent, 'rejected': self.rejected}
+
+
+class UpstreamGuards:
+    """Реестр circuit breaker'ов и bulkhead'ов по сервисам"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._guards = {}
+
+    def _options(self, service_name):
+        config = getattr(settings, 'UPSTREAM_RESILIENCE', {})
+        breaker = dict(config.get('BREAKER', {}))
+        bulkhead = dict(config.get('BULKHEAD', {}))
+        overrides = config.get('SERVICES', {}).get(service_name, {})
+        breaker.update(overrides.get('BREAKER', {}))
+        bulkhead.update(overrides.get('BULKHEAD', {}))
+        return ({key.lower(): value for key, value in breaker.items()},
+                bulkhead.get('MAX_CONCURRENT', 100))
+
+    def get(self, service_name):
+        """(circuit breaker, bulkhead) сервиса"""
+        guards = self._guards.get(service_name)
+        if guards is not None:
+            return guards
+
+        with self._lock:
+            guards = self._guards.get(service_name)
+            if guards is None:
+                breaker_options, max_concurrent = self._options(service_name)
+                guards = (CircuitBreaker(service_name, **breaker_options), Bulkhead(service_name, max_concurrent))
+                self._guards[service_name] = guards
+            return guards
+
+    def metrics(self):
+        return {
+            name: {'breaker': breaker.metrics(), 'bulkhead': bulkhead.metrics()}
+            for name, (breaker, bulkhead) in list(self._guards.items())
+        }
+
+    def reset(self):
+        with self._lock:
+            self._guards = {}
+
+
+upstream_guards = UpstreamGuards()
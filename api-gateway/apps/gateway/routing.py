@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+
+class Route:
+    """Маршрут шлюза: префикс пути -> сервис с таймаутом, повторами и политикой кэша"""
+
+    def __init__(self, prefix, service, timeout=30, retries=0, cache=None):
+        if not prefix.startswith('/') or not prefix.endswith('/'):
+            raise ValueError(f"Route prefix must start and end with '/': {prefix}")
+        self.prefix = prefix
+        self.service = service
+        self.timeout = timeout
+        self.retries = retries
+        self.cache = cache  # TTL кэша ответов по умолчанию, None - не кэшировать
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            prefix=data['prefix'],
+            service=data['service'],
+            timeout=data.get('timeout', 30),
+            retries=data.get('retries', 0),
+            cache=data.get('cache'),
+        )
+
+
+class RouteTrie:
+    """Префиксное дерево по сегментам пути: поиск маршрута за O(длины пути)"""
+
+    def __init__(self, routes):
+        self.root = {}
+        self.routes = list(routes)
+        for route in self.routes:
+            node = self.root
+            for segment in self.split(route.prefix):
+                node = node.setdefault(segment, {})
+            if None in node:
+                raise ValueError(f"Duplicate route prefix: {route.prefix}")
+            # Ключ None хранит маршрут, заканчивающийся в этом узле
+            node[None] = route
+
+    @staticmethod
+    def split(path):
+        return [segment for segment in path.split('/') if segment]
+
+    def resolve(self, path):
+        """Маршрут с самым длинным подходящим префиксом"""
+        node = self.root
+        match = node.get(None)
+        segments = self.split(path)
+        for index, segment in enumerate(segments):
+            node = node.get(segment)
+            if node is None:
+                break
+            # Префикс '/api/products/' подходит к '/api/products' только если путь продолжается
+            if None in node and (index < len(segments) - 1 or path.endswith('/')):
+                match = node[None]
+        return match
+
+
+class RouteTable:
+    """
+    Таблица маршрутов шлюза. Источник - settings.GATEWAY_ROUTES (список) или JSON файл
+    GATEWAY_ROUTES_FILE, который перечитывается без перезапуска при изменении.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trie = None
+        self._source = None
+        self._mtime = None
+        self._checked_at = 0
+
+    def load_file(self, path):
+        with open(path) as f:
+            return json.load(f)
+
+    def compile(self, routes):
+        return RouteTrie(Route.from_dict(route) for route in routes)
+
+    def get_trie(self):
+        routes = getattr(settings, 'GATEWAY_ROUTES', None)
+        if routes is not None:
+            if routes is not self._source:
+                with self._lock:
+                    self._trie = self.compile(routes)
+                    self._source = routes
+            return self._trie
+
+        now = time.monotonic()
+        if self._trie is None or now - self._checked_at >= settings.GATEWAY_ROUTES_RELOAD_INTERVAL:
+            self.reload_if_changed(now)
+        return self._trie
+
+    def reload_if_changed(self, now=None):
+        """Перечитывание файла маршрутов, если он изменился; при ошибке остается прежняя таблица"""
+        path = settings.GATEWAY_ROUTES_FILE
+        with self._lock:
+            self._checked_at = now or time.monotonic()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError as e:
+                if self._trie is None:
+                    raise ImproperlyConfigured(f"Gateway routes file {path} not found") from e
+                logger.error(f"Gateway routes file {path} unavailable, keeping previous routes: {e}")
+                return
+            if self._trie is not None and mtime == self._mtime and self._source == path:
+                return
+
+            try:
+                trie = self.compile(self.load_file(path))
+            except (ValueError, KeyError, TypeError) as e:
+                if self._trie is None:
+                    raise ImproperlyConfigured(f"Invalid gateway routes file {path}: {e}") from e
+                logger.error(f"Invalid gateway routes file {path}, keeping previous routes: {e}")
+                self._mtime = mtime
+                return
+
+            if self._trie is not None:
+                logger.info(f"Gateway routes reloaded from {path}: {len(trie.routes)} routes")
+            self._trie = trie
+            self._mtime = mtime
+            self._source = path
+
+    def resolve(self, path):
+        return self.get_trie().resolve(path)
+
+    @property
+    def routes(self):
+        return self.get_trie().routes
+
+    def get_route(self, prefix):
+        """Маршрут по точному префиксу"""
+        for route in self.routes:
+            if route.prefix == prefix:
+                return route
+        return None
+
+
+route_table = RouteTable()
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Снятие блокировки только ее владельцем
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class Call:
+    """Выполняющийся запрос, результат которого ждут остальные"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов внутри процесса: выполняет первый, остальные ждут"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'leaders': 0, 'followers': 0, 'wait_timeouts': 0}
+
+    def do(self, key, fn, timeout):
+        """Возвращает (результат, True для выполнившего запрос)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Call()
+                self._calls[key] = call
+                self._stats['leaders'] += 1
+            else:
+                self._stats['followers'] += 1
+
+        if not leader:
+            if not call.event.wait(timeout):
+                # Первый запрос завис - не держим клиента дольше таймаута
+                self._stats['wait_timeouts'] += 1
+                return fn(), True
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+            return call.result, True
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def metrics(self):
+        data = dict(self._stats)
+        data['in_flight'] = len(self._calls)
+        return data
+
+
+class AsyncSingleFlight:
+    """Объединение одинаковых одновременных запросов в event loop (режим ASGI)"""
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = {'leaders': 0, 'followers': 0, 'wait_timeouts': 0}
+
+    async def do(self, key, fn, timeout):
+        """Возвращает (результат, True для выполнившего запрос); fn - функция, возвращающая корутину"""
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        future = self._calls.get(call_key)
+
+        if future is not None:
+            self._stats['followers'] += 1
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout), False
+            except asyncio.TimeoutError:
+                self._stats['wait_timeouts'] += 1
+                return await fn(), True
+            except asyncio.CancelledError:
+                # Отменен первый запрос (клиент отключился), а не ожидающий - выполняем сами
+                if not future.cancelled():
+                    raise
+                return await fn(), True
+
+        self._stats['leaders'] += 1
+        future = loop.create_future()
+        self._calls[call_key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, True
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие; если их нет, не логируем его как необработанное
+            future.exception()
+            raise
+        finally:
+            self._calls.pop(call_key, None)
+
+    def metrics(self):
+        data = dict(self._stats)
+        data['in_flight'] = len(self._calls)
+        return data
+
+
+class DistributedFlight:
+    """
+    Объединение запросов между процессами шлюза через блокировку в Redis:
+    владелец блокировки идет в сервис, остальные ждут появления ответа в общем кэше.
+    """
+
+    def __init__(self, redis_client=None):
+        self._redis = redis_client
+        self._stats = {'lock_acquired': 0, 'lock_waited': 0, 'served_from_peer': 0}
+
+    @property
+    def config(self):
+        return settings.GATEWAY_SINGLE_FLIGHT
+
+    @property
+    def enabled(self):
+        return self.config.get('DISTRIBUTED', False)
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.config['REDIS_URL'], decode_responses=True)
+        return self._redis
+
+    def acquire(self, key):
+        """Возвращает токен блокировки, False если она занята, None если Redis недоступен"""
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis.set(f"gateway_flight:{key}", token, nx=True,
+                                      px=int(self.config.get('LOCK_TTL', 10) * 1000))
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight lock unavailable, calling service directly: {e}")
+            return None
+        if acquired:
+            self._stats['lock_acquired'] += 1
+            return token
+        self._stats['lock_waited'] += 1
+        return False
+
+    def release(self, key, token):
+        try:
+            self.redis.eval(RELEASE_LOCK_SCRIPT, 1, f"gateway_flight:{key}", token)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release single-flight lock: {e}")
+
+    def is_locked(self, key):
+        try:
+            return bool(self.redis.exists(f"gateway_flight:{key}"))
+        except redis.RedisError:
+            return False
+
+    def run(self, key, fn, poll):
+        """Выполнение fn под блокировкой; без блокировки - ожидание результата через poll"""
+        token = self.acquire(key)
+        if token:
+            try:
+                return fn()
+            finally:
+                self.release(key, token)
+        if token is None:
+            return fn()
+
+        result = self.wait(key, poll)
+        return result if result is not None else fn()
+
+    def wait(self, key, poll):
+        deadline = time.monotonic() + self.config.get('WAIT_TIMEOUT', 30)
+        while time.monotonic() < deadline:
+            time.sleep(self.config.get('POLL_INTERVAL', 0.05))
+            result = poll()
+            if result is not None:
+                self._stats['served_from_peer'] += 1
+                return result
+            # Владелец закончил, но ответ не попал в кэш (ошибка или no-store)
+            if not self.is_locked(key):
+                return None
+        return None
+
+    async def arun(self, key, fn, poll):
+        """Асинхронный вариант run; fn - функция, возвращающая корутину"""
+        token = await sync_to_async(self.acquire, thread_sensitive=False)(key)
+        if token:
+            try:
+                return await fn()
+            finally:
+                await sync_to_async(self.release, thread_sensitive=False)(key, token)
+        if token is None:
+            return await fn()
+
+        result = await self.await_result(key, poll)
+        return result if result is not None else await fn()
+
+    async def await_result(self, key, poll):
+        deadline = time.monotonic() + self.config.get('WAIT_TIMEOUT', 30)
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.config.get('POLL_INTERVAL', 0.05))
+            result = await sync_to_async(poll, thread_sensitive=False)()
+            if result is not None:
+                self._stats['served_from_peer'] += 1
+                return result
+            if not await sync_to_async(self.is_locked, thread_sensitive=False)(key):
+                return None
+        return None
+
+    def metrics(self):
+        return dict(self._stats)
+
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
+distributed_flight = DistributedFlight()
@@ -1,3 +1,1050 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import jwt
+import redis
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+
+from .balancer import ServiceBalancer, LoadBalancer, parse_instances
+from .cache import ResponseCache
+from .identity import GatewayAuthenticator, sign_identity
+from .middleware import RateLimitMiddleware
+from .singleflight import SingleFlight, AsyncSingleFlight, DistributedFlight
+from .resilience import CircuitBreaker, Bulkhead, CircuitOpenError, BulkheadFullError, upstream_guards
+from .routing import Route, RouteTrie, RouteTable
+from .ratelimit import RateLimiter, LeasedRateLimiter, LocalLease, RateLimitResult
+from .transport import ServicePool, AsyncServicePool, UpstreamPoolManager
+from .views import ProxyView, AsyncProxyView
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_upstream_response(status_code=200, content=b'{"ok": true}', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(content)
+    response.headers.update(headers or {'Content-Type': 'application/json'})
+    return response
+
+
+class ServicePoolTest(SimpleTestCase):
+    """Тесты пула соединений к микросервису"""
+
+    def setUp(self):
+        self.pool = ServicePool('product-service', pool_connections=2, pool_maxsize=5,
+                                idle_timeout=60, max_errors=2)
+
+    def test_session_reused(self):
+        """Тест переиспользования сессии между запросами"""
+        first = self.pool.get_session()
+        second = self.pool.get_session()
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.metrics()['sessions_created'], 1)
+        self.assertEqual(self.pool.metrics()['requests'], 2)
+
+    def test_idle_pool_recycled(self):
+        """Тест пересоздания пула после простоя"""
+        first = self.pool.get_session()
+        self.pool._last_used -= 120
+        second = self.pool.get_session()
+        self.assertIsNot(first, second)
+        self.assertEqual(self.pool.metrics()['recycled_idle'], 1)
+
+    def test_recycled_after_connection_errors(self):
+        """Тест пересоздания пула после серии ошибок соединения"""
+        first = self.pool.get_session()
+        with mock.patch.object(requests.Session, 'request', side_effect=requests.exceptions.ConnectionError):
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    self.pool.request('GET', 'http://product-service/api/products/')
+        self.assertIsNot(first, self.pool.get_session())
+        self.assertEqual(self.pool.metrics()['recycled_errors'], 1)
+
+
+class AsyncServicePoolTest(SimpleTestCase):
+    """Тесты асинхронного пула соединений"""
+
+    async def test_close_closes_client(self):
+        """Тест закрытия httpx клиента при закрытии пулов"""
+        manager = UpstreamPoolManager(AsyncServicePool)
+        client = manager.get_pool('order-service').get_client()
+
+        await manager.aclose_all()
+
+        self.assertTrue(client.is_closed)
+        self.assertEqual(manager.metrics(), {})
+
+
+@override_settings(UPSTREAM_POOL={'POOL_MAXSIZE': 7, 'SERVICES': {'product-service': {'POOL_MAXSIZE': 50}}})
+class UpstreamPoolManagerTest(SimpleTestCase):
+    """Тесты реестра пулов"""
+
+    def test_pool_per_service(self):
+        """Тест размеров пулов по сервисам"""
+        manager = UpstreamPoolManager()
+        self.assertIs(manager.get_pool('cart-service'), manager.get_pool('cart-service'))
+        self.assertEqual(manager.get_pool('cart-service').pool_maxsize, 7)
+        self.assertEqual(manager.get_pool('product-service').pool_maxsize, 50)
+
+
+class RouteTrieTest(SimpleTestCase):
+    """Тесты дерева маршрутов"""
+
+    def setUp(self):
+        self.trie = RouteTrie([
+            Route('/api/products/', 'product-service'),
+            Route('/api/products/admin/', 'admin-service'),
+            Route('/api/discounts/', 'discount-service'),
+        ])
+
+    def test_longest_prefix_wins(self):
+        """Тест выбора самого длинного подходящего префикса"""
+        self.assertEqual(self.trie.resolve('/api/products/1/').service, 'product-service')
+        self.assertEqual(self.trie.resolve('/api/products/admin/stats/').service, 'admin-service')
+        self.assertEqual(self.trie.resolve('/api/discounts/').service, 'discount-service')
+
+    def test_prefix_matches_whole_segments(self):
+        """Тест: префикс совпадает только по целым сегментам пути"""
+        self.assertIsNone(self.trie.resolve('/api/productsx/'))
+        self.assertIsNone(self.trie.resolve('/api/products'))
+        self.assertIsNone(self.trie.resolve('/api/unknown/'))
+
+    def test_duplicate_prefix_rejected(self):
+        """Тест ошибки при повторяющемся префиксе"""
+        with self.assertRaises(ValueError):
+            RouteTrie([Route('/api/cart/', 'a'), Route('/api/cart/', 'b')])
+
+
+class RouteTableTest(SimpleTestCase):
+    """Тесты загрузки и перечитывания таблицы маршрутов"""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.write([{'prefix': '/api/cart/', 'service': 'cart-service'}])
+        patcher = override_settings(GATEWAY_ROUTES_FILE=self.path, GATEWAY_ROUTES_RELOAD_INTERVAL=0)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def write(self, routes, mtime_shift=0):
+        with open(self.path, 'w') as f:
+            f.write(routes if isinstance(routes, str) else json.dumps(routes))
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_shift))
+
+    def test_routes_loaded_from_file(self):
+        """Тест загрузки маршрутов из файла"""
+        self.assertEqual(RouteTable().resolve('/api/cart/items/').service, 'cart-service')
+
+    def test_hot_reload_on_change(self):
+        """Тест перечитывания измененного файла без перезапуска"""
+        table = RouteTable()
+        self.assertIsNone(table.resolve('/api/discounts/'))
+        self.write([{'prefix': '/api/discounts/', 'service': 'discount-service', 'timeout': 5}], mtime_shift=10 ** 9)
+
+        route = table.resolve('/api/discounts/1/')
+        self.assertEqual((route.service, route.timeout), ('discount-service', 5))
+
+    def test_invalid_file_keeps_previous_routes(self):
+        """Тест: ошибочный файл не заменяет рабочую таблицу"""
+        table = RouteTable()
+        table.resolve('/api/cart/')
+        self.write('[{"prefix": "no-slash"}', mtime_shift=10 ** 9)
+
+        self.assertEqual(table.resolve('/api/cart/').service, 'cart-service')
+
+
+@override_settings(UPSTREAM_BALANCER={'MAX_FAILURES': 2, 'EJECT_TIME': 10, 'HEALTH_CHECK_INTERVAL': 0})
+class BalancerTest(SimpleTestCase):
+    """Тесты балансировки между экземплярами сервиса"""
+
+    def setUp(self):
+        self.balancer = ServiceBalancer('product-service', ['http://p1', 'http://p2'])
+        self.p1, self.p2 = self.balancer.instances
+
+    def test_parse_instances(self):
+        """Тест разбора списка экземпляров из настроек"""
+        self.assertEqual(parse_instances('http://p1:8001/, http://p2:8001'), ['http://p1:8001', 'http://p2:8001'])
+        self.assertEqual(parse_instances(['http://p1']), ['http://p1'])
+
+    def test_least_outstanding(self):
+        """Тест выбора экземпляра с наименьшим числом запросов в работе"""
+        first = self.balancer.choose()
+        second = self.balancer.choose()
+        self.assertIsNot(first, second)
+        self.balancer.release(first, 0.01)
+        self.assertIs(self.balancer.choose(), first)
+
+    def test_ewma_prefers_faster_instance(self):
+        """Тест выбора по сглаженной задержке"""
+        balancer = ServiceBalancer('product-service', ['http://p1', 'http://p2'], strategy='ewma')
+        fast, slow = balancer.instances
+        fast.ewma, slow.ewma = 5.0, 200.0
+        for _ in range(5):
+            balancer.release(balancer.choose(), 0.005)
+        self.assertEqual((fast.requests, slow.requests), (5, 0))
+
+    def test_passive_ejection(self):
+        """Тест исключения экземпляра после серии ошибок"""
+        for _ in range(2):
+            self.balancer.release(self.p1, 0.01, failed=True)
+
+        self.assertFalse(self.p1.is_available(time.monotonic()))
+        self.assertEqual({self.balancer.choose() for _ in range(4)}, {self.p2})
+
+    def test_all_ejected_falls_back_to_all(self):
+        """Тест: если исключены все экземпляры, запросы все равно отправляются"""
+        for instance in (self.p1, self.p2):
+            instance.ejected_until = time.monotonic() + 60
+        self.assertIn(self.balancer.choose(), [self.p1, self.p2])
+
+    @override_settings(MICROSERVICES={'product-service': 'http://p1,http://p2'})
+    def test_active_health_check(self):
+        """Тест активной проверки здоровья экземпляров"""
+        manager = LoadBalancer()
+        balancer = manager.get('product-service')
+        with mock.patch('apps.gateway.balancer.requests.get') as get:
+            get.side_effect = [mock.Mock(status_code=200), requests.exceptions.ConnectionError('refused')]
+            manager.check_health()
+
+        self.assertEqual([i.healthy for i in balancer.instances], [True, False])
+        self.assertEqual([m['available'] for m in manager.metrics()['product-service']], [True, False])
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    """Тесты circuit breaker и bulkhead"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('order-service', window=10, min_requests=4, failure_rate=0.5,
+                                      slow_call_threshold=1.0, open_time=15, half_open_requests=2)
+
+    def fail(self, count, elapsed=0.01):
+        for _ in range(count):
+            self.breaker.before_call()
+            self.breaker.record(False, elapsed)
+
+    def test_opens_on_failure_rate(self):
+        """Тест размыкания по доле ошибок"""
+        self.breaker.record(True, 0.01)
+        self.fail(1)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.fail(2)
+
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError) as context:
+            self.breaker.before_call()
+        self.assertEqual(context.exception.retry_after, 15)
+
+    def test_opens_on_slow_calls(self):
+        """Тест размыкания по медленным ответам"""
+        for _ in range(4):
+            self.breaker.record(True, 2.0)
+        self.assertEqual(self.breaker.state, 'open')
+
+    def test_half_open_probe_closes(self):
+        """Тест замыкания после успешных пробных запросов"""
+        self.fail(4)
+        self.breaker._opened_at -= 16
+
+        self.breaker.before_call()
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, 'half_open')
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.breaker.record(True, 0.01)
+        self.breaker.record(True, 0.01)
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_half_open_failure_reopens(self):
+        """Тест повторного размыкания при ошибке пробного запроса"""
+        self.fail(4)
+        self.breaker._opened_at -= 16
+        self.fail(1)
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertEqual(self.breaker.metrics()['opened'], 2)
+
+    def test_bulkhead_rejects_over_limit(self):
+        """Тест отказа при превышении лимита одновременных запросов"""
+        bulkhead = Bulkhead('order-service', max_concurrent=1)
+        with bulkhead.slot():
+            with self.assertRaises(BulkheadFullError):
+                with bulkhead.slot():
+                    pass
+        with bulkhead.slot():
+            pass
+        self.assertEqual(bulkhead.metrics(), {'active': 0, 'max_concurrent': 1, 'rejected': 1})
+
+    @override_settings(MICROSERVICES={'order-service': 'http://order-service:8003'})
+    def test_open_breaker_fails_fast(self):
+        """Тест немедленного ответа 503 без обращения к сервису"""
+        upstream_guards.reset()
+        self.addCleanup(upstream_guards.reset)
+        breaker, _ = upstream_guards.get('order-service')
+        breaker._open()
+
+        with mock.patch('apps.gateway.views.upstream_pools') as pools:
+            response = ProxyView.as_view()(RequestFactory().get('/api/orders/'))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        pools.get_pool.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MICROSERVICES={'product-service': 'http://product-service:8001'},
+                   GATEWAY_CACHE={'ENABLED': False})
+class ProxyViewTest(SimpleTestCase):
+    """Тесты проксирования запросов"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_proxy_uses_service_pool(self):
+        """Тест проксирования через пул соединений сервиса"""
+        request = self.factory.get('/api/products/', {'page': '2'})
+        with mock.patch('apps.gateway.views.upstream_pools') as pools:
+            pools.get_pool.return_value.request.return_value = make_upstream_response()
+            response = ProxyView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        pools.get_pool.assert_called_once_with('product-service')
+        kwargs = pools.get_pool.return_value.request.call_args.kwargs
+        self.assertEqual(kwargs['url'], 'http://product-service:8001/api/products/')
+        self.assertEqual(kwargs['params'], {'page': '2'})
+
+    def test_unknown_service(self):
+        """Тест запроса к неизвестному сервису"""
+        response = ProxyView.as_view()(self.factory.get('/api/unknown/'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_request_body_forwarded_as_is(self):
+        """Тест передачи тела запроса без разбора JSON"""
+        body = b'{"quantity": 2, "note": "\\u0442\\u0435\\u0441\\u0442"}'
+        request = self.factory.post('/api/products/1/reserve/', body, content_type='application/json')
+        with mock.patch('apps.gateway.views.upstream_pools') as pools:
+            pools.get_pool.return_value.request.return_value = make_upstream_response()
+            ProxyView.as_view()(request)
+
+        kwargs = pools.get_pool.return_value.request.call_args.kwargs
+        self.assertEqual(kwargs['data'], body)
+        self.assertNotIn('json', kwargs)
+
+    def test_response_streamed(self):
+        """Тест потоковой передачи ответа"""
+        content = b'x' * (200 * 1024)
+        upstream = make_upstream_response(content=content)
+        with mock.patch('apps.gateway.views.upstream_pools') as pools, \
+                mock.patch.object(upstream, 'close') as close:
+            pools.get_pool.return_value.request.return_value = upstream
+            response = ProxyView.as_view()(self.factory.get('/api/products/'))
+
+            self.assertTrue(response.streaming)
+            self.assertTrue(pools.get_pool.return_value.request.call_args.kwargs['stream'])
+            self.assertEqual(b''.join(response.streaming_content), content)
+            close.assert_called_once()
+
+    def test_streamed_response_holds_bulkhead_slot(self):
+        """Тест освобождения слота bulkhead при закрытии потокового ответа, а не при его возврате"""
+        upstream_guards.reset()
+        self.addCleanup(upstream_guards.reset)
+        _, bulkhead = upstream_guards.get('product-service')
+        upstream = make_upstream_response()
+        with mock.patch('apps.gateway.views.upstream_pools') as pools, \
+                mock.patch.object(upstream, 'close') as close:
+            pools.get_pool.return_value.request.return_value = upstream
+            response = ProxyView.as_view()(self.factory.get('/api/products/'))
+
+            self.assertEqual(bulkhead.active, 1)
+            # Клиент отключился, не дочитав тело
+            response.close()
+            self.assertEqual(bulkhead.active, 0)
+            close.assert_called()
+
+    @override_settings(GATEWAY_ROUTES=[{'prefix': '/api/products/', 'service': 'product-service',
+                                        'timeout': 5, 'retries': 2}])
+    def test_route_timeout_and_retries(self):
+        """Тест таймаута маршрута и повтора GET при ошибке соединения"""
+        with mock.patch('apps.gateway.views.upstream_pools') as pools:
+            pools.get_pool.return_value.request.side_effect = [
+                requests.exceptions.ConnectionError('reset'),
+                make_upstream_response(),
+            ]
+            response = ProxyView.as_view()(self.factory.get('/api/products/'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(pools.get_pool.return_value.request.call_count, 2)
+        self.assertEqual(pools.get_pool.return_value.request.call_args.kwargs['timeout'], 5)
+
+    @override_settings(GATEWAY_ROUTES=[{'prefix': '/api/products/', 'service': 'product-service', 'retries': 2}])
+    def test_unsafe_methods_not_retried(self):
+        """Тест: POST не повторяется"""
+        with mock.patch('apps.gateway.views.upstream_pools') as pools:
+            pools.get_pool.return_value.request.side_effect = requests.exceptions.ConnectionError('reset')
+            response = ProxyView.as_view()(self.factory.post('/api/products/', b'{}', content_type='application/json'))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(pools.get_pool.return_value.request.call_count, 1)
+
+    @override_settings(MICROSERVICES={'product-service': 'http://p1:8001,http://p2:8001'},
+                       GATEWAY_ROUTES=[{'prefix': '/api/products/', 'service': 'product-service', 'retries': 1}])
+    def test_retry_goes_to_another_instance(self):
+        """Тест повтора запроса на другом экземпляре сервиса"""
+        with mock.patch('apps.gateway.views.upstream_pools') as pools:
+            pools.get_pool.return_value.request.side_effect = [
+                requests.exceptions.ConnectionError('refused'),
+                make_upstream_response(),
+            ]
+            response = ProxyView.as_view()(self.factory.get('/api/products/'))
+
+        self.assertEqual(response.status_code, 200)
+        urls = [c.kwargs['url'] for c in pools.get_pool.return_value.request.call_args_list]
+        self.assertEqual(sorted(urls), ['http://p1:8001/api/products/', 'http://p2:8001/api/products/'])
+
+    @override_settings(GATEWAY_STREAM_RESPONSES=False)
+    def test_buffered_mode(self):
+        """Тест режима с буферизацией ответа"""
+        with mock.patch('apps.gateway.views.upstream_pools') as pools:
+            pools.get_pool.return_value.request.return_value = make_upstream_response()
+            response = ProxyView.as_view()(self.factory.get('/api/products/'))
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, b'{"ok": true}')
+
+
+def make_token(key='test-signing-key', **claims):
+    payload = {'token_type': 'access', 'user_id': 7, 'email': 'user@example.com', 'jti': 'abc',
+               'exp': int(time.time()) + 300}
+    payload.update(claims)
+    return jwt.encode(payload, key, algorithm='HS256')
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    MICROSERVICES={'cart-service': 'http://cart-service:8002'},
+    GATEWAY_AUTH={'JWT_VERIFYING_KEYS': ['test-signing-key'], 'JWT_LEEWAY': 0, 'IDENTITY_KEY': 'identity-key'},
+)
+class GatewayAuthenticatorTest(SimpleTestCase):
+    """Тесты проверки токена на шлюзе и заголовка X-Identity"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.authenticator = GatewayAuthenticator()
+
+    def forwarded_headers(self, **extra):
+        request = self.factory.get('/api/cart/', **extra)
+        with mock.patch('apps.gateway.views.upstream_pools') as pools:
+            pools.get_pool.return_value.request.return_value = make_upstream_response()
+            ProxyView.as_view()(request)
+        return pools.get_pool.return_value.request.call_args.kwargs['headers']
+
+    def test_identity_header_signed(self):
+        """Тест подписи данных пользователя ключом IDENTITY_KEY"""
+        exp = int(time.time()) + 300
+        request = self.factory.get('/api/cart/', HTTP_AUTHORIZATION=f'Bearer {make_token(exp=exp)}')
+        header = self.authenticator.get_identity_header(request)
+
+        claims = {'user_id': 7, 'email': 'user@example.com', 'exp': exp, 'jti': 'abc'}
+        self.assertEqual(header, sign_identity(claims, 'identity-key'))
+        self.assertNotEqual(header, sign_identity(claims, 'other-key'))
+
+    def test_identity_forwarded_for_valid_token(self):
+        """Тест передачи X-Identity сервису вместе с токеном"""
+        headers = self.forwarded_headers(HTTP_AUTHORIZATION=f'Bearer {make_token()}')
+        self.assertIn('X-Identity', headers)
+        self.assertIn('Authorization', headers)
+
+    def test_invalid_token_not_trusted(self):
+        """Тест: для чужой подписи, истекшего и refresh токена заголовок не выдается"""
+        for token in (
+            make_token(key='unknown-key'),
+            make_token(exp=int(time.time()) - 60),
+            make_token(token_type='refresh'),
+            'not-a-token',
+        ):
+            request = self.factory.get('/api/cart/', HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertIsNone(self.authenticator.get_identity_header(request))
+
+    def test_client_identity_header_dropped(self):
+        """Тест: присланный клиентом X-Identity не передается сервису"""
+        headers = self.forwarded_headers(HTTP_X_IDENTITY='forged.header')
+        self.assertNotIn('X-Identity', headers)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MICROSERVICES={'order-service': 'http://order-service:8003'})
+class AsyncProxyViewTest(SimpleTestCase):
+    """Тесты асинхронного проксирования"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    async def test_async_proxy_streams_response(self):
+        """Тест асинхронного проксирования с потоковым ответом"""
+        request = self.factory.post('/api/orders/create/', b'{"shipping_address": "x"}',
+                                    content_type='application/json')
+        upstream = httpx.Response(201, content=b'{"id": 1}', headers={'Content-Type': 'application/json'})
+        with mock.patch('apps.gateway.views.async_upstream_pools') as pools:
+            pools.get_pool.return_value.request = mock.AsyncMock(return_value=upstream)
+            response = await AsyncProxyView.as_view()(request)
+            body = b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(body, b'{"id": 1}')
+        kwargs = pools.get_pool.return_value.request.call_args.kwargs
+        self.assertEqual(kwargs['content'], b'{"shipping_address": "x"}')
+
+    async def test_async_proxy_timeout(self):
+        """Тест ответа 504 при таймауте сервиса"""
+        with mock.patch('apps.gateway.views.async_upstream_pools') as pools:
+            pools.get_pool.return_value.request = mock.AsyncMock(side_effect=httpx.ReadTimeout('timeout'))
+            response = await AsyncProxyView.as_view()(self.factory.get('/api/orders/'))
+
+        self.assertEqual(response.status_code, 504)
+
+    async def test_async_streamed_response_holds_bulkhead_slot(self):
+        """Тест освобождения слота bulkhead после передачи асинхронного потока"""
+        upstream_guards.reset()
+        self.addCleanup(upstream_guards.reset)
+        _, bulkhead = upstream_guards.get('order-service')
+        upstream = httpx.Response(200, content=b'{"ok": true}', headers={'Content-Type': 'application/json'})
+        with mock.patch('apps.gateway.views.async_upstream_pools') as pools:
+            pools.get_pool.return_value.request = mock.AsyncMock(return_value=upstream)
+            response = await AsyncProxyView.as_view()(self.factory.get('/api/orders/'))
+            self.assertEqual(bulkhead.active, 1)
+            body = b''.join([chunk async for chunk in response.streaming_content])
+            response.close()
+
+        self.assertEqual(body, b'{"ok": true}')
+        self.assertEqual(bulkhead.active, 0)
+
+    async def test_async_unread_stream_closes_upstream(self):
+        """Тест закрытия ответа сервиса, если клиент отключился до чтения тела"""
+        class UpstreamBody(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                yield b'{"ok": true}'
+
+        upstream = httpx.Response(200, stream=UpstreamBody(), headers={'Content-Type': 'application/json'})
+        with mock.patch('apps.gateway.views.async_upstream_pools') as pools:
+            pools.get_pool.return_value.request = mock.AsyncMock(return_value=upstream)
+            response = await AsyncProxyView.as_view()(self.factory.get('/api/orders/'))
+
+        # Django закрывает ответ из потока (sync_to_async), как в ASGIHandler
+        await sync_to_async(response.close, thread_sensitive=True)()
+        await asyncio.sleep(0)
+        self.assertTrue(upstream.is_closed)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    MICROSERVICES={'product-service': 'http://product-service:8001'},
+    GATEWAY_CACHE={
+        'ENABLED': True,
+        'LISTEN_EVENTS': False,
+        'PURGE_EVENTS': {'product.updated': ['/api/products/']},
+    },
+    GATEWAY_ROUTES=[{'prefix': '/api/products/', 'service': 'product-service', 'cache': 60}],
+)
+class ResponseCacheTest(SimpleTestCase):
+    """Тесты кэша ответов шлюза"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.cache = ResponseCache()
+        patcher = mock.patch('apps.gateway.views.response_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        pools_patcher = mock.patch('apps.gateway.views.upstream_pools')
+        self.upstream = pools_patcher.start().get_pool.return_value
+        self.addCleanup(pools_patcher.stop)
+        self.upstream.request.side_effect = lambda **kwargs: make_upstream_response()
+        publish_patcher = mock.patch.object(ResponseCache, 'publish_purge')
+        self.publish = publish_patcher.start()
+        self.addCleanup(publish_patcher.stop)
+        from django.core.cache import cache
+        cache.clear()
+
+    def get(self, path='/api/products/', **extra):
+        return ProxyView.as_view()(self.factory.get(path, **extra))
+
+    def test_second_request_served_from_cache(self):
+        """Тест ответа из кэша без обращения к сервису"""
+        first = self.get()
+        second = self.get()
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, b'{"ok": true}')
+        self.assertEqual(self.upstream.request.call_count, 1)
+        self.assertFalse(self.upstream.request.call_args.kwargs['stream'])
+
+    def test_shared_tier_used_after_local_miss(self):
+        """Тест чтения из общего кэша другим процессом"""
+        self.get()
+        self.cache.clear_local()
+        response = self.get()
+
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.cache.metrics()['hits_shared'], 1)
+
+    def test_key_includes_query_and_accept(self):
+        """Тест разных ключей для разных параметров и Accept"""
+        self.get()
+        self.get(data={'page': '2'})
+        self.get(HTTP_ACCEPT='text/html')
+        self.assertEqual(self.upstream.request.call_count, 3)
+
+    def test_if_none_match_answered_with_304(self):
+        """Тест ответа 304 на If-None-Match"""
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.upstream.request.call_count, 1)
+
+    def test_upstream_cache_control_honoured(self):
+        """Тест учета Cache-Control микросервиса"""
+        self.upstream.request.side_effect = lambda **kwargs: make_upstream_response(
+            headers={'Content-Type': 'application/json', 'Cache-Control': 'no-store'})
+        self.assertEqual(self.get()['X-Cache'], 'BYPASS')
+        self.get()
+        self.assertEqual(self.upstream.request.call_count, 2)
+
+        self.upstream.request.side_effect = lambda **kwargs: make_upstream_response(
+            headers={'Content-Type': 'application/json', 'Cache-Control': 'max-age=5'})
+        self.get('/api/products/1/')
+        entry = self.cache.lookup(self.factory.get('/api/products/1/'))[1]
+        self.assertLessEqual(entry.expires_at - time.time(), 5)
+
+    def test_error_responses_not_cached(self):
+        """Тест: ошибки сервиса не кэшируются"""
+        self.upstream.request.side_effect = lambda **kwargs: make_upstream_response(status_code=500)
+        self.get()
+        self.get()
+        self.assertEqual(self.upstream.request.call_count, 2)
+
+    def test_purge_by_event(self):
+        """Тест сброса маршрута по событию"""
+        self.get()
+        self.cache.handle_event({'type': 'product.updated', 'data': {'id': 1}})
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        self.assertEqual(self.upstream.request.call_count, 2)
+
+    def test_write_through_gateway_purges_route(self):
+        """Тест сброса маршрута после изменения через шлюз"""
+        self.get()
+        ProxyView.as_view()(self.factory.post('/api/products/', b'{}', content_type='application/json'))
+        self.publish.assert_called_once_with(['/api/products/'])
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+
+    def test_processes_share_generation_after_purge(self):
+        """Тест: после сброса все процессы шлюза приходят к одному поколению в общем кэше"""
+        other = ResponseCache()
+        prefix = '/api/products/'
+        self.get()
+        self.assertEqual(other.get_generation(prefix), self.cache.get_generation(prefix))
+
+        # Изменение через шлюз: поколение увеличивает только исходный процесс, остальные получают PURGE_EVENT
+        ProxyView.as_view()(self.factory.post('/api/products/', b'{}', content_type='application/json'))
+        purge_event = {'type': 'gateway.cache.purge', 'data': {'prefixes': [prefix]}}
+        for process in (self.cache, other):
+            process.handle_event(purge_event)
+        self.assertEqual(other.get_generation(prefix), self.cache.get_generation(prefix))
+
+        # Событие сервиса получают оба процесса: поколение увеличивается один раз
+        before = self.cache.get_generation(prefix)
+        event = {'type': 'product.updated', 'data': {'id': 1}, 'timestamp': 1.0}
+        for process in (self.cache, other):
+            process.handle_event(event)
+        for process in (self.cache, other):
+            process.handle_event(purge_event)
+        self.assertEqual(self.cache.get_generation(prefix), before + 1)
+        self.assertEqual(other.get_generation(prefix), before + 1)
+
+        # Ответ, сохраненный одним процессом, находит другой
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        key, entry = other.lookup(self.factory.get('/api/products/'))
+        self.assertIsNotNone(entry)
+
+    def test_concurrent_misses_coalesced(self):
+        """Тест одного запроса к сервису при одновременных промахах"""
+        def slow_response(**kwargs):
+            time.sleep(0.2)
+            return make_upstream_response()
+
+        self.upstream.request.side_effect = slow_response
+        barrier = threading.Barrier(5)
+        statuses = []
+
+        def worker():
+            barrier.wait()
+            statuses.append(self.get()['X-Cache'])
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.upstream.request.call_count, 1)
+        self.assertEqual(sorted(statuses), ['COALESCED'] * 4 + ['MISS'])
+
+    def test_rejected_response_keeps_retry_after(self):
+        """Тест заголовка Retry-After в ответе 503 кэшируемого маршрута при разомкнутом breaker"""
+        upstream_guards.reset()
+        self.addCleanup(upstream_guards.reset)
+        breaker, _ = upstream_guards.get('product-service')
+        breaker._open()
+
+        response = self.get()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.upstream.request.assert_not_called()
+
+    async def test_async_view_uses_cache(self):
+        """Тест кэша в асинхронном режиме"""
+        upstream = httpx.Response(200, content=b'{"ok": true}', headers={'Content-Type': 'application/json'})
+        with mock.patch('apps.gateway.views.async_upstream_pools') as pools:
+            pools.get_pool.return_value.request = mock.AsyncMock(return_value=upstream)
+            first = await AsyncProxyView.as_view()(self.factory.get('/api/products/'))
+            second = await AsyncProxyView.as_view()(self.factory.get('/api/products/'))
+
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(second.content, b'{"ok": true}')
+        pools.get_pool.return_value.request.assert_awaited_once()
+
+
+class PurgeEventsTest(SimpleTestCase):
+    """Тесты карты событий сброса кэша"""
+
+    def published_events(self):
+        services_dir = settings.BASE_DIR.parent / 'services'
+        if not services_dir.is_dir():
+            self.skipTest('Services sources are not available')
+        events = set()
+        for path in services_dir.glob('*/apps/*/*.py'):
+            if path.name == 'tests.py':
+                continue
+            for line in path.read_text(encoding='utf-8').splitlines():
+                if 'publish_event(' in line or 'publish_on_commit(' in line:
+                    events.update(re.findall(r"'([a-z_]+\.[a-z_]+)'", line))
+        return events
+
+    def test_purge_events_are_published(self):
+        """Тест: каждое событие сброса кэша действительно публикуется каким-то сервисом"""
+        published = self.published_events()
+        self.assertIn('product.updated', published)
+        for event_type in settings.GATEWAY_CACHE['PURGE_EVENTS']:
+            with self.subTest(event_type=event_type):
+                self.assertIn(event_type, published)
+
+
+class SingleFlightTest(SimpleTestCase):
+    """Тесты объединения одинаковых одновременных запросов"""
+
+    def run_concurrently(self, flight, fn, count=10):
+        barrier = threading.Barrier(count)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(flight.do('key', fn, timeout=5))
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Тест: одновременные запросы выполняются один раз"""
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'response'
+
+        results = self.run_concurrently(SingleFlight(), fetch)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({result for result, _ in results}, {'response'})
+        self.assertEqual(sum(1 for _, leader in results if leader), 1)
+
+    def test_error_shared_with_waiters(self):
+        """Тест передачи ошибки ожидающим запросам"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def failing():
+            started.set()
+            release.wait(5)
+            raise ValueError('upstream failed')
+
+        def call(fn):
+            try:
+                flight.do('key', fn, timeout=5)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call, args=(failing,))
+        leader.start()
+        self.assertTrue(started.wait(5))
+        follower = threading.Thread(target=call, args=(lambda: 'unexpected',))
+        follower.start()
+        while flight.metrics()['followers'] == 0:
+            time.sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(len(errors), 2)
+
+    def test_sequential_calls_not_merged(self):
+        """Тест: завершенный запрос не переиспользуется"""
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1, timeout=5), (1, True))
+        self.assertEqual(flight.do('key', lambda: 2, timeout=5), (2, True))
+
+    async def test_async_calls_share_one_execution(self):
+        """Тест объединения запросов в event loop"""
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'response'
+
+        results = await asyncio.gather(*[flight.do('key', fetch, timeout=5) for _ in range(10)])
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result for result, _ in results], ['response'] * 10)
+
+    @override_settings(GATEWAY_SINGLE_FLIGHT={'DISTRIBUTED': True, 'POLL_INTERVAL': 0.01, 'WAIT_TIMEOUT': 1})
+    def test_distributed_waiter_served_from_shared_cache(self):
+        """Тест: процесс без блокировки получает ответ из общего кэша"""
+        client = mock.Mock()
+        client.set.return_value = False
+        client.exists.return_value = True
+        flight = DistributedFlight(redis_client=client)
+        polls = iter([None, 'cached'])
+        fetch = mock.Mock()
+
+        self.assertEqual(flight.run('key', fetch, lambda: next(polls)), 'cached')
+        fetch.assert_not_called()
+
+    @override_settings(GATEWAY_SINGLE_FLIGHT={'DISTRIBUTED': True, 'LOCK_TTL': 10})
+    def test_distributed_lock_owner_fetches(self):
+        """Тест: владелец блокировки идет в сервис и снимает блокировку"""
+        client = mock.Mock()
+        client.set.return_value = True
+        flight = DistributedFlight(redis_client=client)
+
+        self.assertEqual(flight.run('key', lambda: 'fresh', lambda: None), 'fresh')
+        self.assertEqual(client.set.call_args.kwargs, {'nx': True, 'px': 10000})
+        client.eval.assert_called_once()
+
+
+@override_settings(
+    RATE_LIMIT_POLICIES=[
+        {'name': 'orders-write', 'prefix': '/api/orders/', 'methods': ['POST'],
+         'algorithm': 'token_bucket', 'limit': 3, 'window': 60, 'key': 'user'},
+    ],
+    RATE_LIMIT_DEFAULT_POLICY={'algorithm': 'sliding_window', 'limit': 3, 'window': 60, 'key': 'ip'},
+)
+class RateLimiterTest(SimpleTestCase):
+    """Тесты ограничителя частоты запросов"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_policy_by_route_and_method(self):
+        """Тест выбора политики по маршруту и методу"""
+        limiter = RateLimiter()
+        self.assertEqual(limiter.get_policy(self.factory.post('/api/orders/create/')).name, 'orders-write')
+        self.assertEqual(limiter.get_policy(self.factory.get('/api/orders/')).name, 'default')
+
+    def test_identity_by_user_token(self):
+        """Тест ключа ограничения по пользователю"""
+        limiter = RateLimiter()
+        policy = limiter.get_policy(self.factory.post('/api/orders/create/'))
+        first = limiter.get_identity(self.factory.post('/api/orders/create/', HTTP_AUTHORIZATION='Bearer a'), policy)
+        second = limiter.get_identity(self.factory.post('/api/orders/create/', HTTP_AUTHORIZATION='Bearer b'), policy)
+        self.assertTrue(first.startswith('user:'))
+        self.assertNotEqual(first, second)
+
+    def test_fail_open_when_redis_unavailable(self):
+        """Тест пропуска запросов при недоступном Redis"""
+        client = mock.Mock()
+        client.register_script.return_value.side_effect = redis.ConnectionError('down')
+        result = RateLimiter(client).check(self.factory.get('/api/products/'))
+        self.assertTrue(result.allowed)
+
+    def test_limits_enforced_in_redis(self):
+        """Тест атомарных скриптов на реальном Redis"""
+        client = redis.Redis.from_url(settings.RATE_LIMIT_REDIS_URL, socket_connect_timeout=0.2)
+        try:
+            client.ping()
+        except redis.RedisError:
+            self.skipTest('Redis is not available')
+
+        client.delete('rate_limit:default:ip:10.0.0.1', 'rate_limit:orders-write:ip:10.0.0.1')
+        limiter = RateLimiter(client)
+        for path, method in (('/api/products/', 'get'), ('/api/orders/create/', 'post')):
+            results = [
+                limiter.check(getattr(self.factory, method)(path, REMOTE_ADDR='10.0.0.1')) for _ in range(4)
+            ]
+            self.assertEqual([r.allowed for r in results], [True, True, True, False])
+            self.assertEqual(results[2].remaining, 0)
+            self.assertGreater(results[3].retry_after, 0)
+            self.assertLessEqual(results[3].reset, 60)
+
+
+
+@override_settings(
+    RATE_LIMIT_POLICIES=[],
+    RATE_LIMIT_DEFAULT_POLICY={'algorithm': 'token_bucket', 'limit': 100, 'window': 60, 'key': 'ip'},
+    RATE_LIMIT_LEASE={'ENABLED': True, 'MAX_SIZE': 8, 'TTL': 5.0, 'REFILL_THRESHOLD': 0, 'MAX_ENTRIES': 100},
+)
+class LeasedRateLimiterTest(SimpleTestCase):
+    """Тесты локального уровня лимитера с арендой разрешений"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.limiter = LeasedRateLimiter(mock.Mock())
+        self.limiter._executor = mock.Mock()
+
+    def lease_reply(self, granted, remaining=50):
+        return granted, RateLimitResult(granted > 0, 100, remaining, 30, 0 if granted else 7)
+
+    def test_requests_served_from_lease(self):
+        """Тест обслуживания запросов из арендованной пачки без обращения к Redis"""
+        with mock.patch.object(self.limiter, 'acquire', side_effect=[self.lease_reply(1), self.lease_reply(2)]) as acquire:
+            results = [self.limiter.check(self.factory.get('/api/products/')) for _ in range(3)]
+
+        self.assertTrue(all(r.allowed for r in results))
+        # Первая аренда на 1 разрешение, вторая удвоена и покрывает два запроса
+        self.assertEqual([c.kwargs['cost'] for c in acquire.call_args_list], [1, 2])
+        # Израсходованная пачка подгружается в фоне
+        self.limiter._executor.submit.assert_called_once()
+
+    def test_denied_locally_until_retry(self):
+        """Тест локального отказа без повторных обращений к Redis"""
+        with mock.patch.object(self.limiter, 'acquire', return_value=self.lease_reply(0, remaining=0)) as acquire:
+            first = self.limiter.check(self.factory.get('/api/products/'))
+            second = self.limiter.check(self.factory.get('/api/products/'))
+
+        self.assertFalse(first.allowed)
+        self.assertFalse(second.allowed)
+        self.assertEqual(acquire.call_count, 1)
+        self.assertGreater(second.retry_after, 0)
+
+    @override_settings(RATE_LIMIT_LEASE={'ENABLED': False})
+    def test_disabled_lease_goes_to_redis(self):
+        """Тест прямого обращения к Redis при выключенной аренде"""
+        with mock.patch.object(self.limiter, 'acquire', return_value=self.lease_reply(1)) as acquire:
+            self.limiter.check(self.factory.get('/api/products/'))
+            self.limiter.check(self.factory.get('/api/products/'))
+        self.assertEqual(acquire.call_count, 2)
+        self.assertEqual(acquire.call_args.kwargs, {})
+
+    @override_settings(RATE_LIMIT_DEFAULT_POLICY={'algorithm': 'token_bucket', 'limit': 3, 'window': 60, 'key': 'ip'})
+    def test_small_limit_not_leased(self):
+        """Тест: лимит меньше MIN_SIZE разрешений на TTL проверяется в Redis на каждый запрос"""
+        with mock.patch.object(self.limiter, 'acquire', return_value=self.lease_reply(1)) as acquire:
+            self.limiter.check(self.factory.get('/api/products/'))
+            self.limiter.check(self.factory.get('/api/products/'))
+        self.assertEqual(acquire.call_count, 2)
+        self.assertEqual(acquire.call_args.kwargs, {})
+
+    @override_settings(RATE_LIMIT_DEFAULT_POLICY={'algorithm': 'token_bucket', 'limit': 36, 'window': 60, 'key': 'ip'})
+    def test_lease_capped_by_limit_share(self):
+        """Тест: аренда не больше доли лимита на TTL"""
+        policy = self.limiter.get_policy(self.factory.get('/api/products/'))
+        lease = LocalLease()
+        lease.size = 3
+        lease.expires_at = time.monotonic() + 5
+        # 36 разрешений за 60 с при TTL 5 с - не больше 3 разрешений в аренде
+        self.assertEqual(self.limiter._next_size(lease, policy, time.monotonic()), 3)
+
+    def test_waiters_fall_back_to_redis_when_lease_stalls(self):
+        """Тест: если пачка не пришла за WAIT_TIMEOUT, запрос проверяется в Redis напрямую"""
+        lease = self.limiter._get_lease('rate_limit:default:ip:127.0.0.1')
+        lease.pending = threading.Event()
+        with override_settings(RATE_LIMIT_LEASE=dict(settings.RATE_LIMIT_LEASE, WAIT_TIMEOUT=0.01)), \
+                mock.patch.object(self.limiter, 'acquire', return_value=self.lease_reply(1)) as acquire:
+            result = self.limiter.check(self.factory.get('/api/products/'))
+        self.assertTrue(result.allowed)
+        self.assertEqual(acquire.call_args.kwargs, {})
+
+    def test_single_synchronous_lease_per_key(self):
+        """Тест: одновременные промахи ждут одну аренду, а не обращаются к Redis каждый"""
+        started, release = threading.Event(), threading.Event()
+
+        def slow_acquire(key, policy, cost=1, partial=False):
+            started.set()
+            release.wait(5)
+            return self.lease_reply(8)
+
+        with mock.patch.object(self.limiter, 'acquire', side_effect=slow_acquire) as acquire:
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(self.limiter.check(self.factory.get('/api/products/'))))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            started.wait(5)
+            time.sleep(0.05)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(acquire.call_count, 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(r.allowed for r in results))
+
+
+class RateLimitMiddlewareTest(SimpleTestCase):
+    """Тесты middleware ограничения частоты"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+
+    def test_headers_added(self):
+        """Тест заголовков X-RateLimit-*"""
+        with mock.patch('apps.gateway.middleware.rate_limiter') as limiter:
+            limiter.check.return_value = RateLimitResult(True, 100, 42, 17)
+            response = self.middleware(self.factory.get('/api/products/'))
+
+        self.assertEqual(response['X-RateLimit-Limit'], '100')
+        self.assertEqual(response['X-RateLimit-Remaining'], '42')
+        self.assertEqual(response['X-RateLimit-Reset'], '17')
+
+    def test_limit_exceeded(self):
+        """Тест ответа 429 с Retry-After"""
+        with mock.patch('apps.gateway.middleware.rate_limiter') as limiter:
+            limiter.check.return_value = RateLimitResult(False, 100, 0, 30, retry_after=5)
+            response = self.middleware(self.factory.get('/api/products/'))
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
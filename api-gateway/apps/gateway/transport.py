@@ -0,0 +1,255 @@
+import asyncio
+import threading
+import time
+import logging
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ServicePool:
+    """Пул keep-alive соединений к одному микросервису"""
+
+    def __init__(self, service_name, pool_connections, pool_maxsize, idle_timeout, max_errors):
+        self.service_name = service_name
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self.max_errors = max_errors
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._last_used = None
+        self._consecutive_errors = 0
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'sessions_created': 0,
+            'recycled_idle': 0,
+            'recycled_errors': 0,
+        }
+
+    def _create_session(self):
+        """Создание сессии с пулом соединений нужного размера"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        self._stats['sessions_created'] += 1
+        return session
+
+    def _close_session(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def get_session(self):
+        """Получение сессии; простаивающий пул пересоздается"""
+        with self._lock:
+            now = time.monotonic()
+            if (self._session is not None and self._last_used is not None
+                    and now - self._last_used > self.idle_timeout):
+                logger.info(f"Pool for {self.service_name} idle for {now - self._last_used:.0f}s, recycling")
+                self._close_session()
+                self._stats['recycled_idle'] += 1
+
+            if self._session is None:
+                self._session = self._create_session()
+
+            self._last_used = now
+            self._stats['requests'] += 1
+            return self._session
+
+    def request(self, method, url, **kwargs):
+        """Выполнение запроса через пул"""
+        session = self.get_session()
+        try:
+            response = session.request(method=method, url=url, **kwargs)
+        except requests.exceptions.ConnectionError:
+            self._record_error()
+            raise
+
+        with self._lock:
+            self._consecutive_errors = 0
+        return response
+
+    def _record_error(self):
+        """Учет ошибки соединения; после серии ошибок пул пересоздается"""
+        with self._lock:
+            self._stats['errors'] += 1
+            self._consecutive_errors += 1
+            if self._consecutive_errors >= self.max_errors:
+                logger.warning(
+                    f"Pool for {self.service_name}: {self._consecutive_errors} connection errors in a row, recycling"
+                )
+                self._close_session()
+                self._stats['recycled_errors'] += 1
+                self._consecutive_errors = 0
+
+    def metrics(self):
+        """Метрики пула для /health/"""
+        with self._lock:
+            data = dict(self._stats)
+            data['pool_maxsize'] = self.pool_maxsize
+            data['consecutive_errors'] = self._consecutive_errors
+            data['idle_seconds'] = (
+                round(time.monotonic() - self._last_used, 1) if self._last_used is not None else None
+            )
+
+            connections_opened = 0
+            idle_connections = 0
+            if self._session is not None:
+                for adapter in self._session.adapters.values():
+                    pools = adapter.poolmanager.pools
+                    for key in pools.keys():
+                        pool = pools.get(key)
+                        if pool is None:
+                            continue
+                        connections_opened += pool.num_connections
+                        idle_connections += pool.pool.qsize() if pool.pool else 0
+            data['connections_opened'] = connections_opened
+            data['idle_connections'] = idle_connections
+            return data
+
+    def close(self):
+        with self._lock:
+            self._close_session()
+
+
+class AsyncServicePool:
+    """Асинхронный пул keep-alive соединений к одному микросервису (httpx)"""
+
+    def __init__(self, service_name, pool_connections, pool_maxsize, idle_timeout, max_errors):
+        self.service_name = service_name
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self.max_errors = max_errors
+
+        self._client = None
+        self._loop = None
+        self._consecutive_errors = 0
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'clients_created': 0,
+            'recycled_errors': 0,
+        }
+
+    def _create_client(self):
+        # Как и в синхронном пуле, pool_maxsize ограничивает только keep-alive соединения
+        limits = httpx.Limits(
+            max_connections=None,
+            max_keepalive_connections=self.pool_maxsize,
+            keepalive_expiry=self.idle_timeout
+        )
+        self._stats['clients_created'] += 1
+        return httpx.AsyncClient(limits=limits)
+
+    def get_client(self):
+        """Клиент привязан к event loop, в котором создан"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop or self._client.is_closed:
+            self._client = self._create_client()
+            self._loop = loop
+        return self._client
+
+    async def request(self, method, url, stream=False, timeout=None, **kwargs):
+        """Выполнение запроса через пул; при stream=True тело читается вызывающим"""
+        client = self.get_client()
+        self._stats['requests'] += 1
+        upstream_request = client.build_request(method, url, timeout=timeout, **kwargs)
+        try:
+            response = await client.send(upstream_request, stream=stream)
+        except httpx.TransportError:
+            await self._record_error(client)
+            raise
+
+        self._consecutive_errors = 0
+        return response
+
+    async def _record_error(self, client):
+        """Учет ошибки соединения; после серии ошибок клиент пересоздается"""
+        self._stats['errors'] += 1
+        self._consecutive_errors += 1
+        if self._consecutive_errors >= self.max_errors and client is self._client:
+            logger.warning(
+                f"Async pool for {self.service_name}: {self._consecutive_errors} connection errors in a row, recycling"
+            )
+            self._client = None
+            self._stats['recycled_errors'] += 1
+            self._consecutive_errors = 0
+            await client.aclose()
+
+    def metrics(self):
+        data = dict(self._stats)
+        data['pool_maxsize'] = self.pool_maxsize
+        data['consecutive_errors'] = self._consecutive_errors
+        return data
+
+    async def close(self):
+        """Закрытие клиента и его соединений (в event loop, где клиент создан)"""
+        client, self._client = self._client, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+
+class UpstreamPoolManager:
+    """Реестр пулов соединений по микросервисам"""
+
+    def __init__(self, pool_class=ServicePool):
+        self.pool_class = pool_class
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def _pool_options(self, service_name):
+        config = getattr(settings, 'UPSTREAM_POOL', {})
+        options = {
+            'pool_connections': config.get('POOL_CONNECTIONS', 10),
+            'pool_maxsize': config.get('POOL_MAXSIZE', 20),
+            'idle_timeout': config.get('IDLE_TIMEOUT', 60),
+            'max_errors': config.get('MAX_ERRORS', 5),
+        }
+        overrides = config.get('SERVICES', {}).get(service_name, {})
+        for key, value in overrides.items():
+            options[key.lower()] = value
+        return options
+
+    def get_pool(self, service_name):
+        """Получение (или создание) пула для сервиса"""
+        pool = self._pools.get(service_name)
+        if pool is not None:
+            return pool
+
+        with self._lock:
+            pool = self._pools.get(service_name)
+            if pool is None:
+                pool = self.pool_class(service_name, **self._pool_options(service_name))
+                self._pools[service_name] = pool
+            return pool
+
+    def metrics(self):
+        return {name: pool.metrics() for name, pool in list(self._pools.items())}
+
+    def close_all(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+
+    async def aclose_all(self):
+        """Закрытие асинхронных пулов (при остановке ASGI сервера)"""
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            await pool.close()
+
+
+upstream_pools = UpstreamPoolManager()
+async_upstream_pools = UpstreamPoolManager(AsyncServicePool)
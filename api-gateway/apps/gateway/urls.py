@@ -1,22 +1,11 @@
 from django.urls import re_path
+from django.conf import settings
 from . import views
 
-# Все API запросы проксируем к соответствующим сервисам
-urlpatterns = [
-    # User service routes
-    re_path(r'^auth/.*', views.proxy_view, name='auth-proxy'),
-    re_path(r'^users/.*', views.proxy_view, name='users-proxy'),
-
-    # Product service routes
-    re_path(r'^products/.*', views.proxy_view, name='products-proxy'),
-    re_path(r'^categories/.*', views.proxy_view, name='categories-proxy'),
-
-    # Cart service routes
-    re_path(r'^cart/.*', views.proxy_view, name='cart-proxy'),
+# В режиме ASGI используется асинхронный прокси
+proxy_view = views.async_proxy_view if settings.GATEWAY_ASYNC else views.proxy_view
 
-    # Order service routes
-    re_path(r'^orders/.*', views.proxy_view, name='orders-proxy'),
-
-    # Currency service routes
-    re_path(r'^currency/.*', views.proxy_view, name='currency-proxy'),
-]
\ No newline at end of file
+# Все API запросы проксируем; сервис определяется по таблице маршрутов (config/routes.json)
+urlpatterns = [
+    re_path(r'^.*$', proxy_view, name='api-proxy'),
+]
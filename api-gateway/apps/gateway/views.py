@@ -1,64 +1,193 @@
+import asyncio
+import time
 import requests
-import json
+import httpx
 import logging
-from django.http import JsonResponse, HttpResponse
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 from django.utils.decorators import method_decorator
 from django.views import View
 
+from .balancer import load_balancer
+from .cache import response_cache
+from .identity import gateway_authenticator, IDENTITY_HEADER
+from .resilience import upstream_guards, CircuitOpenError, BulkheadFullError
+from .routing import route_table
+from .singleflight import single_flight, async_single_flight, distributed_flight
+from .transport import upstream_pools, async_upstream_pools
+
 logger = logging.getLogger(__name__)
 
+# Запросы, которые можно безопасно повторить при ошибке соединения
+RETRYABLE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Ответы, которые считаются сбоем экземпляра при пассивной проверке здоровья
+UNHEALTHY_STATUSES = (502, 503, 504)
+
+
+class ClosingStream:
+    """
+    Тело потокового ответа. Django вызывает close() после отправки ответа или при обрыве
+    соединения (даже если тело не читалось): закрываем ответ сервиса и освобождаем слот bulkhead.
+    """
+
+    def __init__(self, chunks, *on_close):
+        self.chunks = chunks
+        self.on_close = on_close
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            close = getattr(self.chunks, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            for callback in self.on_close:
+                callback()
+
+
+class AsyncClosingStream(ClosingStream):
+    """
+    Асинхронное тело потокового ответа. Django вызывает close() из потока, а генератор,
+    который не начинали читать, свой finally не выполнит: ответ сервиса закрывается здесь,
+    в event loop, где он создан, иначе соединение так и останется занятым в пуле.
+    """
+
+    def __init__(self, chunks, upstream_response, *on_close):
+        super().__init__(chunks, *on_close)
+        self.upstream_response = upstream_response
+        self.loop = asyncio.get_running_loop()
+
+    def __aiter__(self):
+        return aiter(self.chunks)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.close_upstream()
+        finally:
+            for callback in self.on_close:
+                callback()
+
+    def close_upstream(self):
+        if self.upstream_response.is_closed or self.loop.is_closed():
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            self.loop.create_task(self.upstream_response.aclose())
+        else:
+            asyncio.run_coroutine_threadsafe(self.upstream_response.aclose(), self.loop)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ProxyView(View):
     """Базовый класс для проксирования запросов к микросервисам"""
 
     def dispatch(self, request, *args, **kwargs):
+        target = self.resolve_target(request)
+        if isinstance(target, HttpResponse):
+            return target
+
+        service_name, target_path = target
+
+        # Публичные GET ответы отдаем из кэша шлюза
+        if response_cache.is_cacheable_request(request):
+            return self.cached_proxy_request(request, target_path, service_name)
+
+        # Проксируем запрос
+        response = self.proxy_request(request, target_path, service_name)
+        response_cache.purge_for_write(request, response)
+        return response
+
+    def cached_proxy_request(self, request, target_path, service_name):
+        """Проксирование через кэш ответов шлюза"""
+        key, entry = response_cache.lookup(request)
+        if entry is not None:
+            return response_cache.build_response(request, entry, 'HIT')
+
+        if key is None:
+            # Общий кэш недоступен - обычное проксирование
+            response = self.proxy_request(request, target_path, service_name)
+            response['X-Cache'] = 'BYPASS'
+            return response
+
+        # Одинаковые одновременные промахи объединяем в один запрос к сервису
+        fetch = lambda: self.fetch_entry(request, key, target_path, service_name)
+        config = settings.GATEWAY_SINGLE_FLIGHT
+        if config.get('ENABLED', True):
+            entry, leader = single_flight.do(key, fetch, config.get('WAIT_TIMEOUT', 30))
+        else:
+            entry, leader = fetch(), True
+        return response_cache.build_response(request, entry, self.get_cache_status(entry, leader))
+
+    def fetch_entry(self, request, key, target_path, service_name):
+        """Запрос к сервису и сохранение ответа; между процессами - под блокировкой в Redis"""
+        def fetch():
+            # Кэшируемый ответ читаем целиком, чтобы сохранить его
+            response = self.proxy_request(request, target_path, service_name, stream=False)
+            return self.store_entry(request, key, response)
+
+        if distributed_flight.enabled:
+            return distributed_flight.run(key, fetch, lambda: response_cache.get(key))
+        return fetch()
+
+    def store_entry(self, request, key, response):
+        """Сохранение ответа; некэшируемый ответ возвращается как запись для объединенных запросов"""
+        return response_cache.store(key, request, response) or response_cache.snapshot(response)
+
+    def get_cache_status(self, entry, leader):
+        """Значение X-Cache для ответа, полученного от сервиса"""
+        if not entry.is_fresh():
+            return 'BYPASS'
+        return 'MISS' if leader else 'COALESCED'
+
+    def resolve_target(self, request):
+        """Определение целевого сервиса и пути; при ошибке возвращает готовый ответ"""
         # Логируем запрос
         logger.info(f"Gateway request: {request.method} {request.path}")
         logger.info(f"Headers: {dict(request.headers)}")
-        logger.info(f"Body: {request.body.decode('utf-8') if request.body else 'No body'}")
+        logger.info(f"Body size: {request.headers.get('Content-Length', 0)} bytes")
 
         # Определяем целевой сервис
-        service_name = self.get_service_name(request)
+        self.route = self.get_route(request)
+        service_name = self.route.service if self.route else None
         if not service_name:
             logger.error(f"Service not found for path: {request.path}")
             return JsonResponse({'error': 'Service not found'}, status=404)
 
-        # Получаем URL сервиса
-        service_url = settings.MICROSERVICES.get(service_name)
-        if not service_url:
+        # Проверяем, что для сервиса настроены экземпляры
+        if load_balancer.get(service_name) is None:
             logger.error(f"Service {service_name} not configured")
             return JsonResponse({'error': f'Service {service_name} not configured'}, status=500)
 
-        # Формируем целевой URL
+        # Формируем целевой путь; экземпляр сервиса выбирается при отправке запроса
         target_path = self.get_target_path(request)
-        target_url = f"{service_url}{target_path}"
 
-        logger.info(f"Proxying to: {target_url}")
+        logger.info(f"Proxying to: {service_name}{target_path}")
 
-        # Проксируем запрос
-        return self.proxy_request(request, target_url)
+        return service_name, target_path
+
+    def get_route(self, request):
+        """Маршрут из таблицы маршрутов шлюза"""
+        return route_table.resolve(request.path)
 
     def get_service_name(self, request):
         """Определение сервиса по URL"""
-        path = request.path
-
-        if path.startswith('/api/auth/') or path.startswith('/api/users/'):
-            return 'user-service'
-        elif path.startswith('/api/products/') or path.startswith('/api/categories/'):
-            return 'product-service'
-        elif path.startswith('/api/cart/'):
-            return 'cart-service'
-        elif path.startswith('/api/orders/'):
-            return 'order-service'
-        elif path.startswith('/api/discounts/'):
-            return 'discount-service'
-        elif path.startswith('/api/currency/'):
-            return 'currency-service'
-
-        return None
+        route = self.get_route(request)
+        return route.service if route else None
 
     def get_target_path(self, request):
         """Формирование пути для целевого сервиса"""
@@ -68,87 +197,345 @@ class ProxyView(View):
             return path  # Оставляем как есть
         return path
 
-    def proxy_request(self, request, target_url):
-        """Проксирование HTTP запроса"""
+    def get_upstream_headers(self, request):
+        """Заголовки, передаваемые в целевой сервис"""
+        headers = {}
+
+        # Копируем важные заголовки
+        important_headers = [
+            'Authorization', 'Content-Type', 'Accept', 'User-Agent',
+            'Accept-Language', 'Accept-Encoding'
+        ]
+
+        for header_name in important_headers:
+            header_value = request.headers.get(header_name)
+            if header_value:
+                headers[header_name] = header_value
+
+        # Токен проверяется здесь; сервисы доверяют подписанному заголовку без разбора JWT.
+        # Присланный клиентом X-Identity не копируется никогда
+        identity = gateway_authenticator.get_identity_header(request)
+        if identity:
+            headers[IDENTITY_HEADER] = identity
+
+        return headers
+
+    def copy_response_headers(self, upstream_response, django_response):
+        """Копирование важных заголовков ответа"""
+        response_headers_to_copy = ['Content-Type', 'Cache-Control', 'ETag', 'Retry-After']
+        for key in response_headers_to_copy:
+            if key in upstream_response.headers:
+                django_response[key] = upstream_response.headers[key]
+        return django_response
+
+    def stream_upstream_body(self, upstream_response, target_url):
+        """Передача тела ответа клиенту по частям; соединение возвращается в пул по завершении"""
         try:
-            # Подготавливаем headers
-            headers = {}
+            for chunk in upstream_response.iter_content(chunk_size=settings.GATEWAY_STREAM_CHUNK_SIZE):
+                if chunk:
+                    yield chunk
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Upstream stream from {target_url} interrupted: {e}")
+        finally:
+            upstream_response.close()
 
-            # Копируем важные заголовки
-            important_headers = [
-                'Authorization', 'Content-Type', 'Accept', 'User-Agent',
-                'Accept-Language', 'Accept-Encoding'
-            ]
+    def rejected_response(self, error):
+        """Немедленный отказ без обращения к сервису (разомкнут breaker или переполнен bulkhead)"""
+        logger.warning(f"Request rejected: {error}")
+        if isinstance(error, CircuitOpenError):
+            response = JsonResponse({'error': 'Service unavailable', 'reason': 'circuit_open'}, status=503)
+            response['Retry-After'] = str(max(1, error.retry_after))
+            return response
+        return JsonResponse({'error': 'Service overloaded', 'reason': 'too_many_requests'}, status=503)
 
-            for header_name in important_headers:
-                header_value = request.headers.get(header_name)
-                if header_value:
-                    headers[header_name] = header_value
+    def get_attempts(self, request):
+        """Число попыток запроса к сервису по политике маршрута"""
+        if request.method in RETRYABLE_METHODS:
+            return 1 + self.route.retries
+        return 1
 
-            # Логируем заголовки для отладки
-            logger.info(f"Forwarding headers: {headers}")
+    def send_upstream(self, request, service_name, path, **kwargs):
+        """
+        Запрос к сервису через bulkhead и circuit breaker: при сбоях сервиса отказываем сразу.
+        Возвращает (ответ, освобождение слота bulkhead): потоковый ответ держит слот до закрытия потока.
+        """
+        breaker, bulkhead = upstream_guards.get(service_name)
+        release_slot = bulkhead.acquire()
+        try:
+            breaker.before_call()
+            started = time.monotonic()
+            try:
+                response = self.send_balanced(request, service_name, path, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                breaker.record(False, time.monotonic() - started)
+                raise
+            except BaseException:
+                breaker.cancel()
+                raise
+            breaker.record(response.status_code not in UNHEALTHY_STATUSES, time.monotonic() - started)
+        except BaseException:
+            release_slot()
+            raise
+        if not kwargs.get('stream'):
+            release_slot()
+        return response, release_slot
 
-            # Подготавливаем данные
-            data = None
-            json_data = None
+    def send_balanced(self, request, service_name, path, **kwargs):
+        """Запрос к экземпляру сервиса; безопасные запросы при ошибке повторяются на другом экземпляре"""
+        balancer = load_balancer.get(service_name)
+        attempts = self.get_attempts(request)
+        tried = []
+        for attempt in range(1, attempts + 1):
+            instance = balancer.choose(exclude=tried)
+            tried.append(instance)
+            started = time.monotonic()
+            try:
+                response = upstream_pools.get_pool(service_name).request(url=f"{instance.url}{path}", **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                balancer.release(instance, time.monotonic() - started, failed=True)
+                if attempt == attempts:
+                    raise
+                logger.warning(f"Retrying {kwargs['method']} {service_name}{path} ({attempt}/{attempts - 1}): {e}")
+                continue
 
-            if request.method in ['POST', 'PUT', 'PATCH']:
-                content_type = request.headers.get('Content-Type', '')
+            # Для потокового ответа учитывается время до получения заголовков
+            balancer.release(instance, time.monotonic() - started,
+                             failed=response.status_code in UNHEALTHY_STATUSES)
+            return response
 
-                if 'application/json' in content_type:
-                    try:
-                        if request.body:
-                            json_data = json.loads(request.body.decode('utf-8'))
-                            logger.info(f"JSON data: {json_data}")
-                    except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                        logger.error(f"Failed to parse JSON: {e}")
-                        data = request.body
-                else:
-                    data = request.body
+    def proxy_request(self, request, target_path, service_name, stream=None):
+        """Проксирование HTTP запроса"""
+        try:
+            headers = self.get_upstream_headers(request)
+
+            # Логируем заголовки для отладки
+            logger.info(f"Forwarding headers: {headers}")
+
+            # Тело запроса передаем как есть, без разбора JSON
+            data = request.body or None
 
             # Добавляем query parameters
             params = dict(request.GET.items())
             if params:
                 logger.info(f"Query params: {params}")
 
-            # Выполняем запрос
-            response = requests.request(
+            if stream is None:
+                stream = settings.GATEWAY_STREAM_RESPONSES
+
+            # Выполняем запрос через пул keep-alive соединений сервиса
+            response, release_slot = self.send_upstream(
+                request,
+                service_name,
                 method=request.method,
-                url=target_url,
+                path=target_path,
                 headers=headers,
-                json=json_data,
-                data=data if json_data is None else None,
+                data=data,
                 params=params,
-                timeout=30
+                timeout=self.route.timeout,
+                stream=stream
             )
 
             logger.info(f"Response status: {response.status_code}")
-            logger.info(f"Response content: {response.text[:200]}...")  # Логируем первые 200 символов
 
-            # Возвращаем ответ
-            django_response = HttpResponse(
-                response.content,
-                status=response.status_code,
-                content_type=response.headers.get('content-type', 'application/json')
-            )
+            content_type = response.headers.get('content-type', 'application/json')
 
-            # Копируем важные заголовки ответа
-            response_headers_to_copy = ['Content-Type', 'Cache-Control', 'ETag']
-            for key in response_headers_to_copy:
-                if key in response.headers:
-                    django_response[key] = response.headers[key]
+            if stream:
+                # Возвращаем ответ потоком, не буферизуя тело в памяти шлюза;
+                # слот bulkhead освобождается при закрытии потока
+                body = self.stream_upstream_body(response, f"{service_name}{target_path}")
+                django_response = StreamingHttpResponse(
+                    ClosingStream(body, response.close, release_slot),
+                    status=response.status_code,
+                    content_type=content_type
+                )
+            else:
+                django_response = HttpResponse(
+                    response.content,
+                    status=response.status_code,
+                    content_type=content_type
+                )
 
-            return django_response
+            return self.copy_response_headers(response, django_response)
 
+        except (CircuitOpenError, BulkheadFullError) as e:
+            return self.rejected_response(e)
         except requests.exceptions.Timeout:
-            logger.error(f"Timeout when calling {target_url}")
+            logger.error(f"Timeout when calling {service_name}{target_path}")
             return JsonResponse({'error': 'Service timeout'}, status=504)
         except requests.exceptions.ConnectionError as e:
-            logger.error(f"Connection error when calling {target_url}: {e}")
+            logger.error(f"Connection error when calling {service_name}{target_path}: {e}")
+            return JsonResponse({'error': 'Service unavailable'}, status=503)
+        except Exception as e:
+            logger.error(f"Error proxying request to {service_name}{target_path}: {e}")
+            return JsonResponse({'error': 'Internal server error'}, status=500)
+
+class AsyncProxyView(ProxyView):
+    """Асинхронное проксирование запросов (ASGI) через неблокирующий HTTP клиент"""
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        target = self.resolve_target(request)
+        if isinstance(target, HttpResponse):
+            return target
+
+        service_name, target_path = target
+
+        if response_cache.is_cacheable_request(request):
+            return await self.cached_proxy_request(request, target_path, service_name)
+
+        response = await self.proxy_request(request, target_path, service_name)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            await sync_to_async(response_cache.purge_for_write, thread_sensitive=False)(request, response)
+        return response
+
+    async def cached_proxy_request(self, request, target_path, service_name):
+        """Асинхронное проксирование через кэш; в общий кэш ходим только при промахе локального"""
+        key, entry = response_cache.lookup(request, shared=False)
+        if entry is None:
+            key, entry = await sync_to_async(response_cache.lookup, thread_sensitive=False)(request)
+        if entry is not None:
+            return response_cache.build_response(request, entry, 'HIT')
+
+        if key is None:
+            response = await self.proxy_request(request, target_path, service_name)
+            response['X-Cache'] = 'BYPASS'
+            return response
+
+        fetch = lambda: self.fetch_entry(request, key, target_path, service_name)
+        config = settings.GATEWAY_SINGLE_FLIGHT
+        if config.get('ENABLED', True):
+            entry, leader = await async_single_flight.do(key, fetch, config.get('WAIT_TIMEOUT', 30))
+        else:
+            entry, leader = await fetch(), True
+        return response_cache.build_response(request, entry, self.get_cache_status(entry, leader))
+
+    async def fetch_entry(self, request, key, target_path, service_name):
+        """Асинхронный запрос к сервису и сохранение ответа"""
+        async def fetch():
+            response = await self.proxy_request(request, target_path, service_name, stream=False)
+            return await sync_to_async(self.store_entry, thread_sensitive=False)(request, key, response)
+
+        if distributed_flight.enabled:
+            return await distributed_flight.arun(key, fetch, lambda: response_cache.get(key))
+        return await fetch()
+
+    async def stream_upstream_body(self, upstream_response, target_url):
+        """Асинхронная передача тела ответа клиенту по частям"""
+        try:
+            async for chunk in upstream_response.aiter_bytes(chunk_size=settings.GATEWAY_STREAM_CHUNK_SIZE):
+                if chunk:
+                    yield chunk
+        except httpx.HTTPError as e:
+            logger.error(f"Upstream stream from {target_url} interrupted: {e}")
+        finally:
+            await upstream_response.aclose()
+
+    async def send_upstream(self, request, service_name, path, **kwargs):
+        """Асинхронный запрос к сервису через bulkhead и circuit breaker; возвращает (ответ, освобождение слота)"""
+        breaker, bulkhead = upstream_guards.get(service_name)
+        release_slot = bulkhead.acquire()
+        try:
+            breaker.before_call()
+            started = time.monotonic()
+            try:
+                response = await self.send_balanced(request, service_name, path, **kwargs)
+            except (httpx.TimeoutException, httpx.TransportError):
+                breaker.record(False, time.monotonic() - started)
+                raise
+            except BaseException:
+                breaker.cancel()
+                raise
+            breaker.record(response.status_code not in UNHEALTHY_STATUSES, time.monotonic() - started)
+        except BaseException:
+            release_slot()
+            raise
+        if not kwargs.get('stream'):
+            release_slot()
+        return response, release_slot
+
+    async def send_balanced(self, request, service_name, path, **kwargs):
+        """Асинхронный запрос к экземпляру сервиса с повторами безопасных запросов"""
+        balancer = load_balancer.get(service_name)
+        attempts = self.get_attempts(request)
+        tried = []
+        for attempt in range(1, attempts + 1):
+            instance = balancer.choose(exclude=tried)
+            tried.append(instance)
+            started = time.monotonic()
+            try:
+                response = await async_upstream_pools.get_pool(service_name).request(
+                    url=f"{instance.url}{path}", **kwargs
+                )
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                balancer.release(instance, time.monotonic() - started, failed=True)
+                if attempt == attempts:
+                    raise
+                logger.warning(f"Retrying {kwargs['method']} {service_name}{path} ({attempt}/{attempts - 1}): {e}")
+                continue
+
+            balancer.release(instance, time.monotonic() - started,
+                             failed=response.status_code in UNHEALTHY_STATUSES)
+            return response
+
+    async def proxy_request(self, request, target_path, service_name, stream=None):
+        """Асинхронное проксирование HTTP запроса"""
+        try:
+            headers = self.get_upstream_headers(request)
+            logger.info(f"Forwarding headers: {headers}")
+
+            params = dict(request.GET.items())
+            if params:
+                logger.info(f"Query params: {params}")
+
+            if stream is None:
+                stream = settings.GATEWAY_STREAM_RESPONSES
+
+            # Выполняем запрос через общий асинхронный пул соединений
+            response, release_slot = await self.send_upstream(
+                request,
+                service_name,
+                method=request.method,
+                path=target_path,
+                headers=headers,
+                content=request.body or None,
+                params=params,
+                timeout=self.route.timeout,
+                stream=stream
+            )
+
+            logger.info(f"Response status: {response.status_code}")
+
+            content_type = response.headers.get('content-type', 'application/json')
+
+            if stream:
+                body = self.stream_upstream_body(response, f"{service_name}{target_path}")
+                django_response = StreamingHttpResponse(
+                    AsyncClosingStream(body, response, release_slot),
+                    status=response.status_code,
+                    content_type=content_type
+                )
+            else:
+                django_response = HttpResponse(
+                    response.content,
+                    status=response.status_code,
+                    content_type=content_type
+                )
+
+            return self.copy_response_headers(response, django_response)
+
+        except (CircuitOpenError, BulkheadFullError) as e:
+            return self.rejected_response(e)
+        except httpx.TimeoutException:
+            logger.error(f"Timeout when calling {service_name}{target_path}")
+            return JsonResponse({'error': 'Service timeout'}, status=504)
+        except httpx.TransportError as e:
+            logger.error(f"Connection error when calling {service_name}{target_path}: {e}")
             return JsonResponse({'error': 'Service unavailable'}, status=503)
         except Exception as e:
-            logger.error(f"Error proxying request to {target_url}: {e}")
+            logger.error(f"Error proxying request to {service_name}{target_path}: {e}")
             return JsonResponse({'error': 'Internal server error'}, status=500)
 
 # Создаем экземпляр для всех API запросов
-proxy_view = ProxyView.as_view()
\ No newline at end of file
+proxy_view = ProxyView.as_view()
+async_proxy_view = AsyncProxyView.as_view()
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+Нагрузочный тест шлюза: N одновременных клиентов в течение заданного времени.
+
+    python benchmarks/load_test.py --url http://localhost:8000/api/orders/ --concurrency 500 --duration 20
+
+Выводит пропускную способность, распределение задержек и число ошибок.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+# Клиент HTTP/1.1 на asyncio: на одном ядре httpx тратит на запрос больше процессора, чем
+# измеряемый шлюз, и генератор нагрузки сам становится узким местом
+async def read_response(reader):
+    """Чтение ответа; возвращает (статус, можно ли переиспользовать соединение)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.split(b'\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if b':' in line:
+            name, value = line.split(b':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+
+    if b'content-length' in headers:
+        await reader.readexactly(int(headers[b'content-length']))
+    elif headers.get(b'transfer-encoding') == b'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        # Тело до закрытия соединения
+        await reader.read()
+        return status, False
+    return status, headers.get(b'connection') != b'close'
+
+
+async def worker(url, deadline, timeout, latencies, errors):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else '')
+    request = (f"GET {path or '/'} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+               f"Accept: application/json\r\n\r\n").encode()
+    connection = None
+
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            if connection is None:
+                connection = await asyncio.wait_for(
+                    asyncio.open_connection(parts.hostname, parts.port or 80), timeout
+                )
+            reader, writer = connection
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+            if status >= 500:
+                errors[status] = errors.get(status, 0) + 1
+            else:
+                latencies.append(time.monotonic() - started)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            name = type(e).__name__
+            errors[name] = errors.get(name, 0) + 1
+            keep_alive = False
+
+        if not keep_alive and connection is not None:
+            connection[1].close()
+            connection = None
+
+    if connection is not None:
+        connection[1].close()
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(url, concurrency, duration, timeout):
+    latencies = []
+    errors = {}
+
+    started = time.monotonic()
+    deadline = started + duration
+    await asyncio.gather(*(
+        worker(url, deadline, timeout, latencies, errors) for _ in range(concurrency)
+    ))
+    elapsed = time.monotonic() - started
+
+    print(f"URL:          {url}")
+    print(f"Concurrency:  {concurrency}")
+    print(f"Duration:     {elapsed:.1f}s")
+    print(f"Requests OK:  {len(latencies)}")
+    print(f"Throughput:   {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(f"Latency mean: {statistics.mean(latencies) * 1000:.1f} ms")
+        for q in (50, 95, 99):
+            print(f"Latency p{q}:  {percentile(latencies, q) * 1000:.1f} ms")
+    print(f"Errors:       {errors or 0}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест API Gateway')
+    parser.add_argument('--url', default='http://localhost:8000/api/orders/')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.concurrency, args.duration, args.timeout))
+
+
+if __name__ == '__main__':
+    main()
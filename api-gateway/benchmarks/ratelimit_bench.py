@@ -0,0 +1,71 @@
+"""
+Сравнение пропускной способности лимитера: Redis на каждый запрос и аренда разрешений.
+
+    REDIS_HOST=localhost python benchmarks/ratelimit_bench.py --requests 20000 --threads 8 --clients 50
+
+Запускается из каталога api-gateway, нужен доступный Redis. Бенчмарк работает в отдельной
+БД Redis (--redis-db, по умолчанию 15) и очищает только ее.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+import redis  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+
+from apps.gateway.ratelimit import LeasedRateLimiter  # noqa: E402
+
+
+def run(limiter, requests, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(limiter.check, requests))
+    elapsed = time.perf_counter() - started
+    allowed = sum(1 for result in results if result.allowed)
+    return len(requests) / elapsed, allowed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк лимитера частоты запросов')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=50, help='Число разных IP')
+    parser.add_argument('--algorithm', default='token_bucket', choices=['token_bucket', 'sliding_window'])
+    parser.add_argument('--redis-db', type=int, default=15, help='Отдельная БД Redis, очищается перед каждым режимом')
+    args = parser.parse_args()
+
+    factory = RequestFactory()
+    requests = [
+        factory.get('/api/products/', REMOTE_ADDR=f"10.0.{i % args.clients // 250}.{i % args.clients % 250}")
+        for i in range(args.requests)
+    ]
+
+    policy = {'algorithm': args.algorithm, 'limit': 10 ** 9, 'window': 60, 'key': 'ip'}
+    if args.redis_db == redis.Redis.from_url(settings.RATE_LIMIT_REDIS_URL).connection_pool.connection_kwargs['db']:
+        parser.error('--redis-db совпадает с БД лимитера шлюза, выберите другую')
+    client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=args.redis_db)
+
+    print(f"Redis: {settings.REDIS_HOST}:{settings.REDIS_PORT}/{args.redis_db}, algorithm: {args.algorithm}, "
+          f"{args.requests} requests, {args.threads} threads, {args.clients} clients")
+
+    for mode, enabled in (('redis per request', False), ('leased', True)):
+        lease = dict(settings.RATE_LIMIT_LEASE, ENABLED=enabled)
+        with override_settings(RATE_LIMIT_POLICIES=[], RATE_LIMIT_DEFAULT_POLICY=policy, RATE_LIMIT_LEASE=lease):
+            limiter = LeasedRateLimiter(client)
+            client.flushdb()
+            throughput, allowed = run(limiter, requests, args.threads)
+        print(f"{mode:>20}: {throughput:10.0f} req/s ({allowed} allowed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""
+Настройки шлюза для нагрузочного теста: лимитер, bulkhead и проверка токенов
+не отсекают нагрузку, измеряется только проксирование.
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings python manage.py runserver 8000 --noreload
+"""
+from config.settings import *
+
+DEBUG = False
+
+RATE_LIMIT_REQUESTS_PER_MINUTE = 10 ** 9
+RATE_LIMIT_DEFAULT_POLICY = dict(RATE_LIMIT_DEFAULT_POLICY, limit=RATE_LIMIT_REQUESTS_PER_MINUTE)
+
+UPSTREAM_RESILIENCE = dict(UPSTREAM_RESILIENCE, BULKHEAD={'MAX_CONCURRENT': 10000}, SERVICES={})
+
+GATEWAY_AUTH = dict(GATEWAY_AUTH, ENABLED=False)
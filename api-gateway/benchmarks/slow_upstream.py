@@ -0,0 +1,55 @@
+"""
+Имитация медленного микросервиса для нагрузочного теста шлюза.
+
+Отвечает на любой запрос JSON-ом после задержки --delay секунд.
+
+    python benchmarks/slow_upstream.py --port 8003 --delay 0.5
+"""
+import argparse
+import asyncio
+
+
+async def handle(reader, writer, delay):
+    try:
+        while True:
+            # Читаем заголовки запроса
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in head.split(b'\r\n'):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':', 1)[1])
+            if length:
+                await reader.readexactly(length)
+
+            await asyncio.sleep(delay)
+
+            body = b'{"status": "ok"}'
+            writer.write(
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: application/json\r\n'
+                b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                b'Connection: keep-alive\r\n\r\n' + body
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Медленный upstream для нагрузочного теста')
+    parser.add_argument('--port', type=int, default=8003)
+    parser.add_argument('--delay', type=float, default=0.5)
+    args = parser.parse_args()
+
+    server = await asyncio.start_server(
+        lambda r, w: handle(r, w, args.delay), '0.0.0.0', args.port, backlog=4096
+    )
+    print(f"Slow upstream on :{args.port}, delay {args.delay}s")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -8,11 +8,8 @@ DEBUG = os.environ.get('DEBUG', 'True') == 'True'
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0', 'api-gateway', '*']
 
 DJANGO_APPS = [
-     'django.contrib.admin',
      'django.contrib.auth',
      'django.contrib.contenttypes',
-     'django.contrib.sessions',
-     'django.contrib.messages',
     'django.contrib.staticfiles',
 ]
 THIRD_PARTY_APPS = [
@@ -26,15 +23,13 @@ LOCAL_APPS = [
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
+# Шлюз - stateless прокси без БД: сессии, CSRF, пользователи Django и сообщения ему не нужны.
+# Синхронные middleware (MiddlewareMixin) в ASGI выполняются в единственном потоке
+# thread_sensitive и выстраивают запросы в очередь, поэтому их набор минимален
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'apps.gateway.middleware.RateLimitMiddleware',
 ]
 
@@ -50,7 +45,6 @@ TEMPLATES = [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
             ],
         },
     },
@@ -84,7 +78,7 @@ USE_TZ = True
 STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Service URLs
+# Service URLs (несколько экземпляров сервиса - через запятую)
 MICROSERVICES = {
     'user-service': os.environ.get('USER_SERVICE_URL', 'http://localhost:8004'),
     'product-service': os.environ.get('PRODUCT_SERVICE_URL', 'http://localhost:8001'),
@@ -94,13 +88,142 @@ MICROSERVICES = {
     'currency-service': os.environ.get('CURRENCY_SERVICE_URL', 'http://localhost:8006'),
 }
 
+# Балансировка между экземплярами сервисов
+UPSTREAM_BALANCER = {
+    'STRATEGY': os.environ.get('UPSTREAM_BALANCER_STRATEGY', 'least_outstanding'),  # или 'ewma'
+    'EWMA_ALPHA': 0.3,  # Вес последнего замера задержки
+    'MAX_FAILURES': 3,  # Ошибок подряд до исключения экземпляра (пассивная проверка)
+    'EJECT_TIME': 10,  # Секунд исключения; растет при повторных исключениях
+    'MAX_EJECT_TIME': 120,
+    'HEALTH_CHECK_INTERVAL': int(os.environ.get('UPSTREAM_HEALTH_CHECK_INTERVAL', 10)),  # 0 - без активной проверки
+    'HEALTH_CHECK_PATH': '/health/',
+    'HEALTH_CHECK_TIMEOUT': 2,
+}
+
+# Таблица маршрутов шлюза (префикс -> сервис, таймаут, повторы, кэш);
+# файл перечитывается без перезапуска, если изменился
+GATEWAY_ROUTES_FILE = os.environ.get('GATEWAY_ROUTES_FILE', str(BASE_DIR / 'config' / 'routes.json'))
+GATEWAY_ROUTES_RELOAD_INTERVAL = 5  # Секунд между проверками файла
+
+# Пулы keep-alive соединений к микросервисам
+UPSTREAM_POOL = {
+    'POOL_CONNECTIONS': 10,  # Количество хостов в кэше адаптера
+    'POOL_MAXSIZE': int(os.environ.get('UPSTREAM_POOL_MAXSIZE', 20)),  # Соединений на хост
+    'IDLE_TIMEOUT': int(os.environ.get('UPSTREAM_POOL_IDLE_TIMEOUT', 60)),  # Секунд простоя до пересоздания
+    'MAX_ERRORS': 5,  # Ошибок соединения подряд до пересоздания пула
+    'SERVICES': {
+        'product-service': {'POOL_MAXSIZE': int(os.environ.get('PRODUCT_SERVICE_POOL_MAXSIZE', 50))},
+    },
+}
+
+# Асинхронный режим шлюза (ASGI + httpx), запуск через uvicorn config.asgi:application
+GATEWAY_ASYNC = os.environ.get('GATEWAY_ASYNC', 'False') == 'True'
+
+# Потоковая передача ответов микросервисов клиенту
+GATEWAY_STREAM_RESPONSES = os.environ.get('GATEWAY_STREAM_RESPONSES', 'True') == 'True'
+GATEWAY_STREAM_CHUNK_SIZE = 64 * 1024
+
 # Redis configuration
+REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-        'LOCATION': f"redis://{os.environ.get('REDIS_HOST', 'localhost')}:{os.environ.get('REDIS_PORT', '6379')}/0",
+        'LOCATION': f"redis://{REDIS_HOST}:{REDIS_PORT}/0",
     }
 }
 
 # Rate limiting settings
-RATE_LIMIT_REQUESTS_PER_MINUTE = 1000  # Увеличено для разработки
\ No newline at end of file
+RATE_LIMIT_REQUESTS_PER_MINUTE = 1000  # Увеличено для разработки
+RATE_LIMIT_REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
+
+# Локальный уровень лимитера: разрешения арендуются у Redis пачками
+RATE_LIMIT_LEASE = {
+    'ENABLED': os.environ.get('RATE_LIMIT_LEASE_ENABLED', 'True') == 'True',
+    'MAX_SIZE': 20,  # Максимум разрешений в одной аренде (и не больше limit / window * TTL)
+    'MIN_SIZE': 2,  # Политики с меньшей долей лимита на TTL проверяются в Redis на каждый запрос
+    'TTL': 1.0,  # Секунд, в течение которых аренда расходуется локально
+    'WAIT_TIMEOUT': 1.0,  # Секунд ожидания пачки, запрошенной другим потоком, затем - прямая проверка в Redis
+    'REFILL_THRESHOLD': 0.25,  # Доля остатка, при которой следующая пачка подгружается в фоне
+    'MAX_ENTRIES': 10000,  # Клиентов в локальной таблице
+}
+
+# Политика по умолчанию: скользящее окно по IP
+RATE_LIMIT_DEFAULT_POLICY = {
+    'algorithm': 'sliding_window',
+    'limit': RATE_LIMIT_REQUESTS_PER_MINUTE,
+    'window': 60,
+    'key': 'ip',
+}
+
+# Политики для отдельных маршрутов (применяется первая подходящая по префиксу)
+RATE_LIMIT_POLICIES = [
+    {'name': 'auth', 'prefix': '/api/auth/', 'algorithm': 'sliding_window', 'limit': 30, 'window': 60, 'key': 'ip'},
+    {'name': 'orders-write', 'prefix': '/api/orders/', 'methods': ['POST', 'PUT'],
+     'algorithm': 'token_bucket', 'limit': 60, 'window': 60, 'key': 'user'},
+    {'name': 'cart', 'prefix': '/api/cart/', 'algorithm': 'token_bucket', 'limit': 300, 'window': 60, 'key': 'user'},
+]
+# Кэш GET ответов публичных маршрутов: локальный LRU процесса + общий кэш (CACHES)
+GATEWAY_CACHE = {
+    'ENABLED': os.environ.get('GATEWAY_CACHE_ENABLED', 'True') == 'True',
+    'ALIAS': 'default',
+    'LOCAL_TTL': 5,  # Секунд жизни локальной копии (на случай потерянного события сброса)
+    'LOCAL_MAX_ENTRIES': 1000,
+    'MAX_BODY_SIZE': 1024 * 1024,  # Ответы больше не кэшируются
+    'EVENTS_REDIS_URL': f"redis://{REDIS_HOST}:{REDIS_PORT}/0",
+    'LISTEN_EVENTS': True,
+    # Кэшируются маршруты с полем "cache" (TTL по умолчанию) в таблице маршрутов
+    # Событие -> сбрасываемые маршруты (только события, которые публикуют сервисы)
+    'PURGE_EVENTS': {
+        'product.created': ['/api/products/', '/api/categories/'],
+        'product.updated': ['/api/products/', '/api/categories/'],
+        'product.deleted': ['/api/products/', '/api/categories/'],
+        'product.stock_changed': ['/api/products/'],
+        'order.created': ['/api/products/'],
+        'order.cancelled': ['/api/products/'],
+        'discount.activated': ['/api/products/'],
+        'discount.deactivated': ['/api/products/'],
+    },
+}
+
+# Объединение одинаковых одновременных промахов кэша в один запрос к сервису
+GATEWAY_SINGLE_FLIGHT = {
+    'ENABLED': True,
+    'WAIT_TIMEOUT': 30,  # Секунд ожидания первого запроса, затем запрос выполняется самостоятельно
+    # Объединение между процессами шлюза через блокировку в Redis
+    'DISTRIBUTED': os.environ.get('GATEWAY_SINGLE_FLIGHT_DISTRIBUTED', 'False') == 'True',
+    'REDIS_URL': f"redis://{REDIS_HOST}:{REDIS_PORT}/0",
+    'LOCK_TTL': 10,  # Секунд жизни блокировки, если владелец упал
+    'POLL_INTERVAL': 0.05,  # Интервал проверки общего кэша ожидающими процессами
+}
+
+# Circuit breaker и bulkhead для каждого сервиса
+UPSTREAM_RESILIENCE = {
+    'BREAKER': {
+        'WINDOW': 10,  # Секунд в скользящем окне статистики
+        'MIN_REQUESTS': 20,  # Минимум запросов в окне для решения о размыкании
+        'FAILURE_RATE': 0.5,  # Доля ошибок (соединение, таймаут, 502/503/504) для размыкания
+        'SLOW_CALL_RATE': 0.5,  # Доля медленных ответов для размыкания
+        'SLOW_CALL_THRESHOLD': 5.0,  # Секунд, после которых ответ считается медленным
+        'OPEN_TIME': 15,  # Секунд отказа без обращения к сервису
+        'HALF_OPEN_REQUESTS': 3,  # Пробных запросов для замыкания
+    },
+    'BULKHEAD': {
+        'MAX_CONCURRENT': int(os.environ.get('UPSTREAM_MAX_CONCURRENT', 100)),  # Одновременных запросов к сервису
+    },
+    'SERVICES': {
+        'order-service': {'BULKHEAD': {'MAX_CONCURRENT': 50}, 'BREAKER': {'SLOW_CALL_THRESHOLD': 10.0}},
+    },
+}
+
+
+# Проверка access токенов на шлюзе. Сервисам передается X-Identity (user_id, email, exp, jti)
+# с подписью HMAC-SHA256 ключом IDENTITY_KEY; у сервисов он в GATEWAY_IDENTITY_KEYS
+GATEWAY_AUTH = {
+    'ENABLED': os.environ.get('GATEWAY_AUTH_ENABLED', 'True') == 'True',
+    'JWT_ALGORITHM': 'HS256',
+    'JWT_VERIFYING_KEYS': os.environ.get('JWT_VERIFYING_KEYS', 'user-service-secret-key-change-in-production').split(','),
+    'JWT_LEEWAY': 10,
+    'IDENTITY_KEY': os.environ.get('GATEWAY_IDENTITY_KEY', 'gateway-identity-key-change-in-production'),
+}
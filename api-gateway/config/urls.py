@@ -1,21 +1,29 @@
-from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
+from django.conf import settings
+from apps.gateway.balancer import load_balancer
+from apps.gateway.cache import response_cache
+from apps.gateway.resilience import upstream_guards
+from apps.gateway.singleflight import single_flight, async_single_flight, distributed_flight
+from apps.gateway.transport import upstream_pools, async_upstream_pools
 
 def health_check(request):
     return JsonResponse({
         'status': 'healthy',
         'service': 'api-gateway',
-        'services': {
-            'user-service': 'http://localhost:8004',
-            'product-service': 'http://localhost:8001',
-            'cart-service': 'http://localhost:8002',
-            'order-service': 'http://localhost:8003'
-        }
+        'services': settings.MICROSERVICES,
+        'mode': 'async' if settings.GATEWAY_ASYNC else 'sync',
+        'instances': load_balancer.metrics(),
+        'breakers': upstream_guards.metrics(),
+        'pools': (async_upstream_pools if settings.GATEWAY_ASYNC else upstream_pools).metrics(),
+        'cache': response_cache.metrics(),
+        'single_flight': dict(
+            (async_single_flight if settings.GATEWAY_ASYNC else single_flight).metrics(),
+            **distributed_flight.metrics()
+        ),
     })
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('health/', health_check),
     path('api/', include('apps.gateway.urls')),
 ]
\ No newline at end of file
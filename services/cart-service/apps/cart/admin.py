@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cart, CartItem
+from .models import Cart, CartItem, ProductSnapshot
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
@@ -16,4 +16,8 @@ class CartAdmin(admin.ModelAdmin):
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['id', 'cart', 'product_id', 'product_name', 'quantity', 'price', 'subtotal']
     list_filter = ['created_at']
-    readonly_fields = ['subtotal', 'created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['subtotal', 'created_at', 'updated_at']
+@admin.register(ProductSnapshot)
+class ProductSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['product_id', 'name', 'price', 'stock_quantity', 'is_active', 'source_updated_at', 'synced_at']
+    search_fields = ['name']
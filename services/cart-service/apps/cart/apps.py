@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from shared.process import is_server_process
 
 
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.cart'
+
+    def ready(self):
+        # Один слушатель событий на процесс сервера (не на экземпляр middleware)
+        # События user-service сбрасывают кэш профилей и пополняют список отозванных токенов
+        if is_server_process():
+            from .event_handlers import start_listener_thread
+            start_listener_thread()
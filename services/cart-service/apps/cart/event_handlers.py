@@ -1,11 +1,37 @@
 import json
 import redis
 import threading
+import time
 import logging
 from django.conf import settings
+from django.db import close_old_connections
+from shared.identity import identity_cache
+from .models import Cart, ProductSnapshot
 
 logger = logging.getLogger(__name__)
 
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener_thread():
+    """Запуск слушателя событий в фоновом потоке (один поток на процесс)"""
+    global _listener
+    if _listener is not None or not settings.EVENT_LISTENER_ENABLED:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=listen_forever, name='cart-events', daemon=True)
+            _listener.start()
+
+
+def listen_forever():
+    """Прослушивание с переподключением при потере соединения с Redis"""
+    while True:
+        start_event_listener()
+        time.sleep(1)
+
+
 def start_event_listener():
     """Запуск слушателя событий Redis"""
     try:
@@ -21,10 +47,18 @@ def start_event_listener():
 
         # 3. Цикл прослушивания сообщений
         for message in pubsub.listen():
-            if message['type'] == 'message':
+            if message['type'] == 'subscribe':
+                # События, пропущенные без подписки, неизвестны: сбрасываем локальный кэш
+                # и заново загружаем список отозванных токенов
+                identity_cache.clear_local()
+                identity_cache.load_revoked()
+                ProductSnapshot.mark_stale()
+            elif message['type'] == 'message':
                 try:
                     # Десериализация и обработка события
                     event_data = json.loads(message['data'])
+                    # Поток живет долго: соединение с БД могло устареть
+                    close_old_connections()
                     handle_event(event_data)
                 except Exception as e:
                     # Ошибка во время обработки конкретного события
@@ -39,10 +73,20 @@ def handle_event(event_data):
     event_type = event_data.get('type')
     data = event_data.get('data', {})
 
-    if event_type == 'order.created':
-        # Очищаем корзину после создания заказа
-        from .models import Cart
+    if identity_cache.handle_event(event_type, data):
+        return
+
+    if event_type in ('product.created', 'product.updated'):
+        ProductSnapshot.apply(data)
+
+    elif event_type == 'product.stock_changed':
+        ProductSnapshot.apply_stock(data)
 
+    elif event_type == 'product.deleted':
+        ProductSnapshot.objects.filter(product_id=data['product_id']).delete()
+
+    elif event_type == 'order.created':
+        # Очищаем корзину после создания заказа
         user_id = data.get('user_id')
         if user_id:
             try:
@@ -51,8 +95,3 @@ def handle_event(event_data):
                 logger.info(f"Cart cleared for user {user_id} after order creation")
             except Cart.DoesNotExist:
                 logger.info(f"No cart found for user {user_id}")
-
-# Запуск в отдельном потоке
-if settings.DEBUG:
-    thread = threading.Thread(target=start_event_listener, daemon=True)
-    thread.start()
\ No newline at end of file
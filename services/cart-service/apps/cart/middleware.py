@@ -1,6 +1,9 @@
 import jwt
 from django.http import JsonResponse
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from shared.auth import decode_access_token, decode_identity_header
+from shared.identity import identity_cache
 from .services import UserService
 import logging
 
@@ -29,25 +32,43 @@ class JWTAuthenticationMiddleware:
             token = auth_header.split(' ')[1]
             logger.info(f"Found auth token in request to {request.path}")
 
-            # Получаем пользователя через user-service
-            user_data = UserService.get_user_from_token(token)
-            if user_data:
-                request.user_id = user_data['id']
-                request.user_email = user_data['email']
-                logger.info(f"Authenticated user {user_data['id']} for {request.path}")
-
-                return self.get_response(request)
-
-            else:
-                logger.warning(f"Invalid token for {request.path}")
+            # Проверяем токен локально, без запроса к user-service
+            try:
+                claims = self.get_claims(request, token)
+            except jwt.InvalidTokenError as e:
+                logger.warning(f"Invalid token for {request.path}: {e}")
                 return JsonResponse({
                     'error': 'Invalid token',
                     'message': 'The provided authentication token is invalid'
                 }, status=401)
 
+            if identity_cache.is_revoked(claims.get('jti')):
+                logger.warning(f"Revoked token for {request.path}")
+                return JsonResponse({
+                    'error': 'Token revoked',
+                    'message': 'The provided authentication token has been revoked'
+                }, status=401)
+
+            request.user_id = int(claims['user_id'])
+            # Профиль запрашивается у user-service только если он понадобится view
+            request.user_data = SimpleLazyObject(lambda: UserService.get_user_from_token(token, claims))
+            request.user_email = claims.get('email') or SimpleLazyObject(
+                lambda: (request.user_data or {}).get('email', '')
+            )
+            logger.info(f"Authenticated user {request.user_id} for {request.path}")
+
+            return self.get_response(request)
+
         else:
             logger.warning(f"No auth header found for {request.path}")
             return JsonResponse({
                 'error': 'Authentication required',
                 'message': 'Authorization header with Bearer token is required'
             }, status=401)
+
+    def get_claims(self, request, token):
+        """Данные пользователя: из подписанного заголовка шлюза, иначе из самого токена"""
+        identity = request.headers.get('X-Identity')
+        if identity:
+            return decode_identity_header(identity)
+        return decode_access_token(token)
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSnapshot',
+            fields=[
+                ('product_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('image_url', models.CharField(blank=True, max_length=500)),
+                ('is_active', models.BooleanField(default=True)),
+                ('stock_quantity', models.IntegerField(default=0)),
+                ('source_updated_at', models.DateTimeField()),
+                ('synced_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
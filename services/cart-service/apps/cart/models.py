@@ -1,4 +1,7 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from decimal import Decimal
 
 class Cart(models.Model):
@@ -42,4 +45,68 @@ class CartItem(models.Model):
     @property
     def subtotal(self):
         """Подсумма для данного товара"""
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+class ProductSnapshot(models.Model):
+    """Локальная копия данных товара из product-service (обновляется событиями product.*)"""
+    product_id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    image_url = models.CharField(max_length=500, blank=True)
+    is_active = models.BooleanField(default=True)
+    stock_quantity = models.IntegerField(default=0)  # Доступный к заказу остаток
+    source_updated_at = models.DateTimeField()  # updated_at товара в product-service
+    synced_at = models.DateTimeField(null=True)  # Когда данные последний раз подтверждены
+
+    def __str__(self):
+        return f"Snapshot of product {self.product_id}"
+
+    def is_fresh(self):
+        if self.synced_at is None:
+            return False
+        return (timezone.now() - self.synced_at).total_seconds() < settings.PRODUCT_SNAPSHOT_MAX_AGE
+
+    def to_product_data(self):
+        """Данные в формате ответа product-service"""
+        return {
+            'id': self.product_id,
+            'name': self.name,
+            'price': str(self.price),
+            'image_url': self.image_url,
+            'is_active': self.is_active,
+            'stock_quantity': self.stock_quantity,
+        }
+
+    @classmethod
+    def apply(cls, data):
+        """Сохранение снимка, если он не старше уже сохраненного (события могут прийти не по порядку)"""
+        product_id = data.get('product_id', data.get('id'))
+        source_updated_at = parse_datetime(data['updated_at'])
+        fields = {
+            'name': data['name'],
+            'price': data['price'],
+            'image_url': data.get('image_url') or '',
+            'is_active': data['is_active'],
+            # Храним доступный остаток (за вычетом удержаний под заказы), если он передан
+            'stock_quantity': data.get('available_quantity', data['stock_quantity']),
+            'source_updated_at': source_updated_at,
+            'synced_at': timezone.now(),
+        }
+        updated = cls.objects.filter(product_id=product_id, source_updated_at__lte=source_updated_at).update(**fields)
+        if not updated:
+            cls.objects.get_or_create(product_id=product_id, defaults=fields)
+
+    @classmethod
+    def apply_stock(cls, data):
+        """Обновление остатка; товара без снимка событие не касается"""
+        source_updated_at = parse_datetime(data['updated_at'])
+        cls.objects.filter(product_id=data['product_id'], source_updated_at__lte=source_updated_at).update(
+            stock_quantity=data.get('available_quantity', data['stock_quantity']),
+            source_updated_at=source_updated_at,
+            synced_at=timezone.now()
+        )
+
+    @classmethod
+    def mark_stale(cls):
+        """Все снимки требуют подтверждения (события могли быть пропущены)"""
+        cls.objects.update(synced_at=None)
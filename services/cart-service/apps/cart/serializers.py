@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from .models import Cart, CartItem
-from .services import ProductService
+from .services import ProductService, ProductResolver
 
 class CartItemSerializer(serializers.ModelSerializer):
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -15,7 +15,12 @@ class CartItemSerializer(serializers.ModelSerializer):
 
     def get_product_info(self, obj):
         """Получение актуальной информации о товаре"""
-        product_data = ProductService.get_product(obj.product_id)
+        # Товары корзины загружаются view одним пакетным запросом до сериализации
+        products = self.context.get('products')
+        if products is not None:
+            product_data = products.get(obj.product_id)
+        else:
+            product_data = ProductService.get_product(obj.product_id)
         if product_data:
             return {
                 'name': product_data.get('name'),
@@ -44,7 +49,9 @@ class AddToCartSerializer(serializers.Serializer):
 
     def validate_product_id(self, value):
         """Проверка существования товара"""
-        product_data = ProductService.get_product(value)
+        # View передает свой ProductResolver, чтобы товар запрашивался за запрос один раз
+        resolver = self.context.get('product_resolver') or ProductResolver()
+        product_data = resolver.get(value)
         if not product_data:
             raise serializers.ValidationError("Product not found")
 
@@ -1,52 +1,155 @@
 import requests
 import logging
 from django.conf import settings
-from typing import Optional, Dict, Any
+from shared.identity import identity_cache
+from .models import ProductSnapshot
+from typing import Optional, Dict, Any, List, Tuple
 
 logger = logging.getLogger(__name__)
 
+
+class ProductServiceUnavailable(Exception):
+    """product-service не ответил (сетевая ошибка или 5xx): данные товара неизвестны, а не удалены"""
+
 class ProductService:
-    """Сервис для взаимодействия с Product Service"""
+    """
+    Сервис для взаимодействия с Product Service.
+    Данные товаров читаются из локальных снимков (ProductSnapshot), которые обновляются
+    событиями product.*; к product-service обращаемся только за отсутствующими или устаревшими.
+    """
 
     @staticmethod
     def get_product(product_id: int) -> Optional[Dict[str, Any]]:
         """Получение информации о товаре"""
+        snapshot = ProductSnapshot.objects.filter(product_id=product_id).first()
+        if snapshot is not None and snapshot.is_fresh():
+            return snapshot.to_product_data()
+
+        try:
+            product_data = ProductService.fetch_product(product_id)
+        except ProductServiceUnavailable:
+            if snapshot is None:
+                return None
+            # product-service недоступен - отвечаем по последним известным данным
+            logger.warning(f"Using stale snapshot of product {product_id}")
+            return snapshot.to_product_data()
+
+        if product_data is None:
+            # Товара больше нет (событие product.deleted могло потеряться) - снимок не нужен
+            if snapshot is not None:
+                snapshot.delete()
+            return None
+        ProductSnapshot.apply(product_data)
+        return product_data
+
+    @staticmethod
+    def get_products(product_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Получение нескольких товаров: {id товара: данные}"""
+        snapshots = {s.product_id: s for s in ProductSnapshot.objects.filter(product_id__in=product_ids)}
+        products = {
+            product_id: snapshot.to_product_data()
+            for product_id, snapshot in snapshots.items() if snapshot.is_fresh()
+        }
+
+        missing = [product_id for product_id in product_ids if product_id not in products]
+        if missing:
+            fetched, not_found = ProductService.fetch_products(missing)
+            for product_id, product_data in fetched.items():
+                ProductSnapshot.apply(product_data)
+                products[product_id] = product_data
+            if not_found:
+                ProductSnapshot.objects.filter(product_id__in=not_found).delete()
+            for product_id in missing:
+                # Порция не получена из-за недоступности product-service - последние известные данные
+                if product_id not in fetched and product_id not in not_found and product_id in snapshots:
+                    products[product_id] = snapshots[product_id].to_product_data()
+        return products
+
+    @staticmethod
+    def check_availability(product_id: int, quantity: int) -> bool:
+        """Проверка наличия товара (окончательно остаток проверяется при резервировании в заказе)"""
+        return ProductResolver().is_available(product_id, quantity)
+
+    @staticmethod
+    def fetch_product(product_id: int) -> Optional[Dict[str, Any]]:
+        """Запрос товара у product-service; None - товара нет (404), при сбое - ProductServiceUnavailable"""
         try:
             response = requests.get(
                 f"{settings.PRODUCT_SERVICE_URL}/api/products/{product_id}/",
                 timeout=10
             )
-            if response.status_code == 200:
-                return response.json()
-            return None
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get product {product_id}: {e}")
+            raise ProductServiceUnavailable(str(e))
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 404:
             return None
-        
+        logger.error(f"Failed to get product {product_id}: status {response.status_code}")
+        raise ProductServiceUnavailable(f"status {response.status_code}")
+
     @staticmethod
-    def check_availability(product_id: int, quantity: int) -> bool:
-        """Проверка наличия товара"""
-        try:
-            response = requests.get(
-                f"{settings.PRODUCT_SERVICE_URL}/api/products/{product_id}/check-availability/",
-                params={'quantity': quantity},
-                timeout=10
-            )
+    def fetch_products(product_ids: List[int]) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+        """
+        Запрос нескольких товаров у product-service: ({id товара: данные}, id несуществующих).
+        Товары из порций, не полученных из-за сбоя, не попадают ни в один из списков.
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        products = {}
+        not_found = []
+        # Запросы порциями по PRODUCT_BATCH_SIZE - лимит одного запроса в product-service
+        for start in range(0, len(product_ids), settings.PRODUCT_BATCH_SIZE):
+            chunk = product_ids[start:start + settings.PRODUCT_BATCH_SIZE]
+            try:
+                response = requests.get(
+                    f"{settings.PRODUCT_SERVICE_URL}/api/products/batch/",
+                    params={'ids': ','.join(str(product_id) for product_id in chunk)},
+                    timeout=10
+                )
+                if response.status_code == 200:
+                    data = response.json()
+                    for product in data['products']:
+                        products[product['id']] = product
+                    not_found.extend(data.get('not_found', []))
+                else:
+                    logger.error(f"Failed to get products batch: status {response.status_code}")
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Failed to get products {chunk}: {e}")
+        return products, not_found
 
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('available', False)
-            return False
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to check availability for product {product_id}: {e}")
+class ProductResolver:
+    """Товары, полученные в рамках одного запроса: каждый товар запрашивается один раз"""
+
+    def __init__(self):
+        self._products = {}
+
+    def get(self, product_id: int) -> Optional[Dict[str, Any]]:
+        if product_id not in self._products:
+            self._products[product_id] = ProductService.get_product(product_id)
+        return self._products[product_id]
+
+    def is_available(self, product_id: int, quantity: int) -> bool:
+        """Наличие нужного количества - по уже полученным данным товара"""
+        product_data = self.get(product_id)
+        if product_data is None:
             return False
-        
+        available = product_data.get('available_quantity', product_data.get('stock_quantity', 0))
+        return available >= quantity
+
+    def as_context(self) -> Dict[str, Any]:
+        """Контекст для CartItemSerializer, чтобы он не запрашивал товары повторно"""
+        return {'products': {product_id: data for product_id, data in self._products.items() if data is not None}}
+
+
 class UserService:
     """Сервис для взаимодействия с User Service"""
 
     @staticmethod
-    def get_user_from_token(token: str) -> Optional[Dict[str, Any]]:
-        """Получение информации о пользователе по токену"""
+    def get_user_from_token(token: str, claims: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Получение информации о пользователе по токену (через кэш, если переданы claims токена)"""
+        if claims is not None:
+            return identity_cache.get_or_fetch(token, claims, lambda: UserService.get_user_from_token(token))
+
         try:
             headers = {'Authorization': f'Bearer {token}'}
             response = requests.get(
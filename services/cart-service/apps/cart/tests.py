@@ -1,6 +1,23 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import json
+import time
+from unittest import mock
+
+import jwt
+import requests
+from django.apps import apps
+from django.http import JsonResponse
+from django.test import TestCase, RequestFactory, override_settings
 from decimal import Decimal
-from .models import Cart, CartItem
+from shared.identity import IdentityCache, identity_cache, token_hash
+from shared.process import is_server_process
+from .middleware import JWTAuthenticationMiddleware
+from .event_handlers import handle_event
+from .models import Cart, CartItem, ProductSnapshot
+from .services import ProductService
+from .views import CartView, add_to_cart
 
 
 class CartModelTest(TestCase):
@@ -105,3 +122,318 @@ class CartItemModelTest(TestCase):
                 price=Decimal('50.00'),
                 quantity=1
             )
+
+
+def make_token(key='test-signing-key', **claims):
+    payload = {'token_type': 'access', 'user_id': 7, 'email': 'user@example.com', 'exp': int(time.time()) + 300}
+    payload.update(claims)
+    return jwt.encode(payload, key, algorithm='HS256')
+
+
+def make_identity(key='identity-key', **claims):
+    payload = {'user_id': 9, 'email': 'gateway@example.com', 'exp': int(time.time()) + 300, 'jti': 'abc'}
+    payload.update(claims)
+    encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).rstrip(b'=')
+    signature = base64.urlsafe_b64encode(hmac.new(key.encode(), encoded, hashlib.sha256).digest()).rstrip(b'=')
+    return f"{encoded.decode()}.{signature.decode()}"
+
+
+@override_settings(JWT_VERIFYING_KEYS=['test-signing-key', 'previous-signing-key'], EVENT_LISTENER_ENABLED=False,
+                   GATEWAY_IDENTITY_KEYS=['identity-key'])
+class JWTAuthenticationMiddlewareTest(TestCase):
+    """Тесты локальной проверки JWT токенов"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = JWTAuthenticationMiddleware(lambda request: JsonResponse({'ok': True}))
+
+    def call(self, token):
+        request = self.factory.get('/api/cart/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return request, self.middleware(request)
+
+    @mock.patch('apps.cart.middleware.UserService.get_user_from_token')
+    def test_valid_token_verified_locally(self, get_user):
+        """Тест проверки токена без запроса к user-service"""
+        request, response = self.call(make_token())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.user_id, 7)
+        self.assertEqual(request.user_email, 'user@example.com')
+        get_user.assert_not_called()
+
+    @mock.patch('apps.cart.middleware.UserService.get_user_from_token')
+    def test_profile_loaded_lazily(self, get_user):
+        """Тест ленивой загрузки профиля"""
+        get_user.return_value = {'id': 7, 'first_name': 'Ivan'}
+        request, _ = self.call(make_token())
+
+        self.assertEqual(request.user_data['first_name'], 'Ivan')
+        get_user.assert_called_once()
+
+    def test_rotated_key_accepted(self):
+        """Тест токена, подписанного другим ключом из списка (ротация)"""
+        _, response = self.call(make_token(key='previous-signing-key'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_tokens_rejected(self):
+        """Тест отказа для чужой подписи, истекшего и refresh токена"""
+        for token in (
+            make_token(key='unknown-key'),
+            make_token(exp=int(time.time()) - 60),
+            make_token(token_type='refresh'),
+            'not-a-token',
+        ):
+            _, response = self.call(token)
+            self.assertEqual(response.status_code, 401)
+
+    def test_gateway_identity_trusted(self):
+        """Тест данных пользователя из подписанного заголовка шлюза"""
+        request = self.factory.get('/api/', HTTP_AUTHORIZATION=f'Bearer {make_token()}',
+                                   HTTP_X_IDENTITY=make_identity())
+        response = self.middleware(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.user_id, 9)
+        self.assertEqual(request.user_email, 'gateway@example.com')
+
+    def test_invalid_gateway_identity_rejected(self):
+        """Тест отказа для чужой подписи и истекшего заголовка шлюза"""
+        for identity in (make_identity(key='unknown-key'), make_identity(exp=int(time.time()) - 60), 'garbage'):
+            request = self.factory.get('/api/', HTTP_AUTHORIZATION=f'Bearer {make_token()}',
+                                       HTTP_X_IDENTITY=identity)
+            self.assertEqual(self.middleware(request).status_code, 401)
+
+    def test_revoked_token_rejected(self):
+        """Тест отказа для отозванного токена"""
+        exp = int(time.time()) + 300
+        identity_cache.revoke('revoked-jti', exp)
+        self.addCleanup(identity_cache._revoked.pop, 'revoked-jti', None)
+
+        _, response = self.call(make_token(jti='revoked-jti', exp=exp))
+        self.assertEqual(response.status_code, 401)
+        _, response = self.call(make_token(jti='active-jti'))
+        self.assertEqual(response.status_code, 200)
+
+
+class EventListenerStartupTest(TestCase):
+    """Тесты запуска слушателя событий"""
+
+    def test_server_process_detection(self):
+        """Тест: слушатель нужен серверу приложений и рабочему процессу runserver"""
+        self.assertTrue(is_server_process(['/usr/local/bin/gunicorn', 'config.wsgi']))
+        self.assertTrue(is_server_process(['manage.py', 'runserver', '--noreload']))
+        self.assertFalse(is_server_process(['manage.py', 'migrate']))
+        self.assertFalse(is_server_process(['manage.py', 'test']))
+        with mock.patch.dict('os.environ', {'RUN_MAIN': 'true'}):
+            self.assertTrue(is_server_process(['manage.py', 'runserver']))
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertFalse(is_server_process(['manage.py', 'runserver']))
+
+    @mock.patch('apps.cart.event_handlers.start_listener_thread')
+    def test_started_from_app_config(self, start_listener_thread):
+        """Тест: слушатель запускается из AppConfig.ready(), а не при создании middleware"""
+        JWTAuthenticationMiddleware(lambda request: JsonResponse({}))
+        start_listener_thread.assert_not_called()
+
+        with mock.patch('apps.cart.apps.is_server_process', return_value=True):
+            apps.get_app_config('cart').ready()
+        start_listener_thread.assert_called_once_with()
+
+
+class IdentityCacheTest(TestCase):
+    """Тесты кэша профилей пользователей по токену"""
+
+    def setUp(self):
+        self.cache = IdentityCache()
+        self.cache._redis = mock.Mock()
+        self.cache._redis.get.return_value = None
+        self.cache._redis.smembers.return_value = set()
+        self.token = make_token()
+        self.claims = {'user_id': 7, 'exp': int(time.time()) + 300}
+
+    def test_profile_fetched_once(self):
+        """Тест повторного запроса профиля из кэша"""
+        fetch = mock.Mock(return_value={'id': 7})
+
+        self.assertEqual(self.cache.get_or_fetch(self.token, self.claims, fetch), {'id': 7})
+        self.assertEqual(self.cache.get_or_fetch(self.token, self.claims, fetch), {'id': 7})
+        fetch.assert_called_once()
+        self.cache._redis.pipeline.return_value.set.assert_called_once()
+
+    def test_shared_tier_used_on_local_miss(self):
+        """Тест чтения профиля из Redis без запроса к user-service"""
+        self.cache._redis.get.return_value = '{"id": 7}'
+        fetch = mock.Mock()
+
+        self.assertEqual(self.cache.get_or_fetch(self.token, self.claims, fetch), {'id': 7})
+        fetch.assert_not_called()
+
+    def test_user_updated_invalidates(self):
+        """Тест сброса профиля по событию user.updated"""
+        fetch = mock.Mock(side_effect=[{'id': 7, 'first_name': 'Ivan'}, {'id': 7, 'first_name': 'Petr'}])
+        self.cache.get_or_fetch(self.token, self.claims, fetch)
+        self.cache._redis.smembers.return_value = {token_hash(self.token)}
+
+        self.assertTrue(self.cache.handle_event('user.updated', {'user_id': 7}))
+
+        profile = self.cache.get_or_fetch(self.token, self.claims, fetch)
+        self.assertEqual(profile['first_name'], 'Petr')
+        self.cache._redis.delete.assert_called_with('identity:user:7', f"identity:{token_hash(self.token)}")
+
+    def test_token_revoked_event(self):
+        """Тест события token.revoked"""
+        exp = int(time.time()) + 300
+        self.cache.handle_event('token.revoked', {'user_id': 7, 'jti': 'abc', 'exp': exp})
+
+        self.assertTrue(self.cache.is_revoked('abc'))
+        self.assertFalse(self.cache.is_revoked('other'))
+        self.assertFalse(self.cache.is_revoked(None))
+
+
+class CartViewTest(TestCase):
+    """Тесты получения корзины"""
+
+    def setUp(self):
+        cart = Cart.objects.create(user_id=1)
+        for product_id in (1, 2, 3):
+            CartItem.objects.create(cart=cart, product_id=product_id, product_name=f'Product {product_id}',
+                                    price=Decimal('10.00'), quantity=1)
+
+    @mock.patch('apps.cart.serializers.ProductService.get_product')
+    @mock.patch('apps.cart.views.ProductService.get_products')
+    def test_products_loaded_in_one_batch(self, get_products, get_product):
+        """Тест: данные товаров корзины запрашиваются одним пакетом"""
+        get_products.return_value = {
+            1: {'id': 1, 'name': 'Product 1', 'price': '12.00', 'is_active': True},
+            2: {'id': 2, 'name': 'Product 2', 'price': '10.00', 'is_active': False},
+        }
+        request = RequestFactory().get('/api/cart/')
+        request.user_id = 1
+        response = CartView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        get_products.assert_called_once()
+        self.assertEqual(sorted(get_products.call_args[0][0]), [1, 2, 3])
+        get_product.assert_not_called()
+        info = {item['product_id']: item['product_info'] for item in response.data['items']}
+        self.assertEqual(info[1]['current_price'], '12.00')
+        self.assertFalse(info[2]['is_active'])
+        self.assertIsNone(info[3])
+
+
+def product_event(event_type, **data):
+    payload = {'product_id': 5, 'name': 'Laptop', 'price': '999.99', 'image_url': '', 'is_active': True,
+               'stock_quantity': 10, 'updated_at': '2025-01-01T10:00:00+00:00'}
+    payload.update(data)
+    return {'type': event_type, 'data': payload}
+
+
+class ProductSnapshotTest(TestCase):
+    """Тесты локальных снимков товаров"""
+
+    def setUp(self):
+        handle_event(product_event('product.created'))
+
+    @mock.patch('apps.cart.services.ProductService.fetch_product')
+    def test_reads_served_locally(self, fetch_product):
+        """Тест чтения товара и проверки наличия без обращения к product-service"""
+        self.assertEqual(ProductService.get_product(5)['name'], 'Laptop')
+        self.assertTrue(ProductService.check_availability(5, 10))
+        self.assertFalse(ProductService.check_availability(5, 11))
+        fetch_product.assert_not_called()
+
+    def test_events_applied_in_order(self):
+        """Тест: устаревшее событие не перезаписывает более новый снимок"""
+        handle_event(product_event('product.updated', price='899.99', updated_at='2025-01-01T12:00:00+00:00'))
+        handle_event(product_event('product.updated', price='1099.99', updated_at='2025-01-01T11:00:00+00:00'))
+        handle_event({'type': 'product.stock_changed', 'data': {
+            'product_id': 5, 'stock_quantity': 3, 'updated_at': '2025-01-01T12:30:00+00:00'}})
+
+        snapshot = ProductSnapshot.objects.get(product_id=5)
+        self.assertEqual(snapshot.price, Decimal('899.99'))
+        self.assertEqual(snapshot.stock_quantity, 3)
+
+    @mock.patch('apps.cart.services.ProductService.fetch_product')
+    def test_available_quantity_used(self, fetch_product):
+        """Тест: наличие проверяется по остатку за вычетом удержаний"""
+        handle_event({'type': 'product.stock_changed', 'data': {
+            'product_id': 5, 'stock_quantity': 10, 'available_quantity': 4,
+            'updated_at': '2025-01-01T11:00:00+00:00'}})
+
+        self.assertTrue(ProductService.check_availability(5, 4))
+        self.assertFalse(ProductService.check_availability(5, 5))
+
+    def test_deleted_product(self):
+        """Тест удаления снимка по событию product.deleted"""
+        handle_event({'type': 'product.deleted', 'data': {'product_id': 5}})
+        self.assertFalse(ProductSnapshot.objects.filter(product_id=5).exists())
+
+    @mock.patch('apps.cart.services.requests.get', side_effect=requests.exceptions.ConnectionError('down'))
+    def test_stale_snapshot_used_when_service_unavailable(self, get):
+        """Тест: устаревший снимок перезапрашивается, при недоступности сервиса используется он же"""
+        ProductSnapshot.mark_stale()
+
+        self.assertEqual(ProductService.get_product(5)['price'], '999.99')
+        get.assert_called_once()
+
+        get.side_effect = None
+        get.return_value = mock.Mock(status_code=503)
+        self.assertEqual(ProductService.get_product(5)['price'], '999.99')
+
+    @mock.patch('apps.cart.services.requests.get')
+    def test_snapshot_deleted_when_product_not_found(self, get):
+        """Тест: на 404 устаревший снимок удаляется, а не выдается за существующий товар"""
+        get.return_value = mock.Mock(status_code=404)
+        ProductSnapshot.mark_stale()
+
+        self.assertIsNone(ProductService.get_product(5))
+        self.assertFalse(ProductSnapshot.objects.filter(product_id=5).exists())
+
+    @mock.patch('apps.cart.services.ProductService.fetch_products')
+    def test_batch_not_found_and_unavailable(self, fetch_products):
+        """Тест пакетного запроса: ненайденные снимки удаляются, при сбое используются устаревшие"""
+        ProductSnapshot.mark_stale()
+
+        fetch_products.return_value = ({}, [])
+        self.assertEqual(ProductService.get_products([5])[5]['price'], '999.99')
+
+        fetch_products.return_value = ({}, [5])
+        self.assertEqual(ProductService.get_products([5]), {})
+        self.assertFalse(ProductSnapshot.objects.filter(product_id=5).exists())
+
+    @mock.patch('apps.cart.services.ProductService.fetch_products')
+    def test_batch_fetches_only_missing(self, fetch_products):
+        """Тест: пакетный запрос только за товарами без снимка, с сохранением снимков"""
+        fetch_products.return_value = ({6: {'id': 6, 'name': 'Mouse', 'price': '19.99', 'is_active': True,
+                                            'stock_quantity': 4, 'updated_at': '2025-01-01T10:00:00+00:00'}}, [])
+
+        products = ProductService.get_products([5, 6])
+
+        fetch_products.assert_called_once_with([6])
+        self.assertEqual(set(products), {5, 6})
+        self.assertTrue(ProductSnapshot.objects.filter(product_id=6).exists())
+
+
+class AddToCartViewTest(TestCase):
+    """Тесты добавления товара в корзину"""
+
+    def post(self, product_id, quantity):
+        request = RequestFactory().post('/api/cart/add/', {'product_id': product_id, 'quantity': quantity},
+                                        content_type='application/json')
+        request.user_id = 1
+        return add_to_cart(request)
+
+    @mock.patch('apps.cart.services.ProductService.get_product')
+    def test_product_fetched_once(self, get_product):
+        """Тест: товар запрашивается один раз на валидацию, проверку наличия и ответ"""
+        get_product.return_value = {'id': 5, 'name': 'Laptop', 'price': '999.99', 'is_active': True,
+                                    'stock_quantity': 3}
+
+        self.assertEqual(self.post(5, 2).status_code, 201)
+        get_product.assert_called_once_with(5)
+
+        get_product.reset_mock()
+        response = self.post(5, 2)
+        self.assertEqual(response.status_code, 400)
+        get_product.assert_called_once_with(5)
+        self.assertEqual(CartItem.objects.get(product_id=5).quantity, 2)
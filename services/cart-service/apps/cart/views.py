@@ -8,8 +8,9 @@ from .serializers import (
     CartSerializer, AddToCartSerializer,
     UpdateCartItemSerializer, CartItemSerializer
 )
-from .services import ProductService
+from .services import ProductService, ProductResolver
 import logging
+from decimal import Decimal
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +34,14 @@ class CartView(generics.RetrieveAPIView):
             logger.info(f"Created new cart for user {self.request.user_id}")
         return cart
 
+    def retrieve(self, request, *args, **kwargs):
+        cart = self.get_object()
+        # Данные всех товаров корзины - одним запросом к product-service
+        product_ids = list(cart.items.values_list('product_id', flat=True))
+        context = self.get_serializer_context()
+        context['products'] = ProductService.get_products(product_ids) if product_ids else {}
+        return Response(self.get_serializer(cart, context=context).data)
+
 
 # ================================
 #   ДОБАВЛЕНИЕ ТОВАРА В КОРЗИНУ
@@ -43,7 +52,8 @@ def add_to_cart(request):
     """Добавление товара в корзину"""
     logger.info(f"Add to cart request from user {request.user_id}: {request.data}")
 
-    serializer = AddToCartSerializer(data=request.data)
+    resolver = ProductResolver()
+    serializer = AddToCartSerializer(data=request.data, context={'product_resolver': resolver})
 
     if not serializer.is_valid():
         logger.error(f"Add to cart validation errors: {serializer.errors}")
@@ -56,15 +66,15 @@ def add_to_cart(request):
     cart, created = Cart.objects.get_or_create(user_id=request.user_id)
     logger.info(f"Cart for user {request.user_id}: {'created' if created else 'found'}")
 
-    # Проверка доступности товара
-    if not ProductService.check_availability(product_id, quantity):
+    # Проверка доступности товара (данные товара уже получены при валидации)
+    if not resolver.is_available(product_id, quantity):
         logger.warning(f"Product {product_id} not available in quantity {quantity}")
         return Response({
             'error': 'Product is not available in requested quantity'
         }, status=status.HTTP_400_BAD_REQUEST)
 
     # Получаем данные о продукте
-    product_data = ProductService.get_product(product_id)
+    product_data = resolver.get(product_id)
     if not product_data:
         logger.warning(f"Product {product_id} not found")
         return Response({
@@ -77,7 +87,7 @@ def add_to_cart(request):
         product_id=product_id,
         defaults={
             'quantity': quantity,
-            'price': product_data['price'],
+            'price': Decimal(str(product_data['price'])),
             'product_name': product_data['name']
         }
     )
@@ -86,7 +96,7 @@ def add_to_cart(request):
         # Если товар уже есть в корзине — увеличиваем количество
         new_quantity = cart_item.quantity + quantity
 
-        if not ProductService.check_availability(product_id, new_quantity):
+        if not resolver.is_available(product_id, new_quantity):
             return Response({
                 'error': 'Not enough stock available'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -100,7 +110,7 @@ def add_to_cart(request):
 
     return Response({
         'message': 'Product added to cart successfully',
-        'cart_item': CartItemSerializer(cart_item).data
+        'cart_item': CartItemSerializer(cart_item, context=resolver.as_context()).data
     }, status=status.HTTP_201_CREATED)
 
 @api_view(['PUT'])
@@ -114,7 +124,8 @@ def update_cart_item(request, item_id):
         new_quantity = serializer.validated_data['quantity']
 
         # Проверяем наличие товара
-        if not ProductService.check_availability(cart_item.product_id, new_quantity):
+        resolver = ProductResolver()
+        if not resolver.is_available(cart_item.product_id, new_quantity):
             return Response({
                 'error': 'Product is not available in requested quantity'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -124,7 +135,7 @@ def update_cart_item(request, item_id):
 
         return Response({
             'message': 'Cart item updated successfully',
-            'cart_item': CartItemSerializer(cart_item).data
+            'cart_item': CartItemSerializer(cart_item, context=resolver.as_context()).data
         })
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -1,7 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
+from django.http import JsonResponse
+
+def health_check(request):
+    return JsonResponse({'status': 'healthy', 'service': 'currency-service'})
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('health/', health_check),
     path('api/currency/', include('apps.currency.urls')),
 ]
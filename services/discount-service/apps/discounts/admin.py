@@ -48,7 +48,7 @@ class DiscountAdmin(admin.ModelAdmin):
 @admin.register(DiscountCode)
 class DiscountCodeAdmin(admin.ModelAdmin):
     list_display = ['code', 'discount_percentage', 'valid_from', 'valid_to', 'usage_count', 'usage_limit', 'is_active']
-    list_filter = ['is_active', 'valid_from', 'valid_to']
+    list_filter = ['is_active', 'is_hot', 'valid_from', 'valid_to']
     search_fields = ['code']
     ordering = ['-created_at']
     
@@ -60,7 +60,7 @@ class DiscountCodeAdmin(admin.ModelAdmin):
             'fields': ('valid_from', 'valid_to')
         }),
         ('Ограничения', {
-            'fields': ('usage_limit', 'usage_count', 'min_purchase_amount', 'is_active')
+            'fields': ('usage_limit', 'usage_count', 'min_purchase_amount', 'is_active', 'is_hot')
         }),
     )
     
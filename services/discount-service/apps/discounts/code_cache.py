@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from .services import event_bus
+
+logger = logging.getLogger(__name__)
+
+# Версия набора промокодов в Redis: другие процессы сбрасывают кэш при ее изменении
+VERSION_KEY = 'discount_codes:version'
+
+
+def normalize_code(code):
+    """Промокоды сравниваются без учета регистра и пробелов по краям"""
+    return code.strip().upper()
+
+
+class BloomFilter:
+    """Фильтр Блума: "нет" - точно нет, "есть" - возможно есть (с долей ложных срабатываний)"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.sha256(value.encode()).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:16], 'big')
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, value):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(value))
+
+
+class DiscountCodeCache:
+    """
+    Кэш поиска промокодов в памяти процесса. Найденные промокоды хранятся в LRU,
+    неизвестные отсекает фильтр Блума по всем промокодам из БД, а его ложные срабатывания -
+    отрицательный кэш. Перебор промокодов ботами почти не доходит до БД.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._found = OrderedDict()  # код -> (поля промокода, время истечения)
+        self._missing = OrderedDict()  # код -> время истечения
+        self._bloom = None
+        self._version = None
+        self._loaded_at = 0
+        self._checked_at = 0
+
+    @property
+    def config(self):
+        return settings.DISCOUNT_CODE_CACHE
+
+    def get(self, code):
+        """Промокод по коду или None (без обращения к БД, если ответ уже известен)"""
+        from .models import DiscountCode
+
+        code = normalize_code(code)
+        self._ensure_fresh()
+        now = time.monotonic()
+        with self._lock:
+            if code not in self._bloom:
+                return None
+            missing_until = self._missing.get(code)
+            if missing_until is not None and missing_until > now:
+                return None
+            cached = self._found.get(code)
+            if cached is not None and cached[1] > now:
+                self._found.move_to_end(code)
+                # Отдельный экземпляр на каждый запрос: вызывающий код может его менять
+                values = cached[0]
+                return DiscountCode.from_db(DiscountCode.objects.db, list(values), list(values.values()))
+
+        # Коды хранятся нормализованными (DiscountCode.save, миграция 0004) - точный поиск по уникальному индексу
+        discount_code = DiscountCode.objects.filter(code=code).first()
+        with self._lock:
+            if discount_code is None:
+                self._remember(self._missing, code, now + self.config['NEGATIVE_TTL'])
+            else:
+                values = {field.attname: getattr(discount_code, field.attname)
+                          for field in DiscountCode._meta.concrete_fields}
+                self._remember(self._found, code, (values, now + self.config['LOCAL_TTL']))
+        return discount_code
+
+    def _remember(self, entries, code, value):
+        entries[code] = value
+        entries.move_to_end(code)
+        while len(entries) > self.config['MAX_ENTRIES']:
+            entries.popitem(last=False)
+
+    def forget(self, code):
+        """Сбросить запись промокода в этом процессе (например, после его использования)"""
+        code = normalize_code(code)
+        with self._lock:
+            self._found.pop(code, None)
+            self._missing.pop(code, None)
+
+    def invalidate(self, code):
+        """Промокод создан, изменен или удален: сбросить его здесь и в других процессах"""
+        code = normalize_code(code)
+        self.forget(code)
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(code)
+        transaction.on_commit(self._publish_change)
+
+    def _publish_change(self):
+        try:
+            event_bus.redis_client.incr(VERSION_KEY)
+        except Exception as e:
+            logger.error(f"Failed to bump discount codes version: {e}")
+
+    def _remote_version(self):
+        try:
+            return event_bus.redis_client.get(VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to read discount codes version: {e}")
+            return self._version
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        # Полная перестройка раз в MAX_AGE: на случай потерянного изменения версии
+        # или промокодов, записанных в обход save (bulk_create, update)
+        if self._bloom is None or now - self._loaded_at > self.config['MAX_AGE']:
+            self.load()
+        elif now - self._checked_at > self.config['CHECK_INTERVAL']:
+            self._checked_at = now
+            if self._remote_version() != self._version:
+                self.load()
+
+    def load(self):
+        """Фильтр Блума по всем промокодам из БД; записи кэша сбрасываются"""
+        from .models import DiscountCode
+
+        version = self._remote_version()
+        codes = [normalize_code(code) for code in DiscountCode.objects.values_list('code', flat=True)]
+        bloom = BloomFilter(max(len(codes) * 2, 1000), self.config['BLOOM_ERROR_RATE'])
+        for code in codes:
+            bloom.add(code)
+        with self._lock:
+            self._bloom = bloom
+            self._found.clear()
+            self._missing.clear()
+            self._version = version
+            self._loaded_at = self._checked_at = time.monotonic()
+        logger.info(f"Discount code cache loaded: {len(codes)} codes")
+
+
+code_cache = DiscountCodeCache()
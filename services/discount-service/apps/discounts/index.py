@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .services import event_bus
+
+logger = logging.getLogger(__name__)
+
+# Версия данных скидок в Redis: другие процессы перестраивают индекс при ее изменении
+VERSION_KEY = 'discounts:version'
+
+# Окна задаются включительно (start_date <= T <= end_date), в индексе - полуинтервалами
+RESOLUTION = timedelta(microseconds=1)
+
+
+class WindowIndex:
+    """
+    Интервалы времени, разбитые на непересекающиеся отрезки: для каждого отрезка заранее
+    известен список действующих объектов, поэтому поиск по времени - один bisect, O(log n).
+    """
+
+    def __init__(self, windows):
+        # windows - [(начало, конец, объект)] в порядке приоритета (первый - главный)
+        bounds = sorted({start for start, _, _ in windows} | {end + RESOLUTION for _, end, _ in windows})
+        self.bounds = bounds
+        self.segments = [
+            [item for start, end, item in windows if start <= bound <= end]
+            for bound in bounds
+        ]
+
+    def at(self, moment):
+        position = bisect_right(self.bounds, moment) - 1
+        if position < 0:
+            return []
+        return self.segments[position]
+
+
+class DiscountIndex:
+    """
+    Индекс действующих скидок в памяти процесса: {id товара: окна праздников}.
+    Ответ "какая скидка действует для товара в момент T" не обращается к БД.
+    Индекс строится при первом обращении и перестраивается после изменения скидок или
+    праздников (в этом процессе - сразу, в остальных - по версии в Redis).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._products = None
+        self._holidays = None
+        self._version = None
+        self._loaded_at = 0
+        self._checked_at = 0
+        self._dirty = True
+
+    @property
+    def config(self):
+        return settings.DISCOUNT_INDEX
+
+    def invalidate(self):
+        """Скидки или праздники изменились: перестроить индекс здесь и в других процессах"""
+        self._dirty = True
+        transaction.on_commit(self._publish_change)
+
+    def _publish_change(self):
+        self._dirty = True
+        try:
+            event_bus.redis_client.incr(VERSION_KEY)
+        except Exception as e:
+            logger.error(f"Failed to bump discounts version: {e}")
+
+    def _remote_version(self):
+        try:
+            return event_bus.redis_client.get(VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to read discounts version: {e}")
+            return self._version
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._products is None or self._dirty or now - self._loaded_at > self.config['MAX_AGE']:
+            with self._lock:
+                self.load()
+        elif now - self._checked_at > self.config['CHECK_INTERVAL']:
+            self._checked_at = now
+            if self._remote_version() != self._version:
+                with self._lock:
+                    self.load()
+
+    def load(self):
+        from .models import Discount, Holiday
+
+        self._dirty = False
+        version = self._remote_version()
+        holidays = list(Holiday.objects.filter(is_active=True))
+        discounts = Discount.objects.filter(is_active=True, holiday__is_active=True).select_related('holiday')
+
+        windows = {}
+        # Порядок приоритета - сортировка модели, как в запросах by_product
+        for discount in discounts:
+            windows.setdefault(discount.product_id, []).append(
+                (discount.holiday.start_date, discount.holiday.end_date, discount)
+            )
+        self._products = {product_id: WindowIndex(items) for product_id, items in windows.items()}
+        self._holidays = WindowIndex([(holiday.start_date, holiday.end_date, holiday) for holiday in holidays])
+        self._version = version
+        self._loaded_at = self._checked_at = time.monotonic()
+        logger.info(f"Discount index loaded: {len(self._products)} products, {len(holidays)} holidays")
+
+    def discounts_for(self, product_id, moment=None):
+        """Действующие скидки товара (первая - применяемая)"""
+        self._ensure_fresh()
+        index = self._products.get(int(product_id))
+        return list(index.at(moment or timezone.now())) if index else []
+
+    def effective_for(self, product_ids, moment=None):
+        """Применяемая скидка нескольких товаров: {id товара: скидка}"""
+        self._ensure_fresh()
+        moment = moment or timezone.now()
+        effective = {}
+        for product_id in product_ids:
+            index = self._products.get(int(product_id))
+            discounts = index.at(moment) if index else []
+            if discounts:
+                effective[int(product_id)] = discounts[0]
+        return effective
+
+    def active_holidays(self, moment=None):
+        self._ensure_fresh()
+        return list(self._holidays.at(moment or timezone.now()))
+
+
+discount_index = DiscountIndex()
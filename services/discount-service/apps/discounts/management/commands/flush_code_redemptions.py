@@ -0,0 +1,8 @@
+from shared.hot_counters import FlushCommand
+from apps.discounts.redemption import code_counter
+
+
+class Command(FlushCommand):
+    help = 'Запись использований горячих промокодов из Redis в БД и сверка счетчиков с БД'
+    counters = code_counter
+    message = 'Flushed redemptions of {} hot discount codes'
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.discounts.models import Holiday
+
+
+class Command(BaseCommand):
+    help = 'Публикация discount.activated/deactivated для праздников, которые начались или закончились'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд (0 - один проход и выход)')
+
+    def handle(self, *args, **options):
+        while True:
+            announced = Holiday.announce_due()
+            if announced:
+                self.stdout.write(f"Announced {announced} holiday boundaries")
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
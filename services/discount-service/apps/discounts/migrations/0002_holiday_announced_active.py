@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='holiday',
+            name='announced_active',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discounts', '0002_holiday_announced_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discountcode',
+            name='is_hot',
+            field=models.BooleanField(default=False, verbose_name='Горячий промокод'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def normalize_codes(apps, schema_editor):
+    """Промокоды в одном виде (strip + upper), чтобы искать их точным сравнением по уникальному индексу"""
+    DiscountCode = apps.get_model('discounts', 'DiscountCode')
+    rows = list(DiscountCode.objects.order_by('pk').values_list('pk', 'code'))
+
+    # Уже нормализованные промокоды сохраняют свой код
+    taken = {code for _, code in rows if code == code.strip().upper()}
+    for pk, code in rows:
+        normalized = code.strip().upper()
+        if normalized == code:
+            continue
+        if normalized in taken:
+            # Совпадает с другим промокодом без учета регистра - оставляем различимым
+            suffix = f"-{pk}"
+            normalized = normalized[:50 - len(suffix)] + suffix
+        taken.add(normalized)
+        DiscountCode.objects.filter(pk=pk).update(code=normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discounts', '0003_discount_code_is_hot'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_codes, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,12 @@
 from django.db import models
+from django.db.models import F, Q
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from decimal import Decimal
+from .code_cache import code_cache, normalize_code
+from .index import discount_index
+from .redemption import code_counter
+from .services import event_bus
 
 
 class Holiday(models.Model):
@@ -34,6 +39,8 @@ class Holiday(models.Model):
     )
     is_active = models.BooleanField(default=True, verbose_name='Активен')
     description = models.TextField(blank=True, verbose_name='Описание')
+    # Активность, о которой уже сообщено подписчикам (discount.activated/deactivated)
+    announced_active = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -53,6 +60,36 @@ class Holiday(models.Model):
             self.start_date <= now <= self.end_date
         )
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        discount_index.invalidate()
+        # Изменение праздника меняет действующие скидки всех его товаров
+        self.announce()
+
+    def delete(self, *args, **kwargs):
+        product_ids = list(self.discounts.values_list('product_id', flat=True))
+        result = super().delete(*args, **kwargs)
+        discount_index.invalidate()
+        Discount.publish_effective(product_ids)
+        return result
+
+    def announce(self):
+        """Публикация действующих скидок товаров праздника с учетом его текущей активности"""
+        self.announced_active = self.is_currently_active()
+        Holiday.objects.filter(pk=self.pk).update(announced_active=self.announced_active)
+        Discount.publish_effective(self.discounts.values_list('product_id', flat=True))
+
+    @classmethod
+    def announce_due(cls):
+        """Праздники, которые начались или закончились с прошлой проверки; возвращает их количество"""
+        now = timezone.now()
+        started = cls.objects.filter(announced_active=False, is_active=True, start_date__lte=now, end_date__gte=now)
+        ended = cls.objects.filter(announced_active=True).exclude(is_active=True, start_date__lte=now, end_date__gte=now)
+        holidays = list(started) + list(ended)
+        for holiday in holidays:
+            holiday.announce()
+        return len(holidays)
+
 
 class Discount(models.Model):
     """Модель скидки на конкретный товар"""
@@ -92,6 +129,54 @@ class Discount(models.Model):
             discount_amount = self.original_price * (self.holiday.discount_percentage / 100)
             self.discounted_price = self.original_price - discount_amount
         super().save(*args, **kwargs)
+        discount_index.invalidate()
+        Discount.publish_effective([self.product_id])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        discount_index.invalidate()
+        Discount.publish_effective([self.product_id])
+        return result
+
+    def to_event_data(self):
+        return {
+            'product_id': self.product_id,
+            'discount_id': self.id,
+            'holiday_name': self.holiday.name,
+            'original_price': str(self.original_price),
+            'discounted_price': str(self.discounted_price),
+            'discount_percentage': str(self.holiday.discount_percentage),
+            'ends_at': self.holiday.end_date.isoformat(),
+        }
+
+    @classmethod
+    def effective_for(cls, product_ids):
+        """Действующая скидка товаров: {id товара: скидка}; как и в by_product, берется первая по сортировке"""
+        now = timezone.now()
+        discounts = cls.objects.filter(
+            product_id__in=list(product_ids),
+            is_active=True,
+            holiday__is_active=True,
+            holiday__start_date__lte=now,
+            holiday__end_date__gte=now
+        ).select_related('holiday')
+
+        effective = {}
+        for discount in discounts:
+            effective.setdefault(discount.product_id, discount)
+        return effective
+
+    @classmethod
+    def publish_effective(cls, product_ids):
+        """События о действующей скидке товаров для product-service"""
+        product_ids = set(product_ids)
+        effective = cls.effective_for(product_ids)
+        for product_id in sorted(product_ids):
+            discount = effective.get(product_id)
+            if discount is not None:
+                event_bus.publish_on_commit('discount.activated', discount.to_event_data())
+            else:
+                event_bus.publish_on_commit('discount.deactivated', {'product_id': product_id})
 
 
 class DiscountCode(models.Model):
@@ -113,6 +198,8 @@ class DiscountCode(models.Model):
     )
     usage_count = models.IntegerField(default=0, verbose_name='Использований')
     is_active = models.BooleanField(default=True, verbose_name='Активен')
+    # Промокод массовой рассылки: использования считаются в Redis (redemption.py)
+    is_hot = models.BooleanField(default=False, verbose_name='Горячий промокод')
     min_purchase_amount = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -129,6 +216,17 @@ class DiscountCode(models.Model):
     
     def __str__(self):
         return f"{self.code} ({self.discount_percentage}%)"
+
+    def save(self, *args, **kwargs):
+        # Промокоды ищутся без учета регистра - храним в одном виде
+        self.code = normalize_code(self.code)
+        super().save(*args, **kwargs)
+        code_cache.invalidate(self.code)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        code_cache.invalidate(self.code)
+        return result
     
     def is_valid(self):
         """Проверка валидности промокода"""
@@ -142,9 +240,23 @@ class DiscountCode(models.Model):
         return True
     
     def use_code(self):
-        """Использование промокода"""
-        if self.is_valid():
-            self.usage_count += 1
-            self.save()
-            return True
-        return False
+        """
+        Использование промокода: активность, срок действия и лимит проверяются в одном условном
+        UPDATE, поэтому параллельные применения не превышают usage_limit и не теряют увеличения.
+        """
+        now = timezone.now()
+        if code_counter.is_enabled(self):
+            used = self.is_active and self.valid_from <= now <= self.valid_to and code_counter.redeem(self)
+        else:
+            used = DiscountCode.objects.filter(
+                pk=self.pk, is_active=True, valid_from__lte=now, valid_to__gte=now
+            ).filter(
+                # Лимит 0 или пустой - без ограничений, как в is_valid
+                Q(usage_limit__isnull=True) | Q(usage_limit=0) | Q(usage_count__lt=F('usage_limit'))
+            ).update(usage_count=F('usage_count') + 1, updated_at=now)
+            if used:
+                self.refresh_from_db(fields=['usage_count', 'updated_at'])
+        if used:
+            # Число использований в кэше этого процесса устарело
+            code_cache.forget(self.code)
+        return bool(used)
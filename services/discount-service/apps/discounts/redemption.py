@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from shared.hot_counters import HotCounters
+from .services import event_bus
+
+# KEYS: использования, несохраненная дельта, список измененных; ARGV: лимит (0 - без лимита), id.
+# -2 - счетчик не загружен, -1 - лимит исчерпан, иначе новое число использований
+REDEEM_SCRIPT = """
+local uses = redis.call('GET', KEYS[1])
+if not uses then
+    return -2
+end
+local limit = tonumber(ARGV[1])
+if limit > 0 and tonumber(uses) >= limit then
+    return -1
+end
+redis.call('INCR', KEYS[2])
+redis.call('SADD', KEYS[3], ARGV[2])
+return redis.call('INCR', KEYS[1])
+"""
+
+
+class CodeRedemptionCounter(HotCounters):
+    """
+    Использования горячих промокодов (DiscountCode.is_hot, массовые рассылки): сравнение с
+    usage_limit и увеличение счетчика - один Lua скрипт, поэтому тысячи одновременных
+    применений не выстраиваются в очередь на блокировку строки промокода и не превышают лимит.
+    В usage_count использования попадают пачками (flush_code_redemptions).
+    """
+
+    prefix = 'discount_codes'
+    value_name = 'uses'
+
+    @property
+    def config(self):
+        return settings.HOT_DISCOUNT_CODES
+
+    @property
+    def redis(self):
+        return event_bus.redis_client
+
+    def db_value(self, discount_code):
+        return discount_code.usage_count
+
+    def hot_ids(self):
+        from .models import DiscountCode
+        return DiscountCode.objects.filter(is_hot=True).values_list('id', flat=True)
+
+    def apply_delta(self, code_id, delta):
+        from .models import DiscountCode
+
+        if delta:
+            DiscountCode.objects.filter(id=code_id).update(
+                usage_count=F('usage_count') + delta,
+                updated_at=timezone.now()
+            )
+        return DiscountCode.objects.filter(id=code_id).first()
+
+    def redeem(self, discount_code):
+        """Атомарное использование промокода, если лимит не исчерпан"""
+        args = [discount_code.usage_limit or 0, discount_code.id]
+        return self.run(REDEEM_SCRIPT, discount_code, args) >= 0
+
+
+code_counter = CodeRedemptionCounter()
@@ -26,12 +26,13 @@ class DiscountSerializer(serializers.ModelSerializer):
         decimal_places=2,
         read_only=True
     )
+    ends_at = serializers.DateTimeField(source='holiday.end_date', read_only=True)
     
     class Meta:
         model = Discount
         fields = [
             'id', 'product_id', 'holiday', 'holiday_name',
-            'original_price', 'discounted_price', 'discount_percentage',
+            'original_price', 'discounted_price', 'discount_percentage', 'ends_at',
             'is_active', 'created_at', 'updated_at'
         ]
         read_only_fields = ['discounted_price', 'created_at', 'updated_at']
@@ -0,0 +1,43 @@
+import json
+import time
+import redis
+import logging
+from django.conf import settings
+from django.db import transaction
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """Сервис для публикации событий"""
+
+    def __init__(self):
+        self.redis_client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            decode_responses=True
+        )
+
+    def publish_event(self, event_type: str, data: Dict[str, Any]):
+        """Публикация события"""
+
+        try:
+            event_data = {
+                'type': event_type,
+                'data': data,
+                'timestamp': time.time()
+            }
+
+            self.redis_client.publish('events', json.dumps(event_data, default=str))
+            logger.info(f"Published event: {event_type}")
+
+        except Exception as e:
+            logger.error(f"Failed to publish event {event_type}: {e}")
+
+    def publish_on_commit(self, event_type: str, data: Dict[str, Any]):
+        """Публикация после фиксации транзакции: откаченные изменения не попадают к подписчикам"""
+        transaction.on_commit(lambda: self.publish_event(event_type, data))
+
+event_bus = EventBus()
@@ -1,8 +1,23 @@
-from django.test import TestCase
+import importlib
+import threading
+from unittest import mock
+
+import redis
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
+from shared.hot_counters import RECONCILE_SCRIPT
+from .code_cache import BloomFilter, code_cache
+from .index import WindowIndex, discount_index
+from .redemption import code_counter
 from .models import Holiday, Discount, DiscountCode
+from .services import event_bus
+
+# Отдельная БД Redis для тестов на реальном Redis: очищается перед каждым тестом
+REDIS_TEST_DB = 15
 
 
 class HolidayModelTest(TestCase):
@@ -136,3 +151,364 @@ class DiscountCodeModelTest(TestCase):
         self.assertTrue(result)
         self.code.refresh_from_db()
         self.assertEqual(self.code.usage_count, initial_uses + 1)
+
+
+class DiscountsByProductsViewTest(TestCase):
+    """Тесты пакетного получения скидок"""
+
+    def setUp(self):
+        now = timezone.now()
+        holiday = Holiday.objects.create(
+            name='Black Friday',
+            holiday_type='black_friday',
+            start_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=1),
+            discount_percentage=Decimal('20.00')
+        )
+        past = Holiday.objects.create(
+            name='New Year',
+            holiday_type='new_year',
+            start_date=now - timedelta(days=10),
+            end_date=now - timedelta(days=5),
+            discount_percentage=Decimal('10.00')
+        )
+        Discount.objects.create(product_id=1, holiday=holiday, original_price=Decimal('100.00'),
+                                discounted_price=Decimal('0'))
+        Discount.objects.create(product_id=2, holiday=past, original_price=Decimal('50.00'),
+                                discounted_price=Decimal('0'))
+
+    def test_active_discounts_for_many_products(self):
+        """Тест: одним запросом возвращаются только действующие скидки"""
+        response = self.client.get('/api/discounts/products/by_products/', {'product_ids': '1,2,3'})
+
+        self.assertEqual(response.status_code, 200)
+        discounts = response.json()['discounts']
+        self.assertEqual(list(discounts), ['1'])
+        self.assertEqual(discounts['1']['discounted_price'], '80.00')
+        self.assertEqual(discounts['1']['discount_percentage'], '20.00')
+
+    def test_invalid_ids(self):
+        """Тест: некорректный или пустой список id"""
+        url = '/api/discounts/products/by_products/'
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'product_ids': '1,x'}).status_code, 400)
+
+
+@mock.patch('apps.discounts.services.event_bus.publish_event')
+class DiscountEventsTest(TestCase):
+    """Тесты публикации событий об изменении действующих скидок"""
+
+    def setUp(self):
+        now = timezone.now()
+        self.holiday = Holiday.objects.create(
+            name='Black Friday',
+            holiday_type='black_friday',
+            start_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=1),
+            discount_percentage=Decimal('20.00')
+        )
+
+    def published(self, mock_publish):
+        return [(call.args[0], call.args[1]['product_id']) for call in mock_publish.call_args_list]
+
+    def test_discount_save_and_delete(self, mock_publish):
+        """Тест: изменение скидки в админке публикует действующую скидку товара"""
+        with self.captureOnCommitCallbacks(execute=True):
+            discount = Discount.objects.create(product_id=1, holiday=self.holiday,
+                                               original_price=Decimal('100.00'), discounted_price=Decimal('0'))
+        self.assertEqual(self.published(mock_publish), [('discount.activated', 1)])
+        self.assertEqual(mock_publish.call_args.args[1]['discounted_price'], '80.00')
+
+        mock_publish.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            discount.delete()
+        self.assertEqual(self.published(mock_publish), [('discount.deactivated', 1)])
+
+    def test_holiday_boundaries(self, mock_publish):
+        """Тест: начало и окончание праздника публикуются планировщиком один раз"""
+        now = timezone.now()
+        upcoming = Holiday.objects.create(
+            name='Cyber Monday',
+            holiday_type='cyber_monday',
+            start_date=now + timedelta(days=1),
+            end_date=now + timedelta(days=2),
+            discount_percentage=Decimal('10.00')
+        )
+        Discount.objects.create(product_id=2, holiday=upcoming,
+                                original_price=Decimal('50.00'), discounted_price=Decimal('0'))
+        self.assertEqual(Holiday.announce_due(), 0)
+
+        Holiday.objects.filter(pk=upcoming.pk).update(start_date=now - timedelta(minutes=1))
+        mock_publish.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(Holiday.announce_due(), 1)
+        self.assertEqual(self.published(mock_publish), [('discount.activated', 2)])
+        self.assertEqual(Holiday.announce_due(), 0)
+
+        Holiday.objects.filter(pk=upcoming.pk).update(end_date=now - timedelta(seconds=1))
+        mock_publish.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(Holiday.announce_due(), 1)
+        self.assertEqual(self.published(mock_publish), [('discount.deactivated', 2)])
+
+
+class DiscountIndexTest(TestCase):
+    """Тесты индекса действующих скидок в памяти"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.sale = Holiday.objects.create(
+            name='Summer Sale',
+            holiday_type='summer_sale',
+            start_date=self.now - timedelta(days=10),
+            end_date=self.now + timedelta(days=10),
+            discount_percentage=Decimal('10.00')
+        )
+        self.friday = Holiday.objects.create(
+            name='Black Friday',
+            holiday_type='black_friday',
+            start_date=self.now + timedelta(days=1),
+            end_date=self.now + timedelta(days=2),
+            discount_percentage=Decimal('30.00')
+        )
+        Discount.objects.create(product_id=1, holiday=self.sale, original_price=Decimal('100.00'),
+                                discounted_price=Decimal('0'))
+        Discount.objects.create(product_id=1, holiday=self.friday, original_price=Decimal('100.00'),
+                                discounted_price=Decimal('0'))
+
+    def test_window_index_bounds_inclusive(self):
+        """Тест: границы окна включаются, пересекающиеся окна сохраняют порядок приоритета"""
+        t = lambda seconds: self.now + timedelta(seconds=seconds)
+        index = WindowIndex([(t(10), t(20), 'a'), (t(15), t(30), 'b')])
+        self.assertEqual(index.at(t(9)), [])
+        self.assertEqual(index.at(t(10)), ['a'])
+        self.assertEqual(index.at(t(17)), ['a', 'b'])
+        self.assertEqual(index.at(t(20)), ['a', 'b'])
+        self.assertEqual(index.at(t(30)), ['b'])
+        self.assertEqual(index.at(t(30.5)), [])
+
+    def test_lookup_at_time_without_queries(self):
+        """Тест: поиск скидки на момент времени не обращается к БД"""
+        discount_index.discounts_for(1)
+        with self.assertNumQueries(0):
+            now = discount_index.effective_for([1, 2])
+            later = discount_index.effective_for([1], self.now + timedelta(days=1, hours=1))
+            holidays = discount_index.active_holidays()
+
+        self.assertEqual(list(now), [1])
+        self.assertEqual(now[1].holiday, self.sale)
+        # Обе скидки действуют - применяется созданная последней, как в by_product
+        self.assertEqual(later[1].holiday, self.friday)
+        self.assertEqual(holidays, [self.sale])
+
+    def test_rebuilt_after_change(self):
+        """Тест: изменение праздника сразу видно в индексе"""
+        discount_index.discounts_for(1)
+        self.sale.is_active = False
+        self.sale.save()
+
+        self.assertEqual(discount_index.discounts_for(1), [])
+        response = self.client.post('/api/discounts/products/calculate/', {
+            'product_id': 1, 'original_price': '100.00'
+        }, content_type='application/json')
+        self.assertEqual(response.json()['discount_percentage'], 0)
+
+
+class CodeRedemptionTest(TestCase):
+    """Тесты атомарного использования промокодов"""
+
+    def setUp(self):
+        now = timezone.now()
+        self.code = DiscountCode.objects.create(
+            code='FLASH',
+            discount_percentage=Decimal('50.00'),
+            valid_from=now - timedelta(days=1),
+            valid_to=now + timedelta(days=1),
+            usage_limit=1
+        )
+
+    def test_limit_holds_for_concurrent_redemptions(self):
+        """Тест: два запроса, прочитавшие промокод до применения, не превышают лимит"""
+        first = DiscountCode.objects.get(pk=self.code.pk)
+        second = DiscountCode.objects.get(pk=self.code.pk)
+
+        self.assertTrue(first.use_code())
+        self.assertFalse(second.use_code())
+        self.code.refresh_from_db()
+        self.assertEqual(self.code.usage_count, 1)
+
+    def test_expired_code_not_used(self):
+        """Тест: срок действия проверяется в том же UPDATE"""
+        DiscountCode.objects.filter(pk=self.code.pk).update(valid_to=timezone.now() - timedelta(seconds=1))
+
+        self.assertFalse(self.code.use_code())
+
+    @override_settings(HOT_DISCOUNT_CODES={'ENABLED': True, 'FLUSH_INTERVAL': 1})
+    def test_hot_code_uses_counter(self):
+        """Тест: горячий промокод считается в Redis и записывается в БД пачкой"""
+        DiscountCode.objects.filter(pk=self.code.pk).update(is_hot=True, usage_limit=10)
+        self.code.refresh_from_db()
+        with mock.patch.object(code_counter, 'redeem', return_value=True) as redeem, \
+                mock.patch.object(code_cache, 'forget') as forget:
+            self.assertTrue(self.code.use_code())
+        redeem.assert_called_once_with(self.code)
+        forget.assert_called_once_with('FLASH')
+        self.code.refresh_from_db()
+        self.assertEqual(self.code.usage_count, 0)
+
+        scripts = {}
+
+        def script(source):
+            return scripts.setdefault(source, mock.Mock(return_value=3))
+
+        with mock.patch.object(event_bus, 'redis_client') as redis_client, \
+                mock.patch.object(code_counter, 'script', side_effect=script):
+            redis_client.sunion.return_value = set()
+            self.assertEqual(code_counter.flush(), 1)
+
+        self.code.refresh_from_db()
+        self.assertEqual(self.code.usage_count, 3)
+        scripts[RECONCILE_SCRIPT].assert_called_once_with(keys=code_counter.keys(self.code.id), args=[3])
+
+
+
+@override_settings(HOT_DISCOUNT_CODES={'ENABLED': True, 'FLUSH_INTERVAL': 1})
+class CodeRedemptionRedisTest(TestCase):
+    """Тесты лимита горячего промокода на реальном Redis (в отдельной БД Redis)"""
+
+    def setUp(self):
+        try:
+            redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, socket_connect_timeout=0.2).ping()
+        except redis.RedisError:
+            self.skipTest('Redis is not available')
+        client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=REDIS_TEST_DB,
+                             decode_responses=True)
+        client.flushdb()
+        self.addCleanup(client.flushdb)
+
+        for target, name, value in [(event_bus, 'redis_client', client), (code_counter, '_scripts', {})]:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        now = timezone.now()
+        self.code = DiscountCode.objects.create(
+            code='MASS',
+            discount_percentage=Decimal('20.00'),
+            valid_from=now - timedelta(days=1),
+            valid_to=now + timedelta(days=1),
+            usage_limit=5,
+            usage_count=1,
+            is_hot=True
+        )
+
+    def test_limit_holds_for_concurrent_redemptions(self):
+        """Тест: одновременные применения горячего промокода не превышают лимит"""
+        barrier = threading.Barrier(20)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(self.code.use_code())
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 20)
+        # Одно использование уже записано в БД
+        self.assertEqual(results.count(True), 4)
+
+        self.assertEqual(code_counter.flush(), 1)
+        self.code.refresh_from_db()
+        self.assertEqual(self.code.usage_count, 5)
+        self.assertFalse(self.code.use_code())
+
+
+class DiscountCodeCacheTest(TestCase):
+    """Тесты кэша поиска промокодов"""
+
+    def setUp(self):
+        now = timezone.now()
+        self.code = DiscountCode.objects.create(
+            code=' welcome10 ',
+            discount_percentage=Decimal('10.00'),
+            valid_from=now - timedelta(days=1),
+            valid_to=now + timedelta(days=1)
+        )
+        code_cache.load()
+
+    def test_bloom_filter(self):
+        """Тест: добавленные значения всегда находятся"""
+        bloom = BloomFilter(100, 0.01)
+        for i in range(100):
+            bloom.add(f'CODE{i}')
+        self.assertTrue(all(f'CODE{i}' in bloom for i in range(100)))
+        self.assertLess(sum(f'OTHER{i}' in bloom for i in range(1000)), 50)
+
+    def test_case_insensitive_and_cached(self):
+        """Тест: поиск без учета регистра, повторный - без запроса к БД"""
+        self.assertEqual(self.code.code, 'WELCOME10')
+        self.assertEqual(code_cache.get('Welcome10').pk, self.code.pk)
+        with self.assertNumQueries(0):
+            cached = code_cache.get('welcome10 ')
+        self.assertEqual(cached.pk, self.code.pk)
+        self.assertFalse(cached._state.adding)
+        self.assertTrue(cached.use_code())
+
+    def test_unknown_codes_without_queries(self):
+        """Тест: перебор несуществующих промокодов не доходит до БД"""
+        code_cache.get('NOPE0')
+        with self.assertNumQueries(0):
+            for i in range(20):
+                self.assertIsNone(code_cache.get(f'NOPE{i % 5}'))
+            response = self.client.post('/api/discounts/codes/validate_code/', {'code': 'NOPE1'},
+                                        content_type='application/json')
+        self.assertFalse(response.json()['valid'])
+
+    def test_invalidated_on_save(self):
+        """Тест: новый и измененный промокоды видны сразу"""
+        code_cache.get('SPRING')
+        DiscountCode.objects.create(
+            code='spring',
+            discount_percentage=Decimal('5.00'),
+            valid_from=self.code.valid_from,
+            valid_to=self.code.valid_to
+        )
+        self.assertIsNotNone(code_cache.get('SPRING'))
+
+        code_cache.get('WELCOME10')
+        self.code.is_active = False
+        self.code.save()
+        self.assertFalse(code_cache.get('WELCOME10').is_active)
+
+    def test_migration_normalizes_codes(self):
+        """Тест миграции: коды приводятся к виду для точного поиска, совпадения остаются различимыми"""
+        DiscountCode.objects.filter(pk=self.code.pk).update(code=' welcome10')
+        spring, welcome = DiscountCode.objects.bulk_create([
+            DiscountCode(code='Spring ', discount_percentage=Decimal('5.00'),
+                         valid_from=self.code.valid_from, valid_to=self.code.valid_to),
+            DiscountCode(code='WELCOME10', discount_percentage=Decimal('5.00'),
+                         valid_from=self.code.valid_from, valid_to=self.code.valid_to),
+        ])
+        migration = importlib.import_module('apps.discounts.migrations.0004_normalize_discount_codes')
+        migration.normalize_codes(django_apps, None)
+
+        codes = dict(DiscountCode.objects.values_list('pk', 'code'))
+        self.assertEqual(codes[self.code.pk], f'WELCOME10-{self.code.pk}')
+        self.assertEqual(codes[welcome.pk], 'WELCOME10')
+        code_cache.load()
+        self.assertEqual(code_cache.get('spring').pk, spring.pk)
+
+    def test_rebuilt_after_max_age(self):
+        """Тест: промокод, записанный в обход save, виден после перестройки по MAX_AGE"""
+        DiscountCode.objects.bulk_create([DiscountCode(
+            code='BULK1',
+            discount_percentage=Decimal('5.00'),
+            valid_from=self.code.valid_from,
+            valid_to=self.code.valid_to
+        )])
+        code_cache._loaded_at -= settings.DISCOUNT_CODE_CACHE['MAX_AGE'] + 1
+        self.assertIsNotNone(code_cache.get('BULK1'))
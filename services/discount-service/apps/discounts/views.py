@@ -1,7 +1,10 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
 from django.utils import timezone
+from .code_cache import code_cache
+from .index import discount_index
 from .models import Holiday, Discount, DiscountCode
 from .serializers import (
     HolidaySerializer, 
@@ -19,13 +22,7 @@ class HolidayViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Получить активные праздники на данный момент"""
-        now = timezone.now()
-        active_holidays = Holiday.objects.filter(
-            is_active=True,
-            start_date__lte=now,
-            end_date__gte=now
-        )
-        serializer = self.get_serializer(active_holidays, many=True)
+        serializer = self.get_serializer(discount_index.active_holidays(), many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
@@ -54,17 +51,43 @@ class DiscountViewSet(viewsets.ModelViewSet):
                 {'error': 'product_id is required'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not product_id.isdigit():
+            return Response(
+                {'error': 'product_id must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        discounts = Discount.objects.filter(
-            product_id=product_id,
-            is_active=True,
-            holiday__is_active=True,
-            holiday__start_date__lte=timezone.now(),
-            holiday__end_date__gte=timezone.now()
-        )
+        # Индекс в памяти процесса вместо JOIN с Holiday на каждый запрос
+        discounts = discount_index.discounts_for(product_id)
         serializer = self.get_serializer(discounts, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def by_products(self, request):
+        """Получить активные скидки для нескольких товаров одним запросом"""
+        try:
+            product_ids = [int(product_id) for product_id in request.query_params.get('product_ids', '').split(',') if product_id]
+        except ValueError:
+            return Response(
+                {'error': 'product_ids must be a comma-separated list of integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not product_ids:
+            return Response(
+                {'error': 'product_ids is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(product_ids) > settings.DISCOUNT_BATCH_MAX_IDS:
+            return Response(
+                {'error': f'No more than {settings.DISCOUNT_BATCH_MAX_IDS} product_ids per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        discounts = discount_index.effective_for(product_ids)
+        return Response({'discounts': {
+            str(product_id): self.get_serializer(discount).data for product_id, discount in discounts.items()
+        }})
+
     @action(detail=False, methods=['post'])
     def calculate(self, request):
         """Рассчитать скидку для товара"""
@@ -78,14 +101,13 @@ class DiscountViewSet(viewsets.ModelViewSet):
             )
         
         # Найти активные скидки для товара
-        now = timezone.now()
-        active_discount = Discount.objects.filter(
-            product_id=product_id,
-            is_active=True,
-            holiday__is_active=True,
-            holiday__start_date__lte=now,
-            holiday__end_date__gte=now
-        ).first()
+        try:
+            active_discount = discount_index.effective_for([int(product_id)]).get(int(product_id))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'product_id must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         if active_discount:
             return Response({
@@ -120,24 +142,24 @@ class DiscountCodeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            discount_code = DiscountCode.objects.get(code=code.upper())
-            if discount_code.is_valid():
-                serializer = self.get_serializer(discount_code)
-                return Response({
-                    'valid': True,
-                    'discount': serializer.data
-                })
-            else:
-                return Response({
-                    'valid': False,
-                    'error': 'Промокод недействителен или истек срок действия'
-                })
-        except DiscountCode.DoesNotExist:
+        # Поиск через кэш: известные и несуществующие промокоды не доходят до БД
+        discount_code = code_cache.get(code)
+        if discount_code is None:
             return Response({
                 'valid': False,
                 'error': 'Промокод не найден'
             })
+        if discount_code.is_valid():
+            serializer = self.get_serializer(discount_code)
+            return Response({
+                'valid': True,
+                'discount': serializer.data
+            })
+        else:
+            return Response({
+                'valid': False,
+                'error': 'Промокод недействителен или истек срок действия'
+            })
     
     @action(detail=False, methods=['post'])
     def apply(self, request):
@@ -149,42 +171,40 @@ class DiscountCodeViewSet(viewsets.ModelViewSet):
         code: str = serializer.validated_data['code']  # type: ignore
         total_amount = serializer.validated_data['total_amount']  # type: ignore
         
-        try:
-            discount_code = DiscountCode.objects.get(code=code.upper())
-            
-            if not discount_code.is_valid():
-                return Response({
-                    'success': False,
-                    'error': 'Промокод недействителен или истек срок действия'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            if total_amount < discount_code.min_purchase_amount:
-                return Response({
-                    'success': False,
-                    'error': f'Минимальная сумма покупки: {discount_code.min_purchase_amount}'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Применить промокод
-            if discount_code.use_code():
-                discount_amount = total_amount * (discount_code.discount_percentage / 100)
-                final_amount = total_amount - discount_amount
-                
-                return Response({
-                    'success': True,
-                    'code': discount_code.code,
-                    'original_amount': total_amount,
-                    'discount_amount': discount_amount,
-                    'final_amount': final_amount,
-                    'discount_percentage': discount_code.discount_percentage
-                })
-            else:
-                return Response({
-                    'success': False,
-                    'error': 'Не удалось применить промокод'
-                }, status=status.HTTP_400_BAD_REQUEST)
-                
-        except DiscountCode.DoesNotExist:
+        discount_code = code_cache.get(code)
+        if discount_code is None:
             return Response({
                 'success': False,
                 'error': 'Промокод не найден'
             }, status=status.HTTP_404_NOT_FOUND)
+
+        if not discount_code.is_valid():
+            return Response({
+                'success': False,
+                'error': 'Промокод недействителен или истек срок действия'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if total_amount < discount_code.min_purchase_amount:
+            return Response({
+                'success': False,
+                'error': f'Минимальная сумма покупки: {discount_code.min_purchase_amount}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Применить промокод
+        if discount_code.use_code():
+            discount_amount = total_amount * (discount_code.discount_percentage / 100)
+            final_amount = total_amount - discount_amount
+
+            return Response({
+                'success': True,
+                'code': discount_code.code,
+                'original_amount': total_amount,
+                'discount_amount': discount_amount,
+                'final_amount': final_amount,
+                'discount_percentage': discount_code.discount_percentage
+            })
+        else:
+            return Response({
+                'success': False,
+                'error': 'Не удалось применить промокод'
+            }, status=status.HTTP_400_BAD_REQUEST)
@@ -3,11 +3,17 @@ Django settings for discount service.
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Общие модули репозитория (shared/): в Docker копируются в /app/shared, локально берутся из корня репозитория
+REPO_DIR = BASE_DIR.parent.parent
+if (REPO_DIR / 'shared').is_dir() and str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-discount-service-key-change-in-production'
 
@@ -126,7 +132,33 @@ REST_FRAMEWORK = {
 
 # Redis settings
 REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
-REDIS_PORT = os.environ.get('REDIS_PORT', 6379)
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+REDIS_DB = 0
 
 # Service URLs
 PRODUCT_SERVICE_URL = os.environ.get('PRODUCT_SERVICE_URL', 'http://localhost:8001')
+
+# Максимум товаров в одном запросе by_products
+DISCOUNT_BATCH_MAX_IDS = 100
+
+# Индекс действующих скидок в памяти процесса: проверка версии в Redis и полное перестроение, секунд
+DISCOUNT_INDEX = {
+    'CHECK_INTERVAL': 1,
+    'MAX_AGE': 300,
+}
+
+# Счетчики использований горячих промокодов (DiscountCode.is_hot) в Redis; в БД их пишет flush_code_redemptions
+HOT_DISCOUNT_CODES = {
+    'ENABLED': os.environ.get('HOT_DISCOUNT_CODES_ENABLED', 'False') == 'True',
+    'FLUSH_INTERVAL': float(os.environ.get('HOT_DISCOUNT_CODES_FLUSH_INTERVAL', 1)),
+}
+
+# Кэш поиска промокодов в памяти процесса (время жизни записей - секунд)
+DISCOUNT_CODE_CACHE = {
+    'LOCAL_TTL': 30,
+    'NEGATIVE_TTL': 300,
+    'MAX_ENTRIES': 10000,
+    'CHECK_INTERVAL': 1,  # Проверка версии промокодов в Redis
+    'MAX_AGE': 300,  # Полная перестройка фильтра Блума, даже если версия не менялась
+    'BLOOM_ERROR_RATE': 0.01,
+}
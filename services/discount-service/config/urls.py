@@ -3,8 +3,13 @@ URL configuration for discount service.
 """
 from django.contrib import admin
 from django.urls import path, include
+from django.http import JsonResponse
+
+def health_check(request):
+    return JsonResponse({'status': 'healthy', 'service': 'discount-service'})
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('health/', health_check),
     path('api/discounts/', include('apps.discounts.urls')),
 ]
@@ -0,0 +1,72 @@
+import json
+import redis
+import threading
+import time
+import logging
+from django.conf import settings
+from shared.identity import identity_cache
+
+logger = logging.getLogger(__name__)
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener_thread():
+    """Запуск слушателя событий в фоновом потоке (один поток на процесс)"""
+    global _listener
+    if _listener is not None or not settings.EVENT_LISTENER_ENABLED:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=listen_forever, name='order-events', daemon=True)
+            _listener.start()
+
+
+def listen_forever():
+    """Прослушивание с переподключением при потере соединения с Redis"""
+    while True:
+        start_event_listener()
+        time.sleep(1)
+
+
+def start_event_listener():
+    """Запуск слушателя событий Redis"""
+    try:
+        # 1. Установка соединения с Redis
+        redis_client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, 
+                                   db=settings.REDIS_DB, decode_responses=True)
+
+        # 2. Подписка на канал 'events'
+        pubsub = redis_client.pubsub()
+        pubsub.subscribe('events')
+
+        logger.info("Order service event listener started")
+
+        # 3. Цикл прослушивания сообщений
+        for message in pubsub.listen():
+            if message['type'] == 'subscribe':
+                # События, пропущенные без подписки, неизвестны: сбрасываем локальный кэш
+                # и заново загружаем список отозванных токенов
+                identity_cache.clear_local()
+                identity_cache.load_revoked()
+            elif message['type'] == 'message':
+                try:
+                    # Десериализация и обработка события
+                    event_data = json.loads(message['data'])
+                    handle_event(event_data)
+                except Exception as e:
+                    # Ошибка во время обработки конкретного события
+                    logger.error(f"Error processing event: {e}")
+
+    except Exception as e:
+        # Критическая ошибка соединения с Redis (например, Redis недоступен)
+        logger.error(f"Redis connection error: {e}")
+
+
+def handle_event(event_data):
+    """Обработка событий"""
+    event_type = event_data.get('type')
+    data = event_data.get('data', {})
+
+    identity_cache.handle_event(event_type, data)
@@ -1,4 +1,8 @@
+import jwt
 from django.http import JsonResponse
+from django.utils.functional import SimpleLazyObject
+from shared.auth import decode_access_token, decode_identity_header
+from shared.identity import identity_cache
 from .services import UserService
 
 class JWTAuthenticationMiddleware:
@@ -23,14 +27,27 @@ class JWTAuthenticationMiddleware:
 
         token = auth_header.split(' ')[1]
 
-        # Проверяем токен через user-service
-        user_data = UserService.get_user_from_token(token)
-        if not user_data:
+        # Проверяем токен локально, без запроса к user-service
+        try:
+            claims = self.get_claims(request, token)
+        except jwt.InvalidTokenError:
             return JsonResponse({'error': 'Invalid token'}, status=401)
 
-        # Заполняем request данными пользователя
-        request.user_id = user_data['id']
-        request.user_email = user_data['email']
-        request.user_data = user_data
+        if identity_cache.is_revoked(claims.get('jti')):
+            return JsonResponse({'error': 'Token revoked'}, status=401)
+
+        # Заполняем request данными пользователя; профиль загружается лениво
+        request.user_id = int(claims['user_id'])
+        request.user_data = SimpleLazyObject(lambda: UserService.get_user_from_token(token, claims))
+        request.user_email = claims.get('email') or SimpleLazyObject(
+            lambda: (request.user_data or {}).get('email', '')
+        )
 
         return self.get_response(request)
+
+    def get_claims(self, request, token):
+        """Данные пользователя: из подписанного заголовка шлюза, иначе из самого токена"""
+        identity = request.headers.get('X-Identity')
+        if identity:
+            return decode_identity_header(identity)
+        return decode_access_token(token)
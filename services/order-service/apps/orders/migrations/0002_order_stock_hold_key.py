@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='stock_hold_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
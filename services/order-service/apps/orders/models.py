@@ -16,6 +16,7 @@ class Order(models.Model):
     shipping_address = models.TextField()
     user_email = models.EmailField(blank=True)
     user_name = models.CharField(max_length=200, blank=True)
+    stock_hold_key = models.CharField(max_length=64, blank=True)  # Ключ удержаний товаров в product-service
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
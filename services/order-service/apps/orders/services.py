@@ -3,7 +3,9 @@ import redis
 import json
 import logging
 from django.conf import settings
-from typing import Optional, Dict, Any, List
+from django.db import transaction
+from shared.identity import identity_cache
+from typing import Optional, Dict, Any, List, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +36,10 @@ class EventBus:
         except Exception as e:
             logger.error(f"Failed to publish event {event_type}: {e}")
 
+    def publish_on_commit(self, event_type: str, data: Dict[str, Any]):
+        """Публикация после фиксации транзакции: откаченные изменения не попадают к подписчикам"""
+        transaction.on_commit(lambda: self.publish_event(event_type, data))
+
 event_bus = EventBus()
 
 class CartService:
@@ -63,40 +69,92 @@ class ProductService:
     """Сервис для взаимодействия с Product Service"""
 
     @staticmethod
-    def reserve_products(items: List[Dict]) -> bool:
-        """Резервирование товаров"""
-        
+    def reserve_products(items: List[Dict]) -> Tuple[bool, List[Dict]]:
+        """Резервирование товаров одним запросом: все или ничего. Возвращает (успех, нехватки)"""
+
         try:
-            for item in items:
-                response = requests.post(
-                    f"{settings.PRODUCT_SERVICE_URL}/api/products/{item['product_id']}/reserve/",
-                    json={'quantity': item['quantity']},
-                    timeout=10
-                )
+            response = requests.post(
+                f"{settings.PRODUCT_SERVICE_URL}/api/products/reserve-batch/",
+                json={'items': items},
+                timeout=10
+            )
 
-                if response.status_code != 200:
-                    logger.error(f"Failed to reserve product {item['product_id']}")
-                    # В случае ошибки нужно откатить уже зарезервированные товары
-                    return False
+            if response.status_code != 200:
+                shortfalls = response.json().get('shortfalls', [])
+                logger.error(f"Failed to reserve products: {shortfalls or response.status_code}")
+                return False, shortfalls
 
-            return True
+            return True, []
 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             logger.error(f"Failed to reserve products: {e}")
+            return False, []
+
+    @staticmethod
+    def hold_products(hold_key: str, items: List[Dict]) -> Tuple[bool, List[Dict]]:
+        """Удержание товаров под заказ (до подтверждения или истечения). Возвращает (успех, нехватки)"""
+
+        try:
+            response = requests.post(
+                f"{settings.PRODUCT_SERVICE_URL}/api/products/holds/",
+                json={'hold_key': hold_key, 'items': items},
+                timeout=10
+            )
+
+            if response.status_code != 200:
+                shortfalls = response.json().get('shortfalls', [])
+                logger.error(f"Failed to hold products for {hold_key}: {shortfalls or response.status_code}")
+                return False, shortfalls
+
+            return True, []
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Failed to hold products for {hold_key}: {e}")
+            return False, []
+
+    @staticmethod
+    def confirm_holds(hold_key: str) -> bool:
+        """Подтверждение удержаний: товар списывается с остатка"""
+
+        try:
+            response = requests.post(
+                f"{settings.PRODUCT_SERVICE_URL}/api/products/holds/{hold_key}/confirm/",
+                timeout=10
+            )
+            if response.status_code != 200:
+                logger.error(f"Failed to confirm holds {hold_key}: {response.status_code}")
+            return response.status_code == 200
+
+        except requests.exceptions.RequestException as e:
+            # Удержания подтвердит product-service по событию order.created
+            logger.error(f"Failed to confirm holds {hold_key}: {e}")
             return False
-    
+
+    @staticmethod
+    def release_holds(hold_key: str):
+        """Освобождение удержаний (ошибка создания или отмена заказа)"""
+
+        try:
+            requests.post(
+                f"{settings.PRODUCT_SERVICE_URL}/api/products/holds/{hold_key}/release/",
+                timeout=10
+            )
+
+        except requests.exceptions.RequestException as e:
+            # Неподтвержденные удержания освободятся сами по истечении срока
+            logger.error(f"Failed to release holds {hold_key}: {e}")
+
     @staticmethod
     def release_products(items: List[Dict]):
-        """Освобождение зарезервированных товаров"""
-        
+        """Освобождение зарезервированных товаров одним запросом"""
+
         try:
-            for item in items:
-                requests.post(
-                    f"{settings.PRODUCT_SERVICE_URL}/api/products/{item['product_id']}/release/",
-                    json={'quantity': item['quantity']},
-                    timeout=10
-                )
-                
+            requests.post(
+                f"{settings.PRODUCT_SERVICE_URL}/api/products/release-batch/",
+                json={'items': items},
+                timeout=10
+            )
+
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to release products: {e}")
 
@@ -104,8 +162,11 @@ class UserService:
     """Сервис для взаимодействия с User Service"""
 
     @staticmethod
-    def get_user_from_token(token: str) -> Optional[Dict[str, Any]]:
-        """Получение информации о пользователе по токену"""
+    def get_user_from_token(token: str, claims: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Получение информации о пользователе по токену (через кэш, если переданы claims токена)"""
+        if claims is not None:
+            return identity_cache.get_or_fetch(token, claims, lambda: UserService.get_user_from_token(token))
+
         try:
             headers = {'Authorization': f'Bearer {token}'}
             response = requests.get(
@@ -1,6 +1,19 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import json
+import time
+from unittest import mock
+
+import jwt
+from django.http import JsonResponse
+from django.test import TestCase, RequestFactory, override_settings
 from decimal import Decimal
+from shared.identity import IdentityCache, identity_cache, token_hash
+from .middleware import JWTAuthenticationMiddleware
 from .models import Order, OrderItem
+from .services import ProductService, event_bus
+from .views import create_order
 
 
 class OrderModelTest(TestCase):
@@ -121,3 +134,221 @@ class OrderItemModelTest(TestCase):
         """Тест расчета подсуммы"""
         expected_subtotal = Decimal('99.99') * 2
         self.assertEqual(self.order_item.subtotal, expected_subtotal)
+
+
+def make_token(key='test-signing-key', **claims):
+    payload = {'token_type': 'access', 'user_id': 7, 'email': 'user@example.com', 'exp': int(time.time()) + 300}
+    payload.update(claims)
+    return jwt.encode(payload, key, algorithm='HS256')
+
+
+def make_identity(key='identity-key', **claims):
+    payload = {'user_id': 9, 'email': 'gateway@example.com', 'exp': int(time.time()) + 300, 'jti': 'abc'}
+    payload.update(claims)
+    encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).rstrip(b'=')
+    signature = base64.urlsafe_b64encode(hmac.new(key.encode(), encoded, hashlib.sha256).digest()).rstrip(b'=')
+    return f"{encoded.decode()}.{signature.decode()}"
+
+
+@override_settings(JWT_VERIFYING_KEYS=['test-signing-key', 'previous-signing-key'], EVENT_LISTENER_ENABLED=False,
+                   GATEWAY_IDENTITY_KEYS=['identity-key'])
+class JWTAuthenticationMiddlewareTest(TestCase):
+    """Тесты локальной проверки JWT токенов"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = JWTAuthenticationMiddleware(lambda request: JsonResponse({'ok': True}))
+
+    def call(self, token):
+        request = self.factory.get('/api/orders/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return request, self.middleware(request)
+
+    @mock.patch('apps.orders.middleware.UserService.get_user_from_token')
+    def test_valid_token_verified_locally(self, get_user):
+        """Тест проверки токена без запроса к user-service"""
+        request, response = self.call(make_token())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.user_id, 7)
+        self.assertEqual(request.user_email, 'user@example.com')
+        get_user.assert_not_called()
+
+    @mock.patch('apps.orders.middleware.UserService.get_user_from_token')
+    def test_profile_loaded_lazily(self, get_user):
+        """Тест ленивой загрузки профиля"""
+        get_user.return_value = {'id': 7, 'first_name': 'Ivan'}
+        request, _ = self.call(make_token())
+
+        self.assertEqual(request.user_data['first_name'], 'Ivan')
+        get_user.assert_called_once()
+
+    def test_rotated_key_accepted(self):
+        """Тест токена, подписанного другим ключом из списка (ротация)"""
+        _, response = self.call(make_token(key='previous-signing-key'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_tokens_rejected(self):
+        """Тест отказа для чужой подписи, истекшего и refresh токена"""
+        for token in (
+            make_token(key='unknown-key'),
+            make_token(exp=int(time.time()) - 60),
+            make_token(token_type='refresh'),
+            'not-a-token',
+        ):
+            _, response = self.call(token)
+            self.assertEqual(response.status_code, 401)
+
+    def test_gateway_identity_trusted(self):
+        """Тест данных пользователя из подписанного заголовка шлюза"""
+        request = self.factory.get('/api/', HTTP_AUTHORIZATION=f'Bearer {make_token()}',
+                                   HTTP_X_IDENTITY=make_identity())
+        response = self.middleware(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.user_id, 9)
+        self.assertEqual(request.user_email, 'gateway@example.com')
+
+    def test_invalid_gateway_identity_rejected(self):
+        """Тест отказа для чужой подписи и истекшего заголовка шлюза"""
+        for identity in (make_identity(key='unknown-key'), make_identity(exp=int(time.time()) - 60), 'garbage'):
+            request = self.factory.get('/api/', HTTP_AUTHORIZATION=f'Bearer {make_token()}',
+                                       HTTP_X_IDENTITY=identity)
+            self.assertEqual(self.middleware(request).status_code, 401)
+
+    def test_revoked_token_rejected(self):
+        """Тест отказа для отозванного токена"""
+        exp = int(time.time()) + 300
+        identity_cache.revoke('revoked-jti', exp)
+        self.addCleanup(identity_cache._revoked.pop, 'revoked-jti', None)
+
+        _, response = self.call(make_token(jti='revoked-jti', exp=exp))
+        self.assertEqual(response.status_code, 401)
+        _, response = self.call(make_token(jti='active-jti'))
+        self.assertEqual(response.status_code, 200)
+
+
+class IdentityCacheTest(TestCase):
+    """Тесты кэша профилей пользователей по токену"""
+
+    def setUp(self):
+        self.cache = IdentityCache()
+        self.cache._redis = mock.Mock()
+        self.cache._redis.get.return_value = None
+        self.cache._redis.smembers.return_value = set()
+        self.token = make_token()
+        self.claims = {'user_id': 7, 'exp': int(time.time()) + 300}
+
+    def test_profile_fetched_once(self):
+        """Тест повторного запроса профиля из кэша"""
+        fetch = mock.Mock(return_value={'id': 7})
+
+        self.assertEqual(self.cache.get_or_fetch(self.token, self.claims, fetch), {'id': 7})
+        self.assertEqual(self.cache.get_or_fetch(self.token, self.claims, fetch), {'id': 7})
+        fetch.assert_called_once()
+        self.cache._redis.pipeline.return_value.set.assert_called_once()
+
+    def test_shared_tier_used_on_local_miss(self):
+        """Тест чтения профиля из Redis без запроса к user-service"""
+        self.cache._redis.get.return_value = '{"id": 7}'
+        fetch = mock.Mock()
+
+        self.assertEqual(self.cache.get_or_fetch(self.token, self.claims, fetch), {'id': 7})
+        fetch.assert_not_called()
+
+    def test_user_updated_invalidates(self):
+        """Тест сброса профиля по событию user.updated"""
+        fetch = mock.Mock(side_effect=[{'id': 7, 'first_name': 'Ivan'}, {'id': 7, 'first_name': 'Petr'}])
+        self.cache.get_or_fetch(self.token, self.claims, fetch)
+        self.cache._redis.smembers.return_value = {token_hash(self.token)}
+
+        self.assertTrue(self.cache.handle_event('user.updated', {'user_id': 7}))
+
+        profile = self.cache.get_or_fetch(self.token, self.claims, fetch)
+        self.assertEqual(profile['first_name'], 'Petr')
+        self.cache._redis.delete.assert_called_with('identity:user:7', f"identity:{token_hash(self.token)}")
+
+    def test_token_revoked_event(self):
+        """Тест события token.revoked"""
+        exp = int(time.time()) + 300
+        self.cache.handle_event('token.revoked', {'user_id': 7, 'jti': 'abc', 'exp': exp})
+
+        self.assertTrue(self.cache.is_revoked('abc'))
+        self.assertFalse(self.cache.is_revoked('other'))
+        self.assertFalse(self.cache.is_revoked(None))
+
+
+class ProductServiceTest(TestCase):
+    """Тесты клиента product-service"""
+
+    @mock.patch('apps.orders.services.requests.post')
+    def test_reserve_in_one_request(self, post):
+        """Тест резервирования всех строк одним запросом"""
+        post.return_value = mock.Mock(status_code=200)
+        items = [{'product_id': 1, 'quantity': 2}, {'product_id': 2, 'quantity': 1}]
+
+        self.assertEqual(ProductService.reserve_products(items), (True, []))
+        post.assert_called_once()
+        self.assertTrue(post.call_args[0][0].endswith('/api/products/reserve-batch/'))
+        self.assertEqual(post.call_args.kwargs['json'], {'items': items})
+
+    @mock.patch('apps.orders.services.requests.post')
+    def test_reserve_shortfalls(self, post):
+        """Тест возврата нехваток при отказе"""
+        shortfalls = [{'product_id': 2, 'requested': 3, 'available': 1, 'reason': 'insufficient_stock'}]
+        post.return_value = mock.Mock(status_code=400)
+        post.return_value.json.return_value = {'success': False, 'shortfalls': shortfalls}
+
+        self.assertEqual(ProductService.reserve_products([{'product_id': 2, 'quantity': 3}]), (False, shortfalls))
+
+
+class CreateOrderViewTest(TestCase):
+    """Тесты оформления заказа"""
+
+    def setUp(self):
+        cart = {'total_amount': '20.00', 'items': [
+            {'product_id': 1, 'product_name': 'Mouse', 'quantity': 2, 'price': '10.00'},
+        ]}
+        patcher = mock.patch('apps.orders.views.CartService.get_user_cart', return_value=cart)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self):
+        request = RequestFactory().post('/api/orders/create/', {'shipping_address': 'Moscow'},
+                                        content_type='application/json')
+        request.user_id = 7
+        request.user_data = None
+        request.user_email = 'user@example.com'
+        return create_order(request)
+
+    @mock.patch.object(event_bus, 'publish_event')
+    @mock.patch('apps.orders.views.ProductService')
+    def test_holds_confirmed_after_commit(self, product_service, publish_event):
+        """Тест: товары удерживаются до создания заказа и подтверждаются после фиксации"""
+        product_service.hold_products.return_value = (True, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post()
+            # До фиксации транзакции заказ никому не объявлен
+            publish_event.assert_not_called()
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        hold_key, items = product_service.hold_products.call_args[0]
+        self.assertEqual(order.stock_hold_key, hold_key)
+        self.assertEqual(items, [{'product_id': 1, 'quantity': 2}])
+        product_service.confirm_holds.assert_called_once_with(hold_key)
+        self.assertEqual(publish_event.call_args[0][0], 'order.created')
+        self.assertEqual(publish_event.call_args[0][1]['hold_key'], hold_key)
+
+    @mock.patch('apps.orders.views.ProductService')
+    def test_shortfall_rejected(self, product_service):
+        """Тест отказа при нехватке товара"""
+        shortfalls = [{'product_id': 1, 'requested': 2, 'available': 1, 'reason': 'insufficient_stock'}]
+        product_service.hold_products.return_value = (False, shortfalls)
+
+        response = self.post()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['shortfalls'], shortfalls)
+        self.assertFalse(Order.objects.exists())
+        product_service.confirm_holds.assert_not_called()
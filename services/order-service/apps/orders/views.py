@@ -9,8 +9,9 @@ from .serializers import (
     OrderSerializer, CreateOrderSerializer,
     UpdateOrderStatusSerializer
 )
-from .services import CartService, ProductService, UserService, event_bus
+from .services import CartService, ProductService, event_bus
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -53,7 +54,10 @@ def create_order(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
     user_id = request.user_id
-    
+    # Ключ удержаний товаров этого оформления заказа
+    hold_key = uuid.uuid4().hex
+    held = False
+
     try:
         with transaction.atomic():
             # Получаем корзину пользователя
@@ -65,10 +69,8 @@ def create_order(request):
 
             logger.info(f"Cart data for user {user_id}: {len(cart_data['items'])} items")
 
-            # Получаем информацию о пользователе
-            user_data = UserService.get_user_from_token(token)
-            if not user_data:
-                return Response({'error': 'User not found'}, status=status.HTTP_400_BAD_REQUEST)
+            # Профиль пользователя загружается лениво, только если не хватает данных покупателя
+            user_data = request.user_data
 
             # Подготавливаем данные для резервирования
             items_to_reserve = [
@@ -79,11 +81,13 @@ def create_order(request):
                 for item in cart_data['items']
             ]
 
-            # Резервируем товары
-            logger.info(f"Reserving products: {items_to_reserve}")
-            if not ProductService.reserve_products(items_to_reserve):
+            # Удерживаем товары; списание - подтверждением после фиксации заказа
+            logger.info(f"Holding products {items_to_reserve} with key {hold_key}")
+            held, shortfalls = ProductService.hold_products(hold_key, items_to_reserve)
+            if not held:
                 return Response({
-                    'error': 'Failed to reserve products. Some items may be out of stock.'
+                    'error': 'Failed to reserve products. Some items may be out of stock.',
+                    'shortfalls': shortfalls
                 }, status=status.HTTP_400_BAD_REQUEST)
 
             # Формируем имя пользователя
@@ -91,16 +95,17 @@ def create_order(request):
             if customer_info:
                 user_name = f"{customer_info.get('first_name', '')} {customer_info.get('last_name', '')}".strip()
 
-            if not user_name:
+            if not user_name and user_data:
                 user_name = f"{user_data.get('first_name', '')} {user_data.get('last_name', '')}".strip()
 
             # Создаем заказ
             order = Order.objects.create(
                 user_id=user_id,
                 shipping_address=shipping_address,
-                user_email=customer_info.get('email') if customer_info else user_data.get('email', ''),
+                user_email=customer_info.get('email') if customer_info else str(request.user_email),
                 user_name=user_name,
-                total_amount=cart_data['total_amount']
+                total_amount=cart_data['total_amount'],
+                stock_hold_key=hold_key
             )
 
             logger.info(f"Created order {order.id} for user {user_id}")
@@ -127,15 +132,19 @@ def create_order(request):
                 order.shipping_address += f"\n\nSpecial Instructions: {special_instructions}"
                 order.save()
 
-            # Публикуем событие
-            event_bus.publish_event('order.created', {
+            # Публикуем событие после фиксации: подписчики не увидят откаченный заказ
+            event_bus.publish_on_commit('order.created', {
                 'order_id': order.id,
                 'user_id': order.user_id,
                 'total_amount': str(order.total_amount),
                 'items': order_items,
-                'customer_info': customer_info
+                'customer_info': customer_info,
+                'hold_key': hold_key
             })
 
+            # Если подтверждение не дойдет, product-service подтвердит удержания по order.created
+            transaction.on_commit(lambda: ProductService.confirm_holds(hold_key))
+
             logger.info(f"Order {order.id} created successfully for user {user_id}")
 
             return Response(
@@ -146,7 +155,8 @@ def create_order(request):
     except Exception as e:
         # Освобождаем товары, если что-то пошло не так
         logger.error(f"Failed to create order, releasing products: {e}")
-        ProductService.release_products(items_to_reserve)
+        if held:
+            ProductService.release_holds(hold_key)
 
         return Response(
             {
@@ -193,12 +203,16 @@ def update_order_status(request, pk):
                     'quantity': item.quantity
                 })
 
-            ProductService.release_products(items_to_release)
+            if order.stock_hold_key:
+                ProductService.release_holds(order.stock_hold_key)
+            else:
+                ProductService.release_products(items_to_release)
 
             event_bus.publish_event('order.cancelled', {
                 'order_id': order.id,
                 'user_id': order.user_id,
-                'items': items_to_release
+                'items': items_to_release,
+                'hold_key': order.stock_hold_key
             })
 
         return Response(OrderSerializer(order).data)
@@ -1,8 +1,14 @@
 import os
+import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Общие модули репозитория (shared/): в Docker копируются в /app/shared, локально берутся из корня репозитория
+REPO_DIR = BASE_DIR.parent.parent
+if (REPO_DIR / 'shared').is_dir() and str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'order-service-secret-key-change-in-production')
 DEBUG = os.environ.get('DEBUG', 'True') == 'True'
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0', 'order-service', '*']
@@ -110,7 +116,27 @@ PRODUCT_SERVICE_URL = os.environ.get('PRODUCT_SERVICE_URL', 'http://localhost:80
 CART_SERVICE_URL = os.environ.get('CART_SERVICE_URL', 'http://localhost:8002')
 USER_SERVICE_URL = os.environ.get('USER_SERVICE_URL', 'http://localhost:8004')
 
+# Локальная проверка JWT токенов user-service (HS256, общий с user-service ключ подписи).
+# Ключи через запятую: во время ротации здесь одновременно старый и новый ключ
+JWT_ALGORITHM = 'HS256'
+JWT_VERIFYING_KEYS = os.environ.get('JWT_VERIFYING_KEYS', 'user-service-secret-key-change-in-production').split(',')
+JWT_LEEWAY = 10  # Секунд допустимого расхождения часов
+
+# Ключи подписи заголовка X-Identity от api-gateway (через запятую, для ротации).
+# С ним токен не разбирается: шлюз уже проверил его
+GATEWAY_IDENTITY_KEYS = os.environ.get('GATEWAY_IDENTITY_KEYS', 'gateway-identity-key-change-in-production').split(',')
+
 # Redis настройки
-REDIS_HOST = 'localhost'
-REDIS_PORT = 6379
-REDIS_DB = 0
\ No newline at end of file
+REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+REDIS_DB = 0
+
+# Кэш профилей пользователей по токену (сбрасывается событиями user.updated / token.revoked)
+IDENTITY_CACHE = {
+    'MAX_TTL': int(os.environ.get('IDENTITY_CACHE_MAX_TTL', 900)),
+    'LOCAL_TTL': int(os.environ.get('IDENTITY_CACHE_LOCAL_TTL', 60)),
+    'LOCAL_MAX_ENTRIES': 10000,
+}
+
+# Фоновый слушатель событий Redis (канал 'events')
+EVENT_LISTENER_ENABLED = os.environ.get('EVENT_LISTENER_ENABLED', 'True') == 'True'
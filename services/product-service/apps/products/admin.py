@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Category, Product
+from .models import Category, Product, ProductDiscount, StockHold
 from django.db import models
 
 
@@ -28,10 +28,10 @@ class CategoryAdmin(admin.ModelAdmin):
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'category', 'price', 'stock_quantity',
                     'in_stock', 'is_active', 'created_at')
-    list_filter = ('is_active', 'category', 'created_at', 'updated_at')
+    list_filter = ('is_active', 'is_hot', 'category', 'created_at', 'updated_at')
     search_fields = ('name', 'description', 'category__name')
     list_editable = ('is_active', 'price', 'stock_quantity')
-    readonly_fields = ('created_at', 'updated_at', 'in_stock_preview', 'image_preview')
+    readonly_fields = ('created_at', 'updated_at', 'reserved_quantity', 'in_stock_preview', 'image_preview')
     date_hierarchy = 'created_at'
     ordering = ('-created_at',)
 
@@ -40,7 +40,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('name', 'category', 'description', 'image_url', 'image_preview')
         }),
         ('Цена и наличие', {
-            'fields': ('price', 'stock_quantity', 'is_active', 'in_stock_preview')
+            'fields': ('price', 'stock_quantity', 'reserved_quantity', 'is_active', 'is_hot', 'in_stock_preview')
         }),
         ('Даты', {
             'fields': ('created_at', 'updated_at'),
@@ -74,3 +74,20 @@ class ProductAdmin(admin.ModelAdmin):
         return obj.is_in_stock
     in_stock_preview.short_description = 'На складе'
     in_stock_preview.boolean = True
+
+
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = ('hold_key', 'product', 'quantity', 'status', 'in_counter', 'expires_at', 'created_at')
+    list_filter = ('status', 'in_counter')
+    search_fields = ('hold_key',)
+    readonly_fields = ('hold_key', 'product', 'quantity', 'status', 'in_counter', 'expires_at', 'created_at',
+                       'updated_at')
+
+
+@admin.register(ProductDiscount)
+class ProductDiscountAdmin(admin.ModelAdmin):
+    list_display = ('product', 'discount_id', 'holiday_name', 'discounted_price', 'discount_percentage', 'ends_at')
+    search_fields = ('product__name', 'holiday_name')
+    readonly_fields = ('product', 'discount_id', 'holiday_name', 'discounted_price', 'discount_percentage', 'ends_at',
+                       'updated_at')
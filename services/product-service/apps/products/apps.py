@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from shared.process import is_server_process
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.products'
+
+    def ready(self):
+        # Один слушатель событий на процесс сервера (не на экземпляр middleware)
+        # Удержания заказов подтверждаются и освобождаются также по событиям order-service
+        if is_server_process():
+            from .event_handlers import start_listener_thread
+            start_listener_thread()
@@ -1,11 +1,34 @@
 import json
 import redis
 import threading
+import time
 import logging
 from django.conf import settings
+from django.db import close_old_connections
 
 logger = logging.getLogger(__name__)
 
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener_thread():
+    """Запуск слушателя событий в фоновом потоке (один поток на процесс)"""
+    global _listener
+    if _listener is not None or not settings.EVENT_LISTENER_ENABLED:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=listen_forever, name='product-events', daemon=True)
+            _listener.start()
+
+
+def listen_forever():
+    """Прослушивание с переподключением при потере соединения с Redis"""
+    while True:
+        start_event_listener()
+        time.sleep(1)
+
 
 def start_event_listener():
     """Запуск слушателя событий Redis"""
@@ -26,6 +49,8 @@ def start_event_listener():
             if message['type'] == 'message':
                 try:
                     event_data = json.loads(message['data'])
+                    # Поток живет долго: соединение с БД могло устареть
+                    close_old_connections()
                     handle_event(event_data)
                 except Exception as e:
                     logger.error(f"Error processing event: {e}")
@@ -36,13 +61,30 @@ def start_event_listener():
 
 def handle_event(event_data):
     """Обработка событий"""
+    from .models import Product, ProductDiscount, StockHold
+
     event_type = event_data.get('type')
     data = event_data.get('data', {})
 
-    if event_type == 'order.cancelled':
-        # Восстанавливаем количество товаров при отмене заказа
-        from .models import Product
+    if event_type == 'order.created' and data.get('hold_key'):
+        # Повторное подтверждение удержаний заказа (идемпотентно) - на случай,
+        # если синхронный вызов из order-service не дошел
+        shortfalls = StockHold.confirm(data['hold_key'])
+        if shortfalls:
+            logger.error(f"Order {data.get('order_id')} holds could not be confirmed: {shortfalls}")
+
+    elif event_type == 'order.cancelled' and data.get('hold_key'):
+        released = StockHold.release(data['hold_key'])
+        logger.info(f"Released {released} holds of cancelled order {data.get('order_id')}")
+
+    elif event_type == 'discount.activated':
+        ProductDiscount.apply(data)
 
+    elif event_type == 'discount.deactivated':
+        ProductDiscount.remove(data['product_id'])
+
+    elif event_type == 'order.cancelled':
+        # Восстанавливаем количество товаров при отмене заказа
         order_items = data.get('items', [])
         for item in order_items:
             try:
@@ -51,7 +93,3 @@ def handle_event(event_data):
                 logger.info(f"Released {item['quantity']} units of product {product.id}")
             except Product.DoesNotExist:
                 logger.warning(f"Product {item['product_id']} not found for release")
-
-if settings.DEBUG:
-    thread = threading.Thread(target=start_event_listener, daemon=True)
-    thread.start()
\ No newline at end of file
@@ -0,0 +1,94 @@
+import redis
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from shared.hot_counters import HotCounters
+
+# KEYS: доступный остаток, несохраненная дельта, список измененных; ARGV: количество, id.
+# -2 - счетчик не загружен, -1 - не хватает, иначе новый остаток
+RESERVE_SCRIPT = """
+local available = redis.call('GET', KEYS[1])
+if not available then
+    return -2
+end
+local quantity = tonumber(ARGV[1])
+if tonumber(available) < quantity then
+    return -1
+end
+redis.call('INCRBY', KEYS[2], -quantity)
+redis.call('SADD', KEYS[3], ARGV[2])
+return redis.call('DECRBY', KEYS[1], quantity)
+"""
+
+
+class HotInventory(HotCounters):
+    """
+    Остаток горячих товаров (Product.is_hot) в счетчиках Redis: резервирование - один
+    атомарный Lua скрипт вместо блокировки строки в PostgreSQL. Изменения копятся в
+    дельте и записываются в stock_quantity пачками (flush_hot_inventory), после чего
+    счетчик сверяется с БД, а подписчики получают product.stock_changed.
+    """
+
+    prefix = 'inventory'
+    value_name = 'available'
+
+    def __init__(self):
+        super().__init__()
+        self._redis = None
+
+    @property
+    def config(self):
+        return settings.HOT_INVENTORY
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                decode_responses=True
+            )
+        return self._redis
+
+    def db_value(self, product):
+        return product.available_quantity
+
+    def hot_ids(self):
+        from .models import Product
+        return Product.objects.filter(is_hot=True).values_list('id', flat=True)
+
+    def apply_delta(self, product_id, delta):
+        from .models import Product
+
+        if delta:
+            Product.objects.filter(id=product_id).update(
+                stock_quantity=F('stock_quantity') + delta,
+                updated_at=timezone.now()
+            )
+        product = Product.objects.filter(id=product_id).first()
+        if delta and product is not None:
+            product.publish_stock_changed()
+        return product
+
+    def available(self, product):
+        """Доступный остаток горячего товара"""
+        value = self.redis.get(self.keys(product.id)[0])
+        return int(value) if value is not None else self.load(product)
+
+    def reserve(self, product, quantity):
+        """Атомарное уменьшение счетчика, если остатка хватает"""
+        return self.run(RESERVE_SCRIPT, product, [quantity, product.id]) >= 0
+
+    def release(self, product, quantity):
+        available_key, pending_key = self.keys(product.id)
+        if not self.redis.exists(available_key):
+            self.load(product)
+        pipe = self.redis.pipeline()
+        pipe.incrby(available_key, quantity)
+        pipe.incrby(pending_key, quantity)
+        pipe.sadd(self.dirty_key, product.id)
+        pipe.execute()
+
+
+hot_inventory = HotInventory()
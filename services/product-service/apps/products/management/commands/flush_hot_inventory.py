@@ -0,0 +1,8 @@
+from shared.hot_counters import FlushCommand
+from apps.products.inventory import hot_inventory
+
+
+class Command(FlushCommand):
+    help = 'Запись счетчиков горячих товаров из Redis в БД и сверка счетчиков с БД'
+    counters = hot_inventory
+    message = 'Flushed {} hot products'
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.products.models import StockHold
+
+
+class Command(BaseCommand):
+    help = 'Освобождение истекших удержаний товаров (StockHold)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Удержаний за одну транзакцию')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд (0 - один проход и выход)')
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                expired = StockHold.expire_due(options['batch_size'])
+                total += expired
+                if expired < options['batch_size']:
+                    break
+            if total:
+                self.stdout.write(f"Expired {total} stock holds")
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.products.models import Product, ProductDiscount
+from apps.products.services import DiscountService
+
+
+class Command(BaseCommand):
+    help = 'Полная сверка таблицы ProductDiscount с discount-service (первичное заполнение, пропущенные события)'
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        applied = removed = 0
+        for start in range(0, len(product_ids), settings.DISCOUNT_BATCH_SIZE):
+            chunk = product_ids[start:start + settings.DISCOUNT_BATCH_SIZE]
+            discounts = DiscountService.get_discounts(chunk)
+            for product_id in chunk:
+                discount = discounts.get(product_id)
+                if discount is not None:
+                    ProductDiscount.apply({**discount, 'discount_id': discount['id']})
+                    applied += 1
+                else:
+                    removed += ProductDiscount.objects.filter(product_id=product_id).delete()[0]
+        self.stdout.write(f"Synced discounts: {applied} active, {removed} removed")
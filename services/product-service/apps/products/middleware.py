@@ -2,6 +2,7 @@ import jwt
 import requests
 from django.http import JsonResponse
 from django.conf import settings
+from shared.auth import decode_identity_header
 
 class JWTAuthenticationMiddleware:
     """Middleware для проверки JWT токенов от других сервисов"""
@@ -20,5 +21,15 @@ class JWTAuthenticationMiddleware:
                 # Пока что просто пропускаем
                 pass
 
+            # Токен проверен на api-gateway: доверяем подписанному заголовку
+            identity = request.headers.get('X-Identity')
+            if identity:
+                try:
+                    claims = decode_identity_header(identity)
+                except jwt.InvalidTokenError:
+                    return JsonResponse({'error': 'Invalid identity'}, status=401)
+                request.user_id = int(claims['user_id'])
+                request.user_email = claims.get('email', '')
+
         response = self.get_response(request)
         return response
\ No newline at end of file
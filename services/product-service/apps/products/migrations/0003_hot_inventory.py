@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_stock_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='is_hot',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='stockhold',
+            name='in_counter',
+            field=models.BooleanField(default=False),
+        ),
+    ]
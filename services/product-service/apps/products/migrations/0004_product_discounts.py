@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_hot_inventory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDiscount',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='discount', serialize=False, to='products.product')),
+                ('discount_id', models.IntegerField()),
+                ('holiday_name', models.CharField(blank=True, max_length=255)),
+                ('discounted_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('discount_percentage', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('ends_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,5 +1,12 @@
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
 from django.utils.text import slugify
+from .inventory import hot_inventory
+from .services import event_bus
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -19,36 +26,471 @@ class Category(models.Model):
     def __str__(self):
         return self.name
     
+class ProductQuerySet(models.QuerySet):
+    def with_effective_price(self):
+        """Цена с учетом действующей скидки (ProductDiscount) - для сортировки и фильтрации в SQL"""
+        return self.select_related('discount').annotate(effective_price=Case(
+            When(discount__ends_at__gte=timezone.now(), then=F('discount__discounted_price')),
+            default=F('price'),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2)
+        ))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     stock_quantity = models.IntegerField(default=0)
+    # Сумма активных удержаний (StockHold); меняется только атомарными UPDATE
+    reserved_quantity = models.IntegerField(default=0)
     image_url = models.URLField(blank=True)
     is_active = models.BooleanField(default=True)
+    # Горячий товар (распродажа): остаток резервируется через счетчики Redis (inventory.py)
+    is_hot = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
 
     def __str__(self):
         return self.name
-    
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        if not created and kwargs.get('update_fields') is None:
+            # reserved_quantity ведут удержания: полное сохранение не должно его затирать
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'reserved_quantity'
+            ]
+            super().save(*args, **kwargs)
+            event_bus.publish_on_commit('product.updated', self.to_event_data())
+            return
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) <= {'stock_quantity', 'updated_at'}:
+            # Изменился только остаток - короткое событие без полного снимка товара
+            self.publish_stock_changed()
+        else:
+            event_bus.publish_on_commit('product.created' if created else 'product.updated', self.to_event_data())
+
+    def delete(self, *args, **kwargs):
+        product_id = self.id
+        result = super().delete(*args, **kwargs)
+        event_bus.publish_on_commit('product.deleted', {'product_id': product_id})
+        return result
+
+    def to_event_data(self):
+        """Снимок товара для подписчиков (cart-service хранит его локально)"""
+        return {
+            'product_id': self.id,
+            'name': self.name,
+            'price': str(self.price),
+            'image_url': self.image_url,
+            'is_active': self.is_active,
+            'stock_quantity': self.stock_quantity,
+            'available_quantity': self.available_quantity,
+            'updated_at': self.updated_at.isoformat(),
+        }
+
+    @property
+    def available_quantity(self):
+        """Остаток за вычетом активных удержаний"""
+        return self.stock_quantity - self.reserved_quantity
+
     @property
     def is_in_stock(self):
-        return self.stock_quantity > 0
+        return self.available_quantity > 0
+
+    @property
+    def active_discount(self):
+        """Действующая скидка из локальной таблицы или None"""
+        try:
+            discount = self.discount
+        except ObjectDoesNotExist:
+            return None
+        return discount if discount.is_current() else None
+
+    @property
+    def uses_hot_inventory(self):
+        return hot_inventory.is_enabled(self)
+
+    def current_available_quantity(self):
+        """Доступный остаток с учетом еще не записанных в БД резервирований горячего товара"""
+        if self.uses_hot_inventory:
+            return hot_inventory.available(self)
+        return self.available_quantity
 
     def reserve_quantity(self, quantity):
-        """Резервирование количества товара"""
-        if self.stock_quantity >= quantity:
-            self.stock_quantity -= quantity
-            self.save()
-            return True
-        return False
+        """
+        Резервирование количества товара одним условным UPDATE:
+        остаток уменьшается только если его хватает, без чтения строки и блокировок.
+        """
+        if self.uses_hot_inventory:
+            return hot_inventory.reserve(self, quantity)
+        reserved = Product.objects.filter(id=self.id, stock_quantity__gte=F('reserved_quantity') + quantity).update(
+            stock_quantity=F('stock_quantity') - quantity,
+            updated_at=timezone.now()
+        )
+        self.refresh_from_db(fields=['stock_quantity', 'reserved_quantity', 'updated_at'])
+        if reserved:
+            self.publish_stock_changed()
+        return bool(reserved)
 
     def release_quantity(self, quantity):
-        """Освобождение зарезервированного количества"""
-        self.stock_quantity += quantity
-        self.save()
\ No newline at end of file
+        """Освобождение зарезервированного количества (атомарное увеличение остатка)"""
+        if self.uses_hot_inventory:
+            hot_inventory.release(self, quantity)
+            return
+        Product.objects.filter(id=self.id).update(
+            stock_quantity=F('stock_quantity') + quantity,
+            updated_at=timezone.now()
+        )
+        self.refresh_from_db(fields=['stock_quantity', 'reserved_quantity', 'updated_at'])
+        self.publish_stock_changed()
+
+    def publish_stock_changed(self):
+        event_bus.publish_on_commit('product.stock_changed', {
+            'product_id': self.id,
+            'stock_quantity': self.stock_quantity,
+            'available_quantity': self.available_quantity,
+            'updated_at': self.updated_at.isoformat(),
+        })
+
+    @classmethod
+    def reserve_many(cls, quantities):
+        """
+        Резервирование нескольких товаров в одной транзакции: все или ничего.
+        quantities - {id товара: количество}. Возвращает список нехваток (пустой - успех).
+        """
+        hot = cls.hot_products(quantities)
+        failed = cls.reserve_hot(hot, quantities)
+        if failed:
+            return cls.get_shortfalls({product_id: quantities[product_id] for product_id in failed})
+
+        now = timezone.now()
+        quantities_in_db = {k: v for k, v in quantities.items() if k not in hot}
+        with transaction.atomic():
+            # Условные UPDATE в порядке id: строки блокируются только на время транзакции
+            # и всегда в одном порядке - параллельные резервирования не дают взаимоблокировок
+            for product_id, quantity in sorted(quantities_in_db.items()):
+                reserved = cls.objects.filter(
+                    id=product_id, is_active=True, stock_quantity__gte=F('reserved_quantity') + quantity
+                ).update(
+                    stock_quantity=F('stock_quantity') - quantity,
+                    updated_at=now
+                )
+                if not reserved:
+                    failed.append(product_id)
+
+            if failed:
+                transaction.set_rollback(True)
+            else:
+                for product in cls.objects.filter(id__in=quantities_in_db):
+                    product.publish_stock_changed()
+
+        if failed:
+            cls.release_hot(hot, quantities)
+            return cls.get_shortfalls({product_id: quantities[product_id] for product_id in failed})
+        return []
+
+    @classmethod
+    def get_shortfalls(cls, quantities):
+        """Причины, по которым товары не удалось зарезервировать"""
+        products = cls.objects.in_bulk(list(quantities))
+        shortfalls = []
+        for product_id, quantity in sorted(quantities.items()):
+            product = products.get(product_id)
+            if product is None:
+                reason = 'not_found'
+            elif not product.is_active:
+                reason = 'inactive'
+            else:
+                reason = 'insufficient_stock'
+            shortfalls.append({
+                'product_id': product_id,
+                'requested': quantity,
+                'available': product.current_available_quantity() if product and product.is_active else 0,
+                'reason': reason
+            })
+        return shortfalls
+
+    @classmethod
+    def release_many(cls, quantities):
+        """Освобождение нескольких товаров в одной транзакции; возвращает id ненайденных"""
+        hot = cls.hot_products(quantities)
+        cls.release_hot(hot, quantities)
+
+        now = timezone.now()
+        not_found = []
+        quantities_in_db = {k: v for k, v in quantities.items() if k not in hot}
+        with transaction.atomic():
+            for product_id, quantity in sorted(quantities_in_db.items()):
+                released = cls.objects.filter(id=product_id).update(
+                    stock_quantity=F('stock_quantity') + quantity,
+                    updated_at=now
+                )
+                if not released:
+                    not_found.append(product_id)
+            for product in cls.objects.filter(id__in=quantities_in_db):
+                product.publish_stock_changed()
+        return not_found
+
+    @classmethod
+    def hot_products(cls, product_ids):
+        """Горячие товары из списка: {id: товар}, если счетчики Redis включены"""
+        if not settings.HOT_INVENTORY.get('ENABLED', False):
+            return {}
+        return cls.objects.filter(id__in=list(product_ids), is_hot=True).in_bulk()
+
+    @classmethod
+    def reserve_hot(cls, products, quantities):
+        """Резервирование горячих товаров в счетчиках: все или ничего; возвращает id нехватки"""
+        reserved = {}
+        for product_id, product in sorted(products.items()):
+            if not product.is_active or not hot_inventory.reserve(product, quantities[product_id]):
+                cls.release_hot(reserved, quantities)
+                return [product_id]
+            reserved[product_id] = product
+        return []
+
+    @staticmethod
+    def release_hot(products, quantities):
+        for product_id, product in products.items():
+            hot_inventory.release(product, quantities[product_id])
+
+
+class ProductDiscount(models.Model):
+    """
+    Действующая скидка товара - локальная копия, которую ведут события discount.activated /
+    discount.deactivated. Каталог читает ее из своей БД, без запросов к discount-service.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='discount')
+    discount_id = models.IntegerField()
+    holiday_name = models.CharField(max_length=255, blank=True)
+    discounted_price = models.DecimalField(max_digits=10, decimal_places=2)
+    discount_percentage = models.DecimalField(max_digits=5, decimal_places=2)
+    # Окончание праздника: скидка перестает действовать, даже если событие о ее снятии потерялось
+    ends_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Discount {self.discount_id} for product {self.product_id}: {self.discounted_price}"
+
+    def is_current(self):
+        return self.ends_at >= timezone.now()
+
+    def to_discount_info(self):
+        """Данные скидки в формате discount-service"""
+        return {
+            'id': self.discount_id,
+            'product_id': self.product_id,
+            'holiday_name': self.holiday_name,
+            'discounted_price': str(self.discounted_price),
+            'discount_percentage': str(self.discount_percentage),
+            'ends_at': self.ends_at.isoformat(),
+        }
+
+    @classmethod
+    def apply(cls, data):
+        """Сохранение скидки из события; скидки на неизвестные товары пропускаются"""
+        if not Product.objects.filter(id=data['product_id']).exists():
+            return None
+        discount, _ = cls.objects.update_or_create(product_id=data['product_id'], defaults={
+            'discount_id': data['discount_id'],
+            'holiday_name': data.get('holiday_name', ''),
+            'discounted_price': data['discounted_price'],
+            'discount_percentage': data['discount_percentage'],
+            'ends_at': data['ends_at'],
+        })
+        return discount
+
+    @classmethod
+    def remove(cls, product_id):
+        cls.objects.filter(product_id=product_id).delete()
+
+
+class StockHold(models.Model):
+    """
+    Удержание товара под заказ. Пока удержание активно, количество входит в
+    Product.reserved_quantity; по истечении expires_at его освобождает sweep_stock_holds.
+    """
+    ACTIVE = 'active'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (ACTIVE, 'Active'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    hold_key = models.CharField(max_length=64, db_index=True)  # Ключ заказа / идемпотентности
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=ACTIVE)
+    # Горячий товар: количество списано в счетчике Redis, reserved_quantity не используется
+    in_counter = models.BooleanField(default=False)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['hold_key', 'product']
+        indexes = [models.Index(fields=['status', 'expires_at'])]
+
+    def __str__(self):
+        return f"Hold {self.hold_key}: {self.quantity}x product {self.product_id} ({self.status})"
+
+    @classmethod
+    def place(cls, hold_key, quantities, ttl):
+        """
+        Удержание нескольких товаров: все или ничего. Повторный вызов с тем же ключом
+        возвращает уже созданные удержания. Возвращает (удержания, нехватки).
+        """
+        existing = list(cls.objects.filter(hold_key=hold_key))
+        if existing:
+            return existing, []
+
+        hot = Product.hot_products(quantities)
+        failed = Product.reserve_hot(hot, quantities)
+        if failed:
+            return [], Product.get_shortfalls({product_id: quantities[product_id] for product_id in failed})
+
+        now = timezone.now()
+        quantities_in_db = {k: v for k, v in quantities.items() if k not in hot}
+        try:
+            with transaction.atomic():
+                for product_id, quantity in sorted(quantities_in_db.items()):
+                    held = Product.objects.filter(
+                        id=product_id, is_active=True, stock_quantity__gte=F('reserved_quantity') + quantity
+                    ).update(reserved_quantity=F('reserved_quantity') + quantity, updated_at=now)
+                    if not held:
+                        failed.append(product_id)
+
+                if failed:
+                    transaction.set_rollback(True)
+                else:
+                    holds = cls.objects.bulk_create([
+                        cls(hold_key=hold_key, product_id=product_id, quantity=quantity,
+                            in_counter=product_id in hot, expires_at=now + timedelta(seconds=ttl))
+                        for product_id, quantity in sorted(quantities.items())
+                    ])
+                    for product in Product.objects.filter(id__in=quantities_in_db):
+                        product.publish_stock_changed()
+        except IntegrityError:
+            # Параллельный запрос с тем же ключом успел раньше - его результат и возвращаем
+            Product.release_hot(hot, quantities)
+            return list(cls.objects.filter(hold_key=hold_key)), []
+
+        if failed:
+            Product.release_hot(hot, quantities)
+            return [], Product.get_shortfalls({product_id: quantities[product_id] for product_id in failed})
+        return holds, []
+
+    @classmethod
+    def confirm(cls, hold_key):
+        """
+        Подтверждение: удержанное количество списывается с остатка. Истекшие удержания
+        списываются, только если товара по-прежнему хватает. Возвращает нехватки.
+        """
+        now = timezone.now()
+        failed = {}
+        counted = {}
+        with transaction.atomic():
+            holds = list(cls.objects.select_for_update(of=('self',)).filter(
+                hold_key=hold_key, status__in=[cls.ACTIVE, cls.EXPIRED]
+            ).select_related('product').order_by('product_id'))
+
+            for hold in holds:
+                if hold.in_counter:
+                    # Активное удержание уже списано в счетчике, истекшее - списываем заново
+                    if hold.status == cls.EXPIRED:
+                        if hot_inventory.reserve(hold.product, hold.quantity):
+                            counted[hold.product_id] = hold.product
+                        else:
+                            failed[hold.product_id] = hold.quantity
+                elif hold.status == cls.ACTIVE:
+                    Product.objects.filter(id=hold.product_id).update(
+                        stock_quantity=F('stock_quantity') - hold.quantity,
+                        reserved_quantity=F('reserved_quantity') - hold.quantity,
+                        updated_at=now
+                    )
+                elif not Product.objects.filter(
+                    id=hold.product_id, stock_quantity__gte=F('reserved_quantity') + hold.quantity
+                ).update(stock_quantity=F('stock_quantity') - hold.quantity, updated_at=now):
+                    failed[hold.product_id] = hold.quantity
+                hold.status = cls.CONFIRMED
+                hold.updated_at = now
+
+            if failed:
+                transaction.set_rollback(True)
+            else:
+                cls.objects.bulk_update(holds, ['status', 'updated_at'])
+                cls.publish_for(holds)
+
+        if failed:
+            Product.release_hot(counted, {hold.product_id: hold.quantity for hold in holds})
+            return Product.get_shortfalls(failed)
+        return []
+
+    @classmethod
+    def release(cls, hold_key):
+        """Освобождение удержаний ключа (в том числе подтвержденных - при отмене заказа)"""
+        now = timezone.now()
+        with transaction.atomic():
+            holds = list(cls.objects.select_for_update(of=('self',)).filter(
+                hold_key=hold_key, status__in=[cls.ACTIVE, cls.CONFIRMED]
+            ).select_related('product').order_by('product_id'))
+
+            for hold in holds:
+                if hold.in_counter:
+                    hot_inventory.release(hold.product, hold.quantity)
+                else:
+                    if hold.status == cls.ACTIVE:
+                        changes = {'reserved_quantity': F('reserved_quantity') - hold.quantity}
+                    else:
+                        changes = {'stock_quantity': F('stock_quantity') + hold.quantity}
+                    Product.objects.filter(id=hold.product_id).update(updated_at=now, **changes)
+                hold.status = cls.RELEASED
+                hold.updated_at = now
+
+            cls.objects.bulk_update(holds, ['status', 'updated_at'])
+            cls.publish_for(holds)
+        return len(holds)
+
+    @classmethod
+    def expire_due(cls, batch_size=500):
+        """Освобождение пачки истекших удержаний; возвращает их количество"""
+        now = timezone.now()
+        with transaction.atomic():
+            # skip_locked: несколько экземпляров sweeper'а не ждут друг друга
+            holds = list(cls.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                status=cls.ACTIVE, expires_at__lte=now
+            ).select_related('product').order_by('id')[:batch_size])
+
+            totals = {}
+            for hold in holds:
+                if hold.in_counter:
+                    hot_inventory.release(hold.product, hold.quantity)
+                    continue
+                totals[hold.product_id] = totals.get(hold.product_id, 0) + hold.quantity
+            for product_id, quantity in sorted(totals.items()):
+                Product.objects.filter(id=product_id).update(
+                    reserved_quantity=F('reserved_quantity') - quantity,
+                    updated_at=now
+                )
+
+            cls.objects.filter(id__in=[hold.id for hold in holds]).update(status=cls.EXPIRED, updated_at=now)
+            cls.publish_for(holds)
+        return len(holds)
+
+    @staticmethod
+    def publish_for(holds):
+        for product in Product.objects.filter(id__in={hold.product_id for hold in holds}):
+            product.publish_stock_changed()
@@ -1,8 +1,5 @@
 from rest_framework import serializers
 from .models import Category, Product
-import requests
-from django.conf import settings
-from decimal import Decimal
 
 class CategorySerializer(serializers.ModelSerializer):
     products_count = serializers.SerializerMethodField()
@@ -18,6 +15,7 @@ class CategorySerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     is_in_stock = serializers.BooleanField(read_only=True)
+    available_quantity = serializers.IntegerField(read_only=True)
     discounted_price = serializers.SerializerMethodField()
     discount_percentage = serializers.SerializerMethodField()
     has_discount = serializers.SerializerMethodField()
@@ -26,34 +24,15 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = [
             'id', 'name', 'description', 'price', 'category', 'category_name',
-            'stock_quantity', 'image_url', 'is_active', 'is_in_stock',
+            'stock_quantity', 'available_quantity', 'image_url', 'is_active', 'is_in_stock',
             'discounted_price', 'discount_percentage', 'has_discount',
             'created_at', 'updated_at'
         ]
     
     def get_discount_info(self, obj):
-        """Получить информацию о скидке из discount-service"""
-        # Кэшируем результат чтобы не делать несколько запросов
-        if not hasattr(self, '_discount_cache'):
-            self._discount_cache = {}
-        
-        if obj.id in self._discount_cache:
-            return self._discount_cache[obj.id]
-        
-        try:
-            discount_url = f"{settings.DISCOUNT_SERVICE_URL}/api/discounts/products/by_product/"
-            response = requests.get(discount_url, params={'product_id': obj.id}, timeout=2)
-            if response.status_code == 200:
-                discounts = response.json()
-                if discounts and len(discounts) > 0:
-                    self._discount_cache[obj.id] = discounts[0]
-                    return discounts[0]
-        except Exception as e:
-            print(f"Error getting discount info: {e}")
-            pass
-        
-        self._discount_cache[obj.id] = None
-        return None
+        """Действующая скидка из локальной таблицы (ведется событиями discount-service)"""
+        discount = obj.active_discount
+        return discount.to_discount_info() if discount else None
     
     def get_discounted_price(self, obj):
         """Получить цену со скидкой"""
@@ -74,6 +53,19 @@ class ProductSerializer(serializers.ModelSerializer):
         discount_info = self.get_discount_info(obj)
         return discount_info is not None
 
+class ProductBatchSerializer(serializers.ModelSerializer):
+    """Краткие данные товара для пакетного запроса (без обращения к discount-service)"""
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    is_in_stock = serializers.BooleanField(read_only=True)
+    available_quantity = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'price', 'category', 'category_name',
+            'stock_quantity', 'available_quantity', 'image_url', 'is_active', 'is_in_stock', 'updated_at'
+        ]
+
 class ProductDetailSerializer(ProductSerializer):
     category = CategorySerializer(read_only=True)
 
@@ -0,0 +1,68 @@
+import json
+import time
+import redis
+import requests
+import logging
+from django.conf import settings
+from django.db import transaction
+from typing import Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """Сервис для публикации событий"""
+
+    def __init__(self):
+        self.redis_client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            decode_responses=True
+        )
+
+    def publish_event(self, event_type: str, data: Dict[str, Any]):
+        """Публикация события"""
+
+        try:
+            event_data = {
+                'type': event_type,
+                'data': data,
+                'timestamp': time.time()
+            }
+
+            self.redis_client.publish('events', json.dumps(event_data, default=str))
+            logger.info(f"Published event: {event_type}")
+
+        except Exception as e:
+            logger.error(f"Failed to publish event {event_type}: {e}")
+
+    def publish_on_commit(self, event_type: str, data: Dict[str, Any]):
+        """Публикация после фиксации транзакции: откаченные изменения не попадают к подписчикам"""
+        transaction.on_commit(lambda: self.publish_event(event_type, data))
+
+event_bus = EventBus()
+
+
+class DiscountService:
+    """Сервис для взаимодействия с Discount Service"""
+
+    @staticmethod
+    def get_discounts(product_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Действующие скидки нескольких товаров: {id товара: скидка}, товары без скидки не входят.
+        Ошибка discount-service пробрасывается, чтобы не принять ее за отсутствие скидок.
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        discounts = {}
+        for start in range(0, len(product_ids), settings.DISCOUNT_BATCH_SIZE):
+            chunk = product_ids[start:start + settings.DISCOUNT_BATCH_SIZE]
+            response = requests.get(
+                f"{settings.DISCOUNT_SERVICE_URL}/api/discounts/products/by_products/",
+                params={'product_ids': ','.join(str(product_id) for product_id in chunk)},
+                timeout=10
+            )
+            response.raise_for_status()
+            for product_id, discount in response.json()['discounts'].items():
+                discounts[int(product_id)] = discount
+        return discounts
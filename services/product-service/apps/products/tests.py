@@ -1,6 +1,19 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
+
+import redis
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from decimal import Decimal
-from .models import Category, Product
+from .event_handlers import handle_event
+from shared.hot_counters import RECONCILE_SCRIPT, TAKE_PENDING_SCRIPT
+from .inventory import hot_inventory
+from .models import Category, Product, ProductDiscount, StockHold
+
+# Отдельная БД Redis для тестов на реальном Redis: очищается перед каждым тестом
+REDIS_TEST_DB = 15
 
 
 class CategoryModelTest(TestCase):
@@ -54,6 +67,26 @@ class ProductModelTest(TestCase):
         """Тест строкового представления"""
         self.assertEqual(str(self.product), 'Laptop')
 
+    def test_reserve_with_stale_instance(self):
+        """Тест: резервирование по устаревшему экземпляру не приводит к продаже сверх остатка"""
+        first = Product.objects.get(id=self.product.id)
+        second = Product.objects.get(id=self.product.id)
+
+        self.assertTrue(first.reserve_quantity(6))
+        self.assertFalse(second.reserve_quantity(6))
+        self.assertEqual(second.stock_quantity, 4)
+        self.assertTrue(second.reserve_quantity(4))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 0)
+
+    def test_release_is_atomic_increment(self):
+        """Тест: освобождение не затирает изменения, сделанные через другой экземпляр"""
+        stale = Product.objects.get(id=self.product.id)
+        self.product.reserve_quantity(3)
+        stale.release_quantity(1)
+
+        self.assertEqual(stale.stock_quantity, 8)
+
     def test_product_is_in_stock(self):
         """Тест свойства is_in_stock"""
         self.assertTrue(self.product.is_in_stock)
@@ -80,3 +113,465 @@ class ProductModelTest(TestCase):
         self.product.release_quantity(5)
         self.product.refresh_from_db()
         self.assertEqual(self.product.stock_quantity, 15)
+
+
+class ProductBatchViewTest(TestCase):
+    """Тесты пакетного получения товаров"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Electronics')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='', price=Decimal('10.00'),
+                                   category=category, stock_quantity=i)
+            for i in range(3)
+        ]
+
+    def test_products_returned_in_one_request(self):
+        """Тест получения нескольких товаров и списка ненайденных"""
+        ids = f"{self.products[0].id},{self.products[2].id},999999"
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/batch/', {'ids': ids})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual({p['id'] for p in data['products']}, {self.products[0].id, self.products[2].id})
+        self.assertEqual(data['not_found'], [999999])
+
+    def test_invalid_ids(self):
+        """Тест некорректного и слишком длинного списка id"""
+        self.assertEqual(self.client.get('/api/products/batch/', {'ids': '1,abc'}).status_code, 400)
+        ids = ','.join(str(i) for i in range(1, 102))
+        self.assertEqual(self.client.get('/api/products/batch/', {'ids': ids}).status_code, 400)
+
+
+class ProductDiscountTest(TestCase):
+    """Тесты локальной таблицы действующих скидок"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Electronics')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='', price=Decimal('10.00'),
+                                   category=category, stock_quantity=i)
+            for i in range(3)
+        ]
+        handle_event({'type': 'discount.activated', 'data': {
+            'product_id': self.products[1].id, 'discount_id': 5, 'holiday_name': 'Black Friday',
+            'discounted_price': '8.00', 'discount_percentage': '20.00',
+            'ends_at': (timezone.now() + timedelta(days=1)).isoformat()
+        }})
+
+    @mock.patch('requests.get')
+    def test_list_without_cross_service_calls(self, mock_get):
+        """Тест: скидки каталога читаются из своей БД, без запросов к discount-service"""
+        response = self.client.get('/api/products/', {'ordering': 'effective_price'})
+
+        self.assertEqual(response.status_code, 200)
+        mock_get.assert_not_called()
+        results = response.json()['results']
+        self.assertEqual(results[0]['id'], self.products[1].id)
+        self.assertEqual(results[0]['discounted_price'], '8.00')
+        self.assertFalse(results[1]['has_discount'])
+
+        on_sale = self.client.get('/api/products/', {'on_sale': 'true'}).json()['results']
+        self.assertEqual([p['id'] for p in on_sale], [self.products[1].id])
+        cheap = self.client.get('/api/products/', {'max_effective_price': '9'}).json()['results']
+        self.assertEqual([p['id'] for p in cheap], [self.products[1].id])
+
+    def test_discount_expires_in_running_process(self):
+        """Тест: скидка, истекшая после импорта view, не участвует в сортировке и фильтрах"""
+        from .views import ProductListView  # noqa: F401 - view уже импортирован до истечения скидки
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=2)):
+            on_sale = self.client.get('/api/products/', {'on_sale': 'true'}).json()['results']
+            cheap = self.client.get('/api/products/', {'max_effective_price': '9'}).json()['results']
+            detail = self.client.get(f'/api/products/{self.products[1].id}/').json()
+
+        self.assertEqual(on_sale, [])
+        self.assertEqual(cheap, [])
+        self.assertFalse(detail['has_discount'])
+
+    def test_deactivated_and_expired_discounts(self):
+        """Тест: снятая и истекшая скидки не применяются"""
+        ProductDiscount.objects.filter(product=self.products[1]).update(ends_at=timezone.now() - timedelta(seconds=1))
+        product = Product.objects.with_effective_price().get(id=self.products[1].id)
+        self.assertEqual(product.effective_price, Decimal('10.00'))
+        self.assertIsNone(product.active_discount)
+
+        handle_event({'type': 'discount.deactivated', 'data': {'product_id': self.products[1].id}})
+        self.assertFalse(ProductDiscount.objects.exists())
+
+
+class ProductEventsTest(TestCase):
+    """Тесты публикации событий об изменении товаров"""
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Laptop', description='', price=Decimal('999.99'),
+                                              category=Category.objects.create(name='Electronics'),
+                                              stock_quantity=10)
+
+    @mock.patch('apps.products.services.event_bus.publish_event')
+    def test_update_publishes_snapshot(self, publish):
+        """Тест события product.updated с полным снимком товара"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('899.99')
+            self.product.save()
+
+        publish.assert_called_once()
+        event_type, data = publish.call_args[0]
+        self.assertEqual(event_type, 'product.updated')
+        self.assertEqual(data['price'], '899.99')
+        self.assertEqual(data['stock_quantity'], 10)
+
+    @mock.patch('apps.products.services.event_bus.publish_event')
+    def test_reserve_publishes_stock_change(self, publish):
+        """Тест события product.stock_changed при резервировании"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.reserve_quantity(3)
+
+        publish.assert_called_once_with('product.stock_changed', {
+            'product_id': self.product.id,
+            'stock_quantity': 7,
+            'available_quantity': 7,
+            'updated_at': self.product.updated_at.isoformat(),
+        })
+
+    @mock.patch('apps.products.services.event_bus.publish_event')
+    def test_no_event_without_commit(self, publish):
+        """Тест: событие не публикуется до фиксации транзакции"""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.product.release_quantity(1)
+
+        self.assertEqual(len(callbacks), 1)
+        publish.assert_not_called()
+
+
+class ReserveBatchViewTest(TestCase):
+    """Тесты пакетного резервирования и освобождения товаров"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Electronics')
+        self.laptop = Product.objects.create(name='Laptop', description='', price=Decimal('999.99'),
+                                             category=category, stock_quantity=5)
+        self.mouse = Product.objects.create(name='Mouse', description='', price=Decimal('19.99'),
+                                            category=category, stock_quantity=1)
+
+    def post(self, url, items):
+        return self.client.post(url, {'items': items}, content_type='application/json')
+
+    def test_all_lines_reserved(self):
+        """Тест резервирования всех строк, повторы товара суммируются"""
+        response = self.post('/api/products/reserve-batch/', [
+            {'product_id': self.laptop.id, 'quantity': 2},
+            {'product_id': self.mouse.id, 'quantity': 1},
+            {'product_id': self.laptop.id, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.laptop.refresh_from_db()
+        self.mouse.refresh_from_db()
+        self.assertEqual(self.laptop.stock_quantity, 2)
+        self.assertEqual(self.mouse.stock_quantity, 0)
+
+    def test_nothing_reserved_on_shortfall(self):
+        """Тест: при нехватке одной строки не резервируется ничего"""
+        response = self.post('/api/products/reserve-batch/', [
+            {'product_id': self.laptop.id, 'quantity': 2},
+            {'product_id': self.mouse.id, 'quantity': 3},
+            {'product_id': 999999, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        shortfalls = {s['product_id']: s for s in response.json()['shortfalls']}
+        self.assertEqual(shortfalls[self.mouse.id]['available'], 1)
+        self.assertEqual(shortfalls[999999]['reason'], 'not_found')
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.stock_quantity, 5)
+
+    def test_release_batch(self):
+        """Тест пакетного освобождения"""
+        response = self.post('/api/products/release-batch/', [{'product_id': self.laptop.id, 'quantity': 3}])
+
+        self.assertEqual(response.status_code, 200)
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.stock_quantity, 8)
+
+    def test_invalid_items(self):
+        """Тест некорректных строк запроса"""
+        self.assertEqual(self.post('/api/products/reserve-batch/', []).status_code, 400)
+        self.assertEqual(self.post('/api/products/reserve-batch/',
+                                   [{'product_id': self.laptop.id, 'quantity': 0}]).status_code, 400)
+
+    def test_body_not_object(self):
+        """Тест ответа 400 на тело запроса - JSON массив"""
+        items = [{'product_id': self.laptop.id, 'quantity': 1}]
+        for url in ('/api/products/reserve-batch/', '/api/products/release-batch/', '/api/products/holds/'):
+            response = self.client.post(url, items, content_type='application/json')
+            self.assertEqual(response.status_code, 400, url)
+
+
+class StockHoldTest(TestCase):
+    """Тесты удержаний товаров под заказ"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Electronics')
+        self.laptop = Product.objects.create(name='Laptop', description='', price=Decimal('999.99'),
+                                             category=category, stock_quantity=5)
+        self.mouse = Product.objects.create(name='Mouse', description='', price=Decimal('19.99'),
+                                            category=category, stock_quantity=2)
+
+    def place(self, key, laptops=2, mice=1, ttl=900):
+        return StockHold.place(key, {self.laptop.id: laptops, self.mouse.id: mice}, ttl)
+
+    def test_hold_reduces_available_not_stock(self):
+        """Тест: удержание уменьшает доступный остаток, но не сам остаток"""
+        holds, shortfalls = self.place('order-1')
+
+        self.assertEqual(len(holds), 2)
+        self.assertEqual(shortfalls, [])
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.stock_quantity, 5)
+        self.assertEqual(self.laptop.available_quantity, 3)
+
+        _, shortfalls = self.place('order-2', laptops=1, mice=2)
+        self.assertEqual([s['product_id'] for s in shortfalls], [self.mouse.id])
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.reserved_quantity, 2)
+
+    def test_place_is_idempotent(self):
+        """Тест: повтор с тем же ключом не удерживает товар второй раз"""
+        self.place('order-1')
+        holds, _ = self.place('order-1')
+
+        self.assertEqual(len(holds), 2)
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.reserved_quantity, 2)
+
+    def test_confirm_and_release(self):
+        """Тест подтверждения (списание) и освобождения после подтверждения (отмена заказа)"""
+        self.place('order-1')
+        self.assertEqual(StockHold.confirm('order-1'), [])
+        self.assertEqual(StockHold.confirm('order-1'), [])
+        self.laptop.refresh_from_db()
+        self.assertEqual((self.laptop.stock_quantity, self.laptop.reserved_quantity), (3, 0))
+
+        self.assertEqual(StockHold.release('order-1'), 2)
+        self.assertEqual(StockHold.release('order-1'), 0)
+        self.laptop.refresh_from_db()
+        self.assertEqual((self.laptop.stock_quantity, self.laptop.reserved_quantity), (5, 0))
+
+    def test_expired_holds_swept(self):
+        """Тест освобождения истекших удержаний"""
+        self.place('order-1', ttl=-1)
+        self.place('order-2', laptops=1, mice=1)
+
+        self.assertEqual(StockHold.expire_due(), 2)
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.reserved_quantity, 1)
+        self.assertEqual(StockHold.objects.filter(hold_key='order-1', status=StockHold.EXPIRED).count(), 2)
+
+    def test_confirm_expired_hold_when_stock_left(self):
+        """Тест подтверждения истекшего удержания, пока товар еще есть"""
+        self.place('order-1', ttl=-1)
+        StockHold.expire_due()
+
+        self.assertEqual(StockHold.confirm('order-1'), [])
+        self.laptop.refresh_from_db()
+        self.assertEqual((self.laptop.stock_quantity, self.laptop.reserved_quantity), (3, 0))
+
+    def test_full_save_keeps_reserved_quantity(self):
+        """Тест: сохранение товара (например, из админки) не затирает удержания"""
+        stale = Product.objects.get(id=self.laptop.id)
+        self.place('order-1')
+        stale.price = Decimal('899.99')
+        stale.save()
+
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.reserved_quantity, 2)
+        self.assertEqual(self.laptop.price, Decimal('899.99'))
+
+    def test_fully_held_not_in_stock(self):
+        """Тест: товар, весь остаток которого удержан, не попадает в выборку in_stock"""
+        self.place('order-1', laptops=1, mice=2)
+
+        in_stock = self.client.get('/api/products/', {'in_stock': 'true'}).json()['results']
+        self.assertEqual([p['id'] for p in in_stock], [self.laptop.id])
+
+    def test_holds_api(self):
+        """Тест API удержаний"""
+        response = self.client.post('/api/products/holds/', {
+            'hold_key': 'order-1', 'items': [{'product_id': self.laptop.id, 'quantity': 1}]
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['holds'][0]['status'], 'active')
+
+        self.assertEqual(self.client.post('/api/products/holds/order-1/confirm/').status_code, 200)
+        self.assertEqual(self.client.post('/api/products/holds/order-1/release/').json()['released'], 1)
+
+
+@override_settings(HOT_INVENTORY={'ENABLED': True, 'FLUSH_INTERVAL': 1})
+class HotInventoryTest(TestCase):
+    """Тесты остатка горячих товаров в счетчиках Redis"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Electronics')
+        self.console = Product.objects.create(name='Console', description='', price=Decimal('499.99'),
+                                              category=category, stock_quantity=3, is_hot=True)
+        self.mouse = Product.objects.create(name='Mouse', description='', price=Decimal('19.99'),
+                                            category=category, stock_quantity=2)
+        # Вместо Lua скриптов - счетчики в словаре
+        self.counters = {}
+
+        def reserve(product, quantity):
+            available = self.counters.setdefault(product.id, product.available_quantity)
+            if available < quantity:
+                return False
+            self.counters[product.id] = available - quantity
+            return True
+
+        def release(product, quantity):
+            self.counters[product.id] = self.counters.setdefault(product.id, product.available_quantity) + quantity
+
+        for name, method in [('reserve', reserve), ('release', release)]:
+            patcher = mock.patch.object(hot_inventory, name, side_effect=method)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_reserve_uses_counter(self):
+        """Тест: резервирование горячего товара не меняет строку в БД"""
+        self.assertEqual(Product.reserve_many({self.console.id: 2, self.mouse.id: 1}), [])
+
+        self.assertEqual(self.counters[self.console.id], 1)
+        self.console.refresh_from_db()
+        self.mouse.refresh_from_db()
+        self.assertEqual(self.console.stock_quantity, 3)
+        self.assertEqual(self.mouse.stock_quantity, 1)
+
+    def test_reserve_many_releases_counter_on_shortfall(self):
+        """Тест: нехватка обычного товара возвращает количество в счетчик горячего"""
+        shortfalls = Product.reserve_many({self.console.id: 2, self.mouse.id: 5})
+
+        self.assertEqual([s['product_id'] for s in shortfalls], [self.mouse.id])
+        self.assertEqual(self.counters[self.console.id], 3)
+
+    def test_hold_in_counter(self):
+        """Тест удержания горячего товара: списание в счетчике и возврат при отмене"""
+        holds, shortfalls = StockHold.place('order-1', {self.console.id: 2}, 900)
+
+        self.assertEqual(shortfalls, [])
+        self.assertTrue(holds[0].in_counter)
+        self.console.refresh_from_db()
+        self.assertEqual(self.console.reserved_quantity, 0)
+        self.assertEqual(self.counters[self.console.id], 1)
+
+        self.assertEqual(StockHold.confirm('order-1'), [])
+        self.assertEqual(self.counters[self.console.id], 1)
+        StockHold.release('order-1')
+        self.assertEqual(self.counters[self.console.id], 3)
+
+    def test_flush_applies_pending_delta(self):
+        """Тест записи накопленной дельты в БД и сверки счетчика"""
+        scripts = {}
+
+        def script(source):
+            return scripts.setdefault(source, mock.Mock(return_value=-2))
+
+        with mock.patch.object(hot_inventory, '_redis', mock.Mock()) as redis_client, \
+                mock.patch.object(hot_inventory, 'script', side_effect=script), \
+                mock.patch('apps.products.services.event_bus.publish_event'):
+            redis_client.sunion.return_value = set()
+            self.assertEqual(hot_inventory.flush(), 1)
+
+        self.console.refresh_from_db()
+        self.assertEqual(self.console.stock_quantity, 1)
+        scripts[RECONCILE_SCRIPT].assert_called_once_with(
+            keys=hot_inventory.keys(self.console.id), args=[1]
+        )
+
+
+@override_settings(HOT_INVENTORY={'ENABLED': True, 'FLUSH_INTERVAL': 1})
+class HotInventoryRedisTest(TestCase):
+    """Тесты Lua скриптов горячего остатка на реальном Redis (в отдельной БД Redis)"""
+
+    def setUp(self):
+        try:
+            redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, socket_connect_timeout=0.2).ping()
+        except redis.RedisError:
+            self.skipTest('Redis is not available')
+        client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=REDIS_TEST_DB,
+                             decode_responses=True)
+        client.flushdb()
+        self.addCleanup(client.flushdb)
+
+        for name, value in [('_redis', client), ('_scripts', {})]:
+            patcher = mock.patch.object(hot_inventory, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.redis = client
+
+        category = Category.objects.create(name='Electronics')
+        self.console = Product.objects.create(name='Console', description='', price=Decimal('499.99'),
+                                              category=category, stock_quantity=5, is_hot=True)
+
+    def counters(self):
+        return [int(self.redis.get(key) or 0) for key in hot_inventory.keys(self.console.id)]
+
+    def test_no_oversell_under_concurrent_reserve(self):
+        """Тест: одновременные резервирования не продают больше остатка"""
+        barrier = threading.Barrier(20)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(hot_inventory.reserve(self.console, 1))
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(self.counters(), [0, -5])
+
+        self.assertEqual(hot_inventory.flush(), 1)
+        self.console.refresh_from_db()
+        self.assertEqual(self.console.stock_quantity, 0)
+        self.assertEqual(self.counters(), [0, 0])
+
+    def test_reserve_during_flush_not_lost(self):
+        """Тест: резервирование между TAKE_PENDING и сверкой остается в дельте и в счетчике"""
+        self.assertTrue(hot_inventory.reserve(self.console, 2))
+        take_pending = hot_inventory.script(TAKE_PENDING_SCRIPT)
+
+        def take_pending_then_reserve(*args, **kwargs):
+            delta = take_pending(*args, **kwargs)
+            self.assertTrue(hot_inventory.reserve(self.console, 1))
+            return delta
+
+        with mock.patch.dict(hot_inventory._scripts, {TAKE_PENDING_SCRIPT: take_pending_then_reserve}):
+            hot_inventory.flush()
+
+        self.console.refresh_from_db()
+        self.assertEqual(self.console.stock_quantity, 3)
+        # Остаток = БД (3) + несохраненная дельта (-1)
+        self.assertEqual(self.counters(), [2, -1])
+
+        hot_inventory.flush()
+        self.console.refresh_from_db()
+        self.assertEqual(self.console.stock_quantity, 2)
+        self.assertEqual(self.counters(), [2, 0])
+
+    def test_release_on_unloaded_counter(self):
+        """Тест: возврат в незагруженный счетчик (например, после перезапуска Redis) считается от БД"""
+        # Резервирование уже записано в БД, счетчиков в Redis нет
+        Product.objects.filter(id=self.console.id).update(stock_quantity=3)
+        self.console.refresh_from_db()
+
+        hot_inventory.release(self.console, 2)
+
+        self.assertEqual(self.counters(), [5, 2])
+        hot_inventory.flush()
+        self.console.refresh_from_db()
+        self.assertEqual(self.console.stock_quantity, 5)
+        self.assertEqual(self.counters(), [5, 0])
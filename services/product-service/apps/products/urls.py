@@ -5,6 +5,12 @@ urlpatterns = [
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     path('categories/<slug:slug>/', views.CategoryDetailView.as_view(), name='category-detail'),
     path('products/', views.ProductListView.as_view(), name='product-list'),
+    path('products/batch/', views.product_batch, name='product-batch'),
+    path('products/reserve-batch/', views.reserve_batch, name='reserve-batch'),
+    path('products/release-batch/', views.release_batch, name='release-batch'),
+    path('products/holds/', views.place_holds, name='place-holds'),
+    path('products/holds/<str:hold_key>/confirm/', views.confirm_holds, name='confirm-holds'),
+    path('products/holds/<str:hold_key>/release/', views.release_holds, name='release-holds'),
     path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
     path('products/<int:product_id>/reserve/', views.reserve_product, name='reserve-product'),
     path('products/<int:product_id>/release/', views.release_product, name='release-product'),
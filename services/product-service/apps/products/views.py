@@ -2,11 +2,12 @@ from rest_framework import generics, filters, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import F, Q
 
-from .models import Category, Product
+from .models import Category, Product, StockHold
 from .serializers import (
-    CategorySerializer, ProductSerializer,
+    CategorySerializer, ProductSerializer, ProductBatchSerializer,
     ProductDetailSerializer, ProductCreateUpdateSerializer
 )
 
@@ -27,23 +28,35 @@ class ProductListView(generics.ListCreateAPIView):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'is_active']
     search_fields = ['name', 'description']
-    ordering_fields = ['name', 'price', 'created_at']
+    ordering_fields = ['name', 'price', 'effective_price', 'created_at']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # Скидки - из локальной таблицы ProductDiscount одним JOIN; аннотация строится
+        # на каждый запрос, чтобы сравнение с ends_at шло с текущим временем
+        queryset = Product.objects.with_effective_price().filter(is_active=True)
 
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
         in_stock = self.request.query_params.get('in_stock')
+        min_effective_price = self.request.query_params.get('min_effective_price')
+        max_effective_price = self.request.query_params.get('max_effective_price')
+        on_sale = self.request.query_params.get('on_sale')
 
         if min_price is not None:
             queryset = queryset.filter(price__gte=min_price)
         if max_price is not None:
             queryset = queryset.filter(price__lte=max_price)
+        # Цена с учетом скидки
+        if min_effective_price is not None:
+            queryset = queryset.filter(effective_price__gte=min_effective_price)
+        if max_effective_price is not None:
+            queryset = queryset.filter(effective_price__lte=max_effective_price)
+        if on_sale is not None and str(on_sale).lower() in ('true', '1', 'yes'):
+            queryset = queryset.filter(effective_price__lt=F('price'))
         if in_stock is not None:
             if str(in_stock).lower() in ('true', '1', 'yes'):
-                queryset = queryset.filter(stock_quantity__gt=0)
+                queryset = queryset.filter(stock_quantity__gt=F('reserved_quantity'))
             elif str(in_stock).lower() in ('false', '0', 'no'):
                 pass  # можно ничего не фильтровать или фильтровать по нулю
 
@@ -58,7 +71,130 @@ class ProductDetailView(generics.RetrieveAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductDetailSerializer
     lookup_field = 'pk'
+
+    def get_queryset(self):
+        return Product.objects.with_effective_price()
  
+@api_view(['GET'])
+def product_batch(request):
+    """Пакетное получение товаров одним запросом: ?ids=1,2,3"""
+    try:
+        ids = list(dict.fromkeys(int(value) for value in request.query_params.get('ids', '').split(',') if value))
+    except ValueError:
+        return Response({'error': 'ids must be a comma-separated list of integers'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if len(ids) > settings.PRODUCT_BATCH_MAX_IDS:
+        return Response({'error': f'At most {settings.PRODUCT_BATCH_MAX_IDS} ids per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    products = Product.objects.select_related('category').filter(id__in=ids)
+    found = {product.id for product in products}
+    return Response({
+        'products': ProductBatchSerializer(products, many=True).data,
+        'not_found': [product_id for product_id in ids if product_id not in found]
+    })
+
+def parse_batch_items(data):
+    """Строки пакетного запроса -> {id товара: количество}; повторы товара суммируются"""
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('items must be a non-empty list')
+    if len(items) > settings.PRODUCT_BATCH_MAX_IDS:
+        raise ValueError(f'At most {settings.PRODUCT_BATCH_MAX_IDS} items per request')
+
+    quantities = {}
+    for item in items:
+        product_id = int(item['product_id'])
+        quantity = int(item['quantity'])
+        if quantity <= 0:
+            raise ValueError('quantity must be positive')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+@api_view(['POST'])
+def reserve_batch(request):
+    """Резервирование нескольких товаров одной транзакцией: все или ничего"""
+    try:
+        quantities = parse_batch_items(request.data)
+    except (ValueError, TypeError, KeyError) as e:
+        return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    shortfalls = Product.reserve_many(quantities)
+    if shortfalls:
+        return Response({
+            'success': False,
+            'message': 'Insufficient stock',
+            'shortfalls': shortfalls
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'success': True,
+        'reserved': [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()]
+    })
+
+@api_view(['POST'])
+def release_batch(request):
+    """Освобождение нескольких товаров одной транзакцией"""
+    try:
+        quantities = parse_batch_items(request.data)
+    except (ValueError, TypeError, KeyError) as e:
+        return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    not_found = Product.release_many(quantities)
+    return Response({'success': True, 'not_found': not_found})
+
+@api_view(['POST'])
+def place_holds(request):
+    """Удержание товаров под заказ на STOCK_HOLD_TTL секунд: все или ничего, идемпотентно по hold_key"""
+    try:
+        quantities = parse_batch_items(request.data)
+        ttl = min(int(request.data.get('ttl', settings.STOCK_HOLD_TTL)), settings.STOCK_HOLD_MAX_TTL)
+    except (ValueError, TypeError, KeyError) as e:
+        return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    hold_key = str(request.data.get('hold_key', ''))
+    if not hold_key or len(hold_key) > 64:
+        return Response({'success': False, 'message': 'hold_key is required (max 64 chars)'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    holds, shortfalls = StockHold.place(hold_key, quantities, ttl)
+    if shortfalls:
+        return Response({
+            'success': False,
+            'message': 'Insufficient stock',
+            'shortfalls': shortfalls
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'success': True,
+        'hold_key': hold_key,
+        'holds': [
+            {'product_id': hold.product_id, 'quantity': hold.quantity, 'status': hold.status,
+             'expires_at': hold.expires_at}
+            for hold in holds
+        ]
+    })
+
+@api_view(['POST'])
+def confirm_holds(request, hold_key):
+    """Подтверждение удержаний: товар списывается с остатка"""
+    shortfalls = StockHold.confirm(hold_key)
+    if shortfalls:
+        return Response({
+            'success': False,
+            'message': 'Hold expired and stock is no longer available',
+            'shortfalls': shortfalls
+        }, status=status.HTTP_409_CONFLICT)
+    return Response({'success': True})
+
+@api_view(['POST'])
+def release_holds(request, hold_key):
+    """Освобождение удержаний (отмена заказа)"""
+    released = StockHold.release(hold_key)
+    return Response({'success': True, 'released': released})
+
 @api_view(['POST'])
 def reserve_product(request, product_id):
     """Резервирование товара для заказа"""
@@ -76,7 +212,7 @@ def reserve_product(request, product_id):
             return Response({
                 'success': False,
                 'message': 'Insufficient stock',
-                'available_stock': product.stock_quantity
+                'available_stock': product.current_available_quantity()
             }, status=status.HTTP_400_BAD_REQUEST)
 
     except Product.DoesNotExist:
@@ -111,13 +247,15 @@ def check_availability(request, product_id):
     try:
         product = Product.objects.get(id=product_id)
         quantity = int(request.query_params.get('quantity', 1))
+        available = product.current_available_quantity()
 
         return Response({
             'product_id': product.id,
             'name': product.name,
             'price': str(product.price),
-            'available': product.stock_quantity >= quantity,
+            'available': available >= quantity,
             'stock_quantity': product.stock_quantity,
+            'available_quantity': available,
             'requested_quantity': quantity
         })
 
@@ -1,8 +1,14 @@
 import os
+import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Общие модули репозитория (shared/): в Docker копируются в /app/shared, локально берутся из корня репозитория
+REPO_DIR = BASE_DIR.parent.parent
+if (REPO_DIR / 'shared').is_dir() and str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'product-service-secret-key-change-in-production')
 DEBUG = os.environ.get('DEBUG', 'True') == 'True'
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0', 'product-service', '*']
@@ -107,9 +113,30 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Redis настройки
-REDIS_HOST = 'localhost'
-REDIS_PORT = 6379
+REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
 REDIS_DB = 0
 
 # Discount Service URL
-DISCOUNT_SERVICE_URL = os.environ.get('DISCOUNT_SERVICE_URL', 'http://localhost:8005')
\ No newline at end of file
+DISCOUNT_SERVICE_URL = os.environ.get('DISCOUNT_SERVICE_URL', 'http://localhost:8005')
+DISCOUNT_BATCH_SIZE = 100  # Товаров в одном запросе by_products (лимит discount-service)
+
+# Максимум товаров в одном пакетном запросе (batch, reserve-batch, release-batch)
+PRODUCT_BATCH_MAX_IDS = 100
+
+# Ключи подписи заголовка X-Identity от api-gateway (через запятую, для ротации)
+GATEWAY_IDENTITY_KEYS = os.environ.get('GATEWAY_IDENTITY_KEYS', 'gateway-identity-key-change-in-production').split(',')
+JWT_LEEWAY = 10  # Секунд допустимого расхождения часов
+
+# Удержания товара под заказ (StockHold): время жизни по умолчанию и максимум, секунд
+STOCK_HOLD_TTL = int(os.environ.get('STOCK_HOLD_TTL', 900))
+STOCK_HOLD_MAX_TTL = 3600
+
+# Фоновый слушатель событий Redis (канал 'events')
+EVENT_LISTENER_ENABLED = os.environ.get('EVENT_LISTENER_ENABLED', 'True') == 'True'
+
+# Счетчики остатка горячих товаров (Product.is_hot) в Redis; в БД их пишет flush_hot_inventory
+HOT_INVENTORY = {
+    'ENABLED': os.environ.get('HOT_INVENTORY_ENABLED', 'False') == 'True',
+    'FLUSH_INTERVAL': float(os.environ.get('HOT_INVENTORY_FLUSH_INTERVAL', 1)),
+}
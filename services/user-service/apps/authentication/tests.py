@@ -1,3 +1,54 @@
+from unittest import mock
+
+import jwt
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+User = get_user_model()
+
+
+class LoginViewTest(TestCase):
+    """Тесты входа и выдачи токенов"""
+
+    def setUp(self):
+        User.objects.create_user(email='test@example.com', username='testuser', password='testpass123')
+
+    def test_access_token_contains_email(self):
+        """Тест: access токен содержит email и проверяется ключом JWT_SIGNING_KEY"""
+        response = self.client.post('/api/auth/login/', {'email': 'test@example.com', 'password': 'testpass123'},
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        claims = jwt.decode(response.json()['access'], settings.JWT_SIGNING_KEY, algorithms=['HS256'])
+        self.assertEqual(claims['email'], 'test@example.com')
+        self.assertEqual(claims['token_type'], 'access')
+
+
+class LogoutViewTest(TestCase):
+    """Тесты выхода с отзывом токена"""
+
+    def setUp(self):
+        User.objects.create_user(email='test@example.com', username='testuser', password='testpass123')
+        response = self.client.post('/api/auth/login/', {'email': 'test@example.com', 'password': 'testpass123'},
+                                    content_type='application/json')
+        self.access = response.json()['access']
+
+    @mock.patch('apps.users.services.event_bus')
+    def test_logout_revokes_token(self, bus):
+        """Тест: jti токена попадает в список отозванных, публикуется token.revoked"""
+        response = self.client.post('/api/auth/logout/', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+        self.assertEqual(response.status_code, 200)
+        claims = jwt.decode(self.access, settings.JWT_SIGNING_KEY, algorithms=['HS256'])
+        bus.redis_client.pipeline.return_value.zadd.assert_called_once_with(
+            'revoked_tokens', {claims['jti']: claims['exp']}
+        )
+        event_type, data = bus.publish_event.call_args[0]
+        self.assertEqual(event_type, 'token.revoked')
+        self.assertEqual(data['jti'], claims['jti'])
+
+    def test_logout_requires_authentication(self):
+        """Тест выхода без токена"""
+        response = self.client.post('/api/auth/logout/')
+        self.assertEqual(response.status_code, 401)
@@ -4,4 +4,5 @@ from . import views
 urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('refresh/', views.refresh_token, name='refresh'),
+    path('logout/', views.logout_view, name='logout'),
 ]
\ No newline at end of file
@@ -1,9 +1,10 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from apps.users.services import revoke_access_token
 
 
 @api_view(['POST'])
@@ -22,6 +23,8 @@ def login_view(request):
 
     if user and user.is_active:
         refresh = RefreshToken.for_user(user)
+        # email в токене нужен сервисам, проверяющим токен локально без запроса профиля
+        refresh['email'] = user.email
         return Response({
             'access': str(refresh.access_token),
             'refresh': str(refresh),
@@ -57,4 +60,15 @@ def refresh_token(request):
         return Response(
             {'error': 'Invalid refresh token'},
             status=status.HTTP_401_UNAUTHORIZED
-        )
\ No newline at end of file
+        )
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout_view(request):
+    """Выход: access токен отзывается во всех сервисах, проверяющих токены локально"""
+    if not revoke_access_token(request.auth):
+        return Response(
+            {'error': 'Failed to revoke token'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    return Response({'message': 'Logged out'})
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import time
+import redis
+import logging
+from django.conf import settings
+from django.db import transaction
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Отозванные access токены: jti -> время истечения (общий с cart-service и order-service)
+REVOKED_TOKENS_KEY = 'revoked_tokens'
+
+
+class EventBus:
+    """Сервис для публикации событий"""
+
+    def __init__(self):
+        self.redis_client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            decode_responses=True
+        )
+
+    def publish_event(self, event_type: str, data: Dict[str, Any]):
+        """Публикация события"""
+
+        try:
+            event_data = {
+                'type': event_type,
+                'data': data,
+                'timestamp': time.time()
+            }
+
+            self.redis_client.publish('events', json.dumps(event_data, default=str))
+            logger.info(f"Published event: {event_type}")
+
+        except Exception as e:
+            logger.error(f"Failed to publish event {event_type}: {e}")
+
+    def publish_on_commit(self, event_type: str, data: Dict[str, Any]):
+        """Публикация после фиксации транзакции: откаченные изменения не попадают к подписчикам"""
+        transaction.on_commit(lambda: self.publish_event(event_type, data))
+
+event_bus = EventBus()
+
+
+def revoke_access_token(access_token) -> bool:
+    """Отзыв access токена: запись в общий список отозванных и событие token.revoked"""
+    jti = access_token['jti']
+    exp = int(access_token['exp'])
+    raw_token = access_token.token
+    if isinstance(raw_token, bytes):
+        raw_token = raw_token.decode()
+
+    try:
+        pipe = event_bus.redis_client.pipeline()
+        pipe.zadd(REVOKED_TOKENS_KEY, {jti: exp})
+        # Истекшие токены из списка убираем - они и так не пройдут проверку
+        pipe.zremrangebyscore(REVOKED_TOKENS_KEY, '-inf', int(time.time()))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Failed to revoke token {jti}: {e}")
+        return False
+
+    event_bus.publish_event('token.revoked', {
+        'user_id': access_token['user_id'],
+        'jti': jti,
+        'exp': exp,
+        'token_hash': hashlib.sha256(raw_token.encode()).hexdigest(),
+    })
+    return True
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import User, UserProfile
+from .services import event_bus
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Сервисы, кэширующие профиль по токену, сбрасывают его по user.updated"""
+    # Новому пользователю сбрасывать нечего, вход (last_login) профиль не меняет
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    event_bus.publish_on_commit('user.updated', {'user_id': instance.pk})
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, **kwargs):
+    event_bus.publish_on_commit('user.updated', {'user_id': instance.user_id})
@@ -1,6 +1,9 @@
+from unittest import mock
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from .models import UserProfile
+from .services import event_bus
 
 User = get_user_model()
 
@@ -64,3 +67,36 @@ class UserProfileModelTest(TestCase):
         """Тест строкового представления профиля"""
         self.assertEqual(str(self.profile), f"Profile of {self.user.email}")
 
+
+
+class UserUpdatedEventTest(TestCase):
+    """Тесты события user.updated"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            username='testuser',
+            password='testpass123'
+        )
+        patcher = mock.patch.object(event_bus, 'publish_event')
+        self.publish_event = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_published_after_any_user_change(self):
+        """Тест: изменение пользователя вне API профиля (админка, скрипты) тоже сбрасывает кэши"""
+        self.user.first_name = 'Changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.publish_event.assert_called_once_with('user.updated', {'user_id': self.user.pk})
+
+    def test_published_after_profile_change(self):
+        """Тест события при изменении профиля"""
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProfile.objects.create(user=self.user, phone='+1234567890')
+        self.publish_event.assert_called_once_with('user.updated', {'user_id': self.user.pk})
+
+    def test_not_published_on_login(self):
+        """Тест: обновление last_login при входе не сбрасывает кэши"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['last_login'])
+        self.publish_event.assert_not_called()
@@ -40,4 +40,4 @@ class ProfileUpdateView(generics.UpdateAPIView):
 
     def get_object(self):
         profile, created = UserProfile.objects.get_or_create(user=self.request.user)
-        return profile
\ No newline at end of file
+        return profile
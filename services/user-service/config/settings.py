@@ -95,14 +95,26 @@ REST_FRAMEWORK = {
 }
 
 # JWT Settings
+# Ключ подписи токенов; cart-service и order-service проверяют токены локально
+# тем же ключом (JWT_VERIFYING_KEYS), поэтому при ротации новый ключ сначала
+# добавляется в их JWT_VERIFYING_KEYS и только затем меняется здесь
+JWT_SIGNING_KEY = os.environ.get('JWT_SIGNING_KEY', SECRET_KEY)
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
+    'ALGORITHM': 'HS256',
+    'SIGNING_KEY': JWT_SIGNING_KEY,
 }
 
 AUTH_USER_MODEL = 'users.User'
 
+# Redis (события для других сервисов, список отозванных токенов)
+REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+REDIS_DB = 0
+
 # CORS Settings - Исправленные настройки
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -0,0 +1,58 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+import jwt
+from django.conf import settings
+
+
+def decode_access_token(token):
+    """
+    Локальная проверка access токена user-service (подпись, срок действия, тип).
+    Подпись проверяется всеми ключами из JWT_VERIFYING_KEYS - это позволяет ротацию ключа.
+    При ошибке выбрасывает jwt.InvalidTokenError.
+    """
+    for key in settings.JWT_VERIFYING_KEYS:
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=[settings.JWT_ALGORITHM],
+                leeway=settings.JWT_LEEWAY,
+                options={'require': ['exp', 'user_id']}
+            )
+            break
+        except jwt.InvalidSignatureError:
+            continue
+    else:
+        raise jwt.InvalidSignatureError('Signature verification failed')
+
+    if claims.get('token_type') != 'access':
+        raise jwt.InvalidTokenError('Token is not an access token')
+    return claims
+
+
+def decode_identity_header(value):
+    """
+    Проверка заголовка X-Identity от api-gateway: HMAC-SHA256 подпись и срок действия.
+    Шлюз уже проверил JWT, поэтому здесь достаточно сравнить подпись.
+    При ошибке выбрасывает jwt.InvalidTokenError.
+    """
+    try:
+        payload, signature = value.split('.')
+        signature = base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))
+    except ValueError as e:
+        raise jwt.DecodeError('Malformed identity header') from e
+
+    for key in settings.GATEWAY_IDENTITY_KEYS:
+        expected = hmac.new(key.encode(), payload.encode(), hashlib.sha256).digest()
+        if hmac.compare_digest(expected, signature):
+            break
+    else:
+        raise jwt.InvalidSignatureError('Identity signature verification failed')
+
+    claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    if claims['exp'] + settings.JWT_LEEWAY < time.time():
+        raise jwt.ExpiredSignatureError('Identity has expired')
+    return claims
@@ -0,0 +1,166 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+# Загрузка счетчика из БД: значение в БД + еще не записанная дельта
+LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local pending = tonumber(redis.call('GET', KEYS[2]) or '0')
+    redis.call('SET', KEYS[1], tonumber(ARGV[1]) + pending)
+    redis.call('SADD', KEYS[3], ARGV[2])
+end
+return redis.call('GET', KEYS[1])
+"""
+
+# Забрать накопленную дельту для записи в БД
+TAKE_PENDING_SCRIPT = """
+local pending = tonumber(redis.call('GET', KEYS[1]) or '0')
+if pending ~= 0 then
+    redis.call('DECRBY', KEYS[1], pending)
+end
+return pending
+"""
+
+# Сверка с БД после записи: счетчик = БД + дельта, накопленная во время записи
+RECONCILE_SCRIPT = """
+local pending = tonumber(redis.call('GET', KEYS[2]) or '0')
+redis.call('SET', KEYS[1], tonumber(ARGV[1]) + pending)
+return tonumber(ARGV[1]) + pending
+"""
+
+# Объект больше не горячий: счетчики удаляются, если дельта уже записана
+DROP_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= 0 then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('SREM', KEYS[3], ARGV[1])
+return 1
+"""
+
+
+class HotCounters:
+    """
+    Счетчики горячих объектов (поле is_hot) в Redis с пакетной записью в БД.
+    На объект два ключа: "{prefix}:{id}:{value_name}" - текущее значение, по которому
+    скрипт подкласса атомарно решает, разрешить ли операцию, и "{prefix}:{id}:pending" -
+    дельта, еще не записанная в БД. flush() забирает дельту, пишет ее через apply_delta
+    и сверяет счетчик с БД; снятые с is_hot объекты лишаются счетчиков.
+    """
+
+    prefix = None
+    value_name = None
+
+    def __init__(self):
+        self._scripts = {}
+
+    @property
+    def config(self):
+        raise NotImplementedError
+
+    @property
+    def redis(self):
+        raise NotImplementedError
+
+    @property
+    def dirty_key(self):
+        # Объекты с изменениями, еще не записанными в БД
+        return f"{self.prefix}:dirty"
+
+    @property
+    def loaded_key(self):
+        # Объекты, счетчики которых загружены в Redis
+        return f"{self.prefix}:loaded"
+
+    def script(self, source):
+        if source not in self._scripts:
+            self._scripts[source] = self.redis.register_script(source)
+        return self._scripts[source]
+
+    def is_enabled(self, obj):
+        return self.config.get('ENABLED', False) and obj.is_hot
+
+    def keys(self, obj_id):
+        return [f"{self.prefix}:{obj_id}:{self.value_name}", f"{self.prefix}:{obj_id}:pending"]
+
+    def db_value(self, obj):
+        """Значение счетчика по данным БД"""
+        raise NotImplementedError
+
+    def hot_ids(self):
+        """id объектов, помеченных горячими"""
+        raise NotImplementedError
+
+    def apply_delta(self, obj_id, delta):
+        """Запись дельты в БД (внутри транзакции); возвращает объект или None, если он удален"""
+        raise NotImplementedError
+
+    def load(self, obj):
+        keys = self.keys(obj.id) + [self.loaded_key]
+        return int(self.script(LOAD_SCRIPT)(keys=keys, args=[self.db_value(obj), obj.id]))
+
+    def run(self, source, obj, args):
+        """
+        Скрипт подкласса с KEYS: значение, дельта, dirty_key. Ответ -2 означает
+        "счетчик не загружен": счетчик загружается из БД и скрипт повторяется.
+        """
+        keys = self.keys(obj.id) + [self.dirty_key]
+        result = self.script(source)(keys=keys, args=args)
+        if result == -2:
+            self.load(obj)
+            result = self.script(source)(keys=keys, args=args)
+        return result
+
+    def flush(self):
+        """Запись накопленных изменений в БД и сверка счетчиков; возвращает число записанных объектов"""
+        # Снятые с is_hot объекты остаются в loaded_key, пока их счетчики не удалены
+        obj_ids = {int(obj_id) for obj_id in self.redis.sunion(self.dirty_key, self.loaded_key)}
+        if self.config.get('ENABLED', False):
+            obj_ids.update(self.hot_ids())
+
+        flushed = 0
+        for obj_id in sorted(obj_ids):
+            # Снимаем из множества до записи: изменения во время записи вернут объект в него
+            self.redis.srem(self.dirty_key, obj_id)
+            value_key, pending_key = self.keys(obj_id)
+            delta = int(self.script(TAKE_PENDING_SCRIPT)(keys=[pending_key]))
+            try:
+                with transaction.atomic():
+                    obj = self.apply_delta(obj_id, delta)
+            except Exception:
+                # Дельта возвращается, чтобы не потерять изменения
+                self.redis.incrby(pending_key, delta)
+                self.redis.sadd(self.dirty_key, obj_id)
+                raise
+            if delta:
+                flushed += 1
+
+            if obj is not None and self.is_enabled(obj):
+                self.script(RECONCILE_SCRIPT)(keys=[value_key, pending_key], args=[self.db_value(obj)])
+            else:
+                self.script(DROP_SCRIPT)(keys=[value_key, pending_key, self.loaded_key], args=[obj_id])
+        return flushed
+
+
+class FlushCommand(BaseCommand):
+    """Команда периодической записи счетчиков (counters) в БД"""
+
+    counters = None
+    message = 'Flushed {} objects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Повторять каждые N секунд (0 - один проход и выход)')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is None:
+            interval = self.counters.config['FLUSH_INTERVAL']
+        while True:
+            flushed = self.counters.flush()
+            if flushed:
+                self.stdout.write(self.message.format(flushed))
+
+            if not interval:
+                return
+            time.sleep(interval)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import threading
+import time
+import redis
+import logging
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Общий с user-service и другими сервисами список отозванных токенов: jti -> время истечения
+REVOKED_TOKENS_KEY = 'revoked_tokens'
+
+
+def token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class IdentityCache:
+    """
+    Кэш профилей пользователей по хэшу токена: локальный LRU процесса перед Redis.
+    Запись живет не дольше токена; сбрасывается событиями user.updated и token.revoked.
+    Также хранит локальную копию списка отозванных токенов для проверки без похода в Redis.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = OrderedDict()  # хэш токена -> (профиль, user_id, истекает)
+        self._revoked = {}  # jti -> время истечения токена
+        self._redis = None
+
+    @property
+    def config(self):
+        return settings.IDENTITY_CACHE
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                decode_responses=True
+            )
+        return self._redis
+
+    def get_ttl(self, claims):
+        """Время жизни записи: до истечения токена, но не больше MAX_TTL"""
+        return min(int(claims['exp'] - time.time()), self.config.get('MAX_TTL', 900))
+
+    def get_or_fetch(self, token, claims, fetch):
+        """Профиль из кэша; при промахе - fetch() с сохранением результата"""
+        key = token_hash(token)
+        profile = self._get_local(key)
+        if profile is not None:
+            return profile
+
+        try:
+            cached = self.redis.get(f"identity:{key}")
+        except redis.RedisError as e:
+            # Без Redis работает только локальный уровень
+            logger.warning(f"Identity cache unavailable: {e}")
+            cached = None
+        if cached is not None:
+            profile = json.loads(cached)
+            self._set_local(key, profile, claims)
+            return profile
+
+        profile = fetch()
+        if profile is not None:
+            self.set(key, profile, claims)
+        return profile
+
+    def set(self, key, profile, claims):
+        ttl = self.get_ttl(claims)
+        if ttl <= 0:
+            return
+        user_id = int(claims['user_id'])
+        self._set_local(key, profile, claims)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(f"identity:{key}", json.dumps(profile), ex=ttl)
+            # Индекс токенов пользователя - для сброса по user.updated
+            pipe.sadd(f"identity:user:{user_id}", key)
+            pipe.expire(f"identity:user:{user_id}", self.config.get('MAX_TTL', 900))
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to store identity for user {user_id}: {e}")
+
+    def _get_local(self, key):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            profile, _, expires_at = item
+            if time.time() >= expires_at:
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return profile
+
+    def _set_local(self, key, profile, claims):
+        ttl = min(self.get_ttl(claims), self.config.get('LOCAL_TTL', 60))
+        with self._lock:
+            self._local[key] = (profile, int(claims['user_id']), time.time() + ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self.config.get('LOCAL_MAX_ENTRIES', 10000):
+                self._local.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        """Сброс всех профилей пользователя (локально и в Redis)"""
+        user_id = int(user_id)
+        with self._lock:
+            for key in [key for key, item in self._local.items() if item[1] == user_id]:
+                del self._local[key]
+        try:
+            keys = self.redis.smembers(f"identity:user:{user_id}")
+            self.redis.delete(f"identity:user:{user_id}", *[f"identity:{key}" for key in keys])
+        except redis.RedisError as e:
+            logger.warning(f"Failed to invalidate identity for user {user_id}: {e}")
+
+    def invalidate_token(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+        try:
+            self.redis.delete(f"identity:{key}")
+        except redis.RedisError as e:
+            logger.warning(f"Failed to invalidate identity: {e}")
+
+    def revoke(self, jti, exp):
+        with self._lock:
+            now = time.time()
+            for expired in [jti for jti, expires in self._revoked.items() if expires <= now]:
+                del self._revoked[expired]
+            self._revoked[jti] = exp
+
+    def is_revoked(self, jti):
+        return jti is not None and jti in self._revoked
+
+    def load_revoked(self):
+        """Загрузка списка отозванных токенов из Redis (при старте и переподключении слушателя)"""
+        try:
+            revoked = self.redis.zrangebyscore(REVOKED_TOKENS_KEY, int(time.time()), '+inf', withscores=True)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to load revoked tokens: {e}")
+            return
+        for jti, exp in revoked:
+            self.revoke(jti, exp)
+
+    def clear_local(self):
+        """Сброс локального уровня (пропущенные без подписки события неизвестны)"""
+        with self._lock:
+            self._local.clear()
+
+    def handle_event(self, event_type, data):
+        """Обработка событий user-service; возвращает True, если событие относится к кэшу"""
+        if event_type == 'user.updated':
+            self.invalidate_user(data['user_id'])
+            return True
+        if event_type == 'token.revoked':
+            self.revoke(data['jti'], data['exp'])
+            if data.get('token_hash'):
+                self.invalidate_token(data['token_hash'])
+            return True
+        return False
+
+
+identity_cache = IdentityCache()
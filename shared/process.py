@@ -0,0 +1,16 @@
+import os
+import sys
+
+
+def is_server_process(argv=None):
+    """
+    Процесс обслуживает запросы: сервер приложений (gunicorn, uvicorn) или рабочий процесс
+    runserver. Остальные команды manage.py (migrate, test, фоновые задачи) и следящий
+    процесс автоперезагрузки runserver фоновые слушатели не запускают.
+    """
+    argv = sys.argv if argv is None else argv
+    if not argv or os.path.basename(argv[0]) != 'manage.py':
+        return True
+    if len(argv) < 2 or argv[1] != 'runserver':
+        return False
+    return '--noreload' in argv or os.environ.get('RUN_MAIN') == 'true'